@@ -0,0 +1,72 @@
+import random
+import string
+import sys
+import timeit
+
+from utils.memo import Memo
+
+# Run from the root of the repository with: python -m benchmarks.memo_lookup [sizes...]
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 300_000]
+AGENTS = ["agent-a", "agent-b", "agent-c"]
+LOOKUPS = 2_000
+
+
+def randomName(rng:random.Random) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=12))
+
+
+def buildMemo(size:int, rng:random.Random) -> list[str]:
+    memo = Memo.getDefaultMemo()
+    names = [randomName(rng) for _ in range(size)]
+    for id, name in enumerate(names):
+        memo["known_names"].append(name)
+        memo["known_osm_ids"].append(id)
+        memo["map_name"][name] = {"id": id, "confidence": 1.0}
+        memo["locations"][f"{id}"] = {"latitude": "0", "longitude": "0", "display_name": name}
+    for agent in AGENTS:
+        for name in [randomName(rng) for _ in range(size // 10)]:
+            memo["unknown"].setdefault(agent, []).append(name)
+    Memo.index(memo)
+    return names
+
+
+def bench(size:int) -> dict[str, float]:
+    rng = random.Random(size)
+    names = buildMemo(size, rng)
+    hits = rng.sample(names, min(LOOKUPS, len(names)))
+    misses = [randomName(rng) for _ in range(LOOKUPS)]
+    unknown = list(Memo.unknown)[-LOOKUPS:]
+
+    def search():
+        for name in hits:
+            Memo.search(name)
+        for name in misses:
+            Memo.search(name)
+
+    def is_unknown():
+        for name in unknown:
+            Memo.isUnknown(name)
+        for name in misses:
+            Memo.isUnknown(name)
+
+    def add_known():
+        for name in misses:
+            Memo.addKnown(name, size + 1)
+
+    calls = len(hits) + len(misses)
+    return {
+        "search": min(timeit.repeat(search, number=1, repeat=5)) / calls,
+        "isUnknown": min(timeit.repeat(is_unknown, number=1, repeat=5)) / (len(unknown) + len(misses)),
+        "addKnown": timeit.timeit(add_known, number=1) / len(misses),
+    }
+
+
+def main(sizes:list[int]):
+    print(f"{'size':>10} {'search (us)':>14} {'isUnknown (us)':>16} {'addKnown (us)':>15}")
+    for size in sizes:
+        result = bench(size)
+        print(f"{size:>10} {result['search'] * 1e6:>14.3f} {result['isUnknown'] * 1e6:>16.3f} {result['addKnown'] * 1e6:>15.3f}")
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,68 @@
+import argparse
+import os
+import random
+import tempfile
+import timeit
+
+from benchmarks.memo_lookup import buildMemo
+from benchmarks.synthetic import generate
+from utils.config import Config
+from utils.memo import Memo
+
+# Micro benchmarks for Memo persistence (memo.json and the binary snapshot) and Correcter. Memo lookups are covered by benchmarks.memo_lookup
+# Run from the root of the repository with: python -m benchmarks.micro [--sizes 10000 100000] [--autocorrect]
+
+
+def benchPersistence(size:int, backend:str) -> dict[str, float]:
+    rng = random.Random(size)
+    buildMemo(size, rng)
+    Config.memo_backend = backend
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            # the first binary save encodes every record, later ones copy the records load() left undecoded
+            Memo.save()
+            Memo.load()
+            save = min(timeit.repeat(Memo.save, number=1, repeat=3))
+            load = min(timeit.repeat(Memo.load, number=1, repeat=3))
+            size_bytes = os.path.getsize(Memo.snapshotLoc())
+        finally:
+            os.chdir(cwd)
+    return {"save": save, "load": load, "bytes": size_bytes}
+
+
+def benchCorrecter(strings:int) -> dict[str, float]:
+    from utils.autocorrect import Correcter
+    answers = [answer.lower() for answer in generate(strings, strings // 4, typo_rate=0.2)]
+    Correcter.load()
+    quick = timeit.timeit(lambda: [Correcter.quick_correct(answer) for answer in answers], number=1)
+    slow = timeit.timeit(lambda: [Correcter.slow_correct(answer) for answer in answers], number=1)
+    cached = timeit.timeit(lambda: [Correcter.slow_correct(answer) for answer in answers], number=1)
+    return {"quick": quick / len(answers), "slow": slow / len(answers), "cached": cached / len(answers)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro benchmarks for Memo.save/load and Correcter")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--backends", nargs="+", default=["json", "binary"], choices=["json", "binary"])
+    parser.add_argument("--autocorrect", action="store_true", help="also benchmark Correcter, which needs the autocorrect package")
+    parser.add_argument("--strings", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'size':>10} {'backend':>8} {'save (s)':>10} {'load (s)':>10} {'file (MB)':>10}")
+    for size in args.sizes:
+        for backend in args.backends:
+            result = benchPersistence(size, backend)
+            print(f"{size:>10} {backend:>8} {result['save']:>10.3f} {result['load']:>10.3f} {result['bytes'] / 2**20:>10.1f}")
+
+    if args.autocorrect:
+        result = benchCorrecter(args.strings)
+        print(f"\nCorrecter over {args.strings} strings (us per string)")
+        print(f"\tquick_correct:         {result['quick'] * 1e6:.1f}")
+        print(f"\tslow_correct:          {result['slow'] * 1e6:.1f}")
+        print(f"\tslow_correct (cached): {result['cached'] * 1e6:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# A local stand-in for Nominatim's /search endpoint. Point config.json at it with
+#   "geocode_domain": "127.0.0.1:8080", "geocode_scheme": "http"
+# Run from the root of the repository with: python -m benchmarks.mock_nominatim [--port 8080] [--latency 0.05] [--miss-rate 0.1] [--rate-limit 50]
+MISS_WORDS = ("nowhere", "unknown", "not sure")
+
+
+def isMiss(query:str, miss_rate:float) -> bool:
+    if query == "" or any(word in query for word in MISS_WORDS):
+        return True
+    # misses are decided by the query itself so the same query always gets the same answer
+    return zlib.crc32(query.encode(), 1) % 10000 < miss_rate * 10000
+
+
+def place(query:str, miss_rate:float=0.0) -> dict | None:
+    query = " ".join(query.lower().split())
+    if isMiss(query, miss_rate):
+        return None
+    osm_id = zlib.crc32(query.encode())
+    parts = [part.strip() for part in query.split(",")]
+    return {
+        "place_id": osm_id,
+        "licence": "Data © OpenStreetMap contributors, ODbL 1.0. https://osm.org/copyright",
+        "osm_type": "relation",
+        "osm_id": osm_id,
+        "lat": f"{(osm_id % 18000) / 100 - 90:.7f}",
+        "lon": f"{(osm_id // 18000 % 36000) / 100 - 180:.7f}",
+        "display_name": ", ".join(part.title() for part in parts),
+        "class": "boundary",
+        "type": "administrative",
+        "place_rank": 16,
+        "importance": 0.5,
+        "boundingbox": ["0", "0", "0", "0"],
+        "address": {
+            "city": parts[0].title(),
+            "county": f"{parts[0].title()} County",
+            "state": parts[1].title() if len(parts) > 1 else "NA",
+            "country": parts[-1].title() if len(parts) > 2 else "United States",
+            "postcode": f"{osm_id % 100000:05d}",
+        },
+    }
+
+
+class MockNominatimServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency:float, miss_rate:float, rate_limit:float) -> None:
+        super().__init__(address, MockNominatimHandler)
+        self.latency = latency
+        self.miss_rate = miss_rate
+        self.rate_limit = rate_limit
+        self.requests = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+        self.tokens = rate_limit
+        self.refilled = time.monotonic()
+
+    def admit(self) -> bool:
+        # a token bucket holding one second of requests, the same shape of limit a real server applies
+        with self.lock:
+            self.requests += 1
+            if self.rate_limit <= 0:
+                return True
+            now = time.monotonic()
+            self.tokens = min(self.rate_limit, self.tokens + (now - self.refilled) * self.rate_limit)
+            self.refilled = now
+            if self.tokens < 1:
+                self.throttled += 1
+                return False
+            self.tokens -= 1
+            return True
+
+
+class MockNominatimHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/search":
+            self.send_error(404)
+            return
+        if not self.server.admit():
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.server.latency > 0:
+            time.sleep(self.server.latency)
+        query = parse_qs(url.query).get("q", [""])[0]
+        result = place(query, self.server.miss_rate)
+        body = json.dumps([] if result is None else [result]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", f"{len(body)}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockNominatim:
+    def __init__(self, port:int=0, latency:float=0.0, miss_rate:float=0.0, rate_limit:float=0) -> None:
+        self.server = MockNominatimServer(("127.0.0.1", port), latency, miss_rate, rate_limit)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def domain(self) -> str:
+        host, port = self.server.server_address
+        return f"{host}:{port}"
+
+    @property
+    def requests(self) -> int:
+        return self.server.requests
+
+    @property
+    def throttled(self) -> int:
+        return self.server.throttled
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for Nominatim's /search endpoint")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before answering each request")
+    parser.add_argument("--miss-rate", type=float, default=0.0, help="fraction of queries that return no result")
+    parser.add_argument("--rate-limit", type=float, default=0, help="requests per second before answering 429, 0 for no limit")
+    args = parser.parse_args()
+    with MockNominatim(args.port, args.latency, args.miss_rate, args.rate_limit) as mock:
+        print(f"Mock Nominatim listening on http://{mock.domain}/search")
+        threading.Event().wait()
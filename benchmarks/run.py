@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import resource
+import tempfile
+import time
+
+from benchmarks.mock_nominatim import MockNominatim
+from benchmarks.synthetic import generate, writeCSV
+
+# End to end benchmark of Locator.run() against a local mock Nominatim on a synthetic survey
+# Run from the root of the repository with: python -m benchmarks.run [--rows 5000] [--distinct 500] [--runs 2] [--config '{"deduplicate": true}']
+
+
+class Timer:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.seconds = 0.0
+
+    def wrap(self, owner, name:str):
+        # time every call of a static method for the report, the behaviour is unchanged
+        function = getattr(owner, name)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - start
+                self.calls += 1
+        setattr(owner, name, staticmethod(timed))
+
+
+def peakRSS() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Locator.run() end to end against a local mock Nominatim")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--distinct", type=int, default=500)
+    parser.add_argument("--typo-rate", type=float, default=0.05)
+    parser.add_argument("--missing-rate", type=float, default=0.01)
+    parser.add_argument("--latency", type=float, default=0.0, help="mock server latency per request in seconds")
+    parser.add_argument("--miss-rate", type=float, default=0.02, help="fraction of queries the mock server can't find")
+    parser.add_argument("--rate-limit", type=float, default=0, help="mock server requests per second, 0 for no limit")
+    parser.add_argument("--min-delay", type=float, default=0, help="geocode_min_delay used by the geocoder")
+    parser.add_argument("--runs", type=int, default=2, help="the first run starts from an empty memo, later runs reuse it")
+    parser.add_argument("--config", default="{}", help="JSON object of extra config.json keys, e.g. '{\"use_autocorrect\": true}'")
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory, MockNominatim(latency=args.latency, miss_rate=args.miss_rate, rate_limit=args.rate_limit) as mock:
+        answers = generate(args.rows, args.distinct, args.typo_rate, args.missing_rate)
+        writeCSV(os.path.join(directory, "survey.csv"), answers)
+        config = {
+            "file_loc": "survey.csv",
+            "save_loc": "geocoded.csv",
+            "location_col_name": "location",
+            "geocode_col_name": "geocode",
+            "use_memo": True,
+            "use_autocorrect": False,
+            "user_agents": ["survey-geocoder-benchmark"],
+            "memo_save_counter": 100,
+            "geocode_timeout": 15,
+            "geocode_domain": mock.domain,
+            "geocode_scheme": "http",
+            "geocode_min_delay": args.min_delay,
+        }
+        config.update(json.loads(args.config))
+        with open(os.path.join(directory, "config.json"), 'w') as config_file:
+            json.dump(config, config_file)
+
+        os.chdir(directory)
+        try:
+            from utils.autocorrect import Correcter
+            from utils.locator import Locator
+            from utils.memo import Memo
+            from utils.sqlite_memo import SQLiteMemo
+            autocorrect_timer, save_timer = Timer(), Timer()
+            autocorrect_timer.wrap(Correcter, "quick_correct")
+            autocorrect_timer.wrap(Correcter, "slow_correct")
+            save_timer.wrap(Memo, "save")
+            save_timer.wrap(SQLiteMemo, "save")
+
+            print(f"{len(answers)} rows, {len(set(answers))} distinct answers, config: {json.dumps(json.loads(args.config))}")
+            for run in range(1, args.runs + 1):
+                autocorrect_timer.__init__()
+                save_timer.__init__()
+                requests = mock.requests
+
+                start = time.perf_counter()
+                locator = Locator()
+                locator.run()
+                elapsed = time.perf_counter() - start
+
+                total = locator._getTotalCount()
+                print(f"run {run}:")
+                print(f"\trows/sec:          {len(answers) / elapsed:.1f} ({elapsed:.2f}s)")
+                print(f"\tmemo hit ratio:    {locator.memolocated / total if total else 0:.3f} ({locator.memolocated}/{total} lookups)")
+                print(f"\tgeocode requests:  {mock.requests - requests} ({mock.throttled} throttled in total)")
+                print(f"\tautocorrect time:  {autocorrect_timer.seconds:.3f}s over {autocorrect_timer.calls} calls")
+                print(f"\tmemo save time:    {save_timer.seconds:.3f}s over {save_timer.calls} saves")
+                print(f"\tpeak RSS:          {peakRSS():.1f} MB")
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import csv
+import random
+
+# Generates survey-like CSVs: a long tail of distinct places, a few very common answers and a share of typos
+# Run from the root of the repository with: python -m benchmarks.synthetic survey.csv [--rows 10000] [--distinct 1000] [--typo-rate 0.05]
+SYLLABLES = ["ak", "ber", "bur", "can", "ches", "co", "dal", "day", "el", "field", "ford", "gin", "ham", "lan", "lum", "mont", "na", "port", "ril", "ston", "ter", "ton", "ville", "wood"]
+STATES = ["oh", "ohio", "ny", "new york", "ca", "california", "tx", "texas", "pa", "pennsylvania", "mi", "michigan", "in", "indiana", "ky", "kentucky"]
+MISSING = ["unknown", "nowhere", "not sure"]
+
+
+def placeName(rng:random.Random) -> str:
+    city = "".join(rng.choices(SYLLABLES, k=rng.randint(2, 3)))
+    if rng.random() < 0.7:
+        return f"{city}, {rng.choice(STATES)}"
+    return city
+
+
+def typo(name:str, rng:random.Random) -> str:
+    positions = [i for i, char in enumerate(name) if char.isalpha()]
+    if len(positions) < 2:
+        return name
+    i = rng.choice(positions[:-1])
+    edit = rng.choice(("delete", "insert", "substitute", "transpose"))
+    if edit == "delete":
+        return name[:i] + name[i + 1:]
+    if edit == "insert":
+        return name[:i] + rng.choice("abcdefghijklmnopqrstuvwxyz") + name[i:]
+    if edit == "substitute":
+        return name[:i] + rng.choice("abcdefghijklmnopqrstuvwxyz") + name[i + 1:]
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+
+def variant(name:str, rng:random.Random) -> str:
+    # the same answer typed differently: capitalization and stray whitespace
+    if rng.random() < 0.5:
+        name = name.title()
+    if rng.random() < 0.2:
+        name = f" {name} "
+    return name
+
+
+def generate(rows:int, distinct:int, typo_rate:float=0.05, missing_rate:float=0.01, seed:int=0) -> list[str]:
+    rng = random.Random(seed)
+    places = list(dict.fromkeys(placeName(rng) for _ in range(distinct * 2)))[:distinct]
+    # answers follow a Zipf-like distribution so a handful of places make up most of the rows
+    weights = [1 / (rank + 1) for rank in range(len(places))]
+    answers = []
+    for place in rng.choices(places, weights=weights, k=rows):
+        roll = rng.random()
+        if roll < missing_rate:
+            answers.append(rng.choice(MISSING))
+        elif roll < missing_rate + typo_rate:
+            answers.append(typo(place, rng))
+        else:
+            answers.append(variant(place, rng))
+    return answers
+
+
+def writeCSV(path:str, answers:list[str], column:str="location"):
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["response_id", column])
+        for id, answer in enumerate(answers):
+            writer.writerow([id, answer])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic survey CSV")
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--distinct", type=int, default=1000)
+    parser.add_argument("--typo-rate", type=float, default=0.05)
+    parser.add_argument("--missing-rate", type=float, default=0.01)
+    parser.add_argument("--column", default="location")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    answers = generate(args.rows, args.distinct, args.typo_rate, args.missing_rate, args.seed)
+    writeCSV(args.path, answers, args.column)
+    print(f"Wrote {len(answers)} rows with {len(set(answers))} distinct answers to {args.path}")
@@ -1,10 +1,7 @@
-from datetime import datetime as dt
 import logging
+from utils.config import Config
 from utils.locator import Locator
-
-logfile = f"logs/{dt.now().strftime('%Y-%m-%d_%H-%M-%S')}.log"
-logging.basicConfig(filename=logfile, encoding='utf-8', level=logging.DEBUG, filemode='w', format='%(levelname)s:%(asctime)s:[%(module)s] %(message)s')
-logging.info("Log started")
+from utils.logs import Logs
 
 
 class Driver:
@@ -14,4 +11,15 @@ class Driver:
     def run(self):
         self.locator.run()
 
-Driver().run()
+
+def main():
+    Logs.bootstrap()
+    Config.load()
+    Logs.setup()
+    logging.info("Log started")
+    Driver().run()
+    Logs.close()
+
+
+if __name__ == "__main__":
+    main()
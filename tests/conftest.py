@@ -0,0 +1,77 @@
+import copy
+
+import pandas as pd
+import pytest
+
+from benchmarks.mock_nominatim import MockNominatim
+from utils.autocorrect import Correcter
+from utils.config import Config
+from utils.fuzzy import FuzzyMatcher
+from utils.gazetteer import Gazetteer
+from utils.memo import Memo
+from utils.metrics import Metrics
+from utils.response_cache import ResponseCache
+from utils.scheduler import Scheduler
+from utils.sqlite_memo import SQLiteMemo
+
+# every class that keeps its state on the class, put back to how it was imported after each test
+STATEFUL = (Config, Memo, SQLiteMemo, FuzzyMatcher, Gazetteer, ResponseCache, Metrics, Scheduler, Correcter)
+
+
+def classState(cls) -> dict:
+    return {name: value for name, value in vars(cls).items() if not name.startswith("__") and not isinstance(value, (staticmethod, classmethod))}
+
+
+DEFAULTS = {cls: {name: copy.copy(value) for name, value in classState(cls).items()} for cls in STATEFUL}
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    # each test runs in its own directory so memo.json, journals and outputs never leak between tests
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    Memo.close()
+    SQLiteMemo.close()
+    Correcter.close()
+    ResponseCache.close()
+    for cls, state in DEFAULTS.items():
+        for name, value in state.items():
+            # containers are copied again so a test that mutates one in place leaves the default alone
+            setattr(cls, name, copy.copy(value))
+
+
+@pytest.fixture
+def mock():
+    with MockNominatim() as server:
+        yield server
+
+
+@pytest.fixture
+def config(mock):
+    # the keys a config.json has to set, pointed at the mock server, with any overrides a test needs
+    def make(**overrides) -> dict:
+        return {
+            "file_loc": "survey.csv",
+            "save_loc": "geocoded.csv",
+            "location_col_name": "location",
+            "geocode_col_name": "geocode",
+            "use_memo": True,
+            "use_autocorrect": False,
+            "user_agents": ["survey-geocoder-test"],
+            "memo_save_counter": 100,
+            "geocode_timeout": 5,
+            "geocode_domain": mock.domain,
+            "geocode_scheme": "http",
+            "geocode_min_delay": 0,
+            "geocode_max_retries": 0,
+            **overrides,
+        }
+    return make
+
+
+def writeSurvey(locations:list[str], path:str="survey.csv"):
+    pd.DataFrame({"location": locations}).to_csv(path, index=False)
+
+
+def readOutput(path:str="geocoded.csv") -> pd.DataFrame:
+    return pd.read_csv(path, index_col=0, dtype=str, keep_default_na=False)
@@ -0,0 +1,34 @@
+import time
+
+from benchmarks.mock_nominatim import MockNominatim
+from utils.locator import Locator
+
+LOCATIONS = [f"town{number}, ohio" for number in range(10)]
+
+
+def test_prefetch_sends_each_location_once(config, mock):
+    locator = Locator(config(use_async=True))
+    results = locator.locateMany(LOCATIONS + LOCATIONS[:3] + ["nowhere"])
+    assert (results["latitude"] != "?").sum() == 13
+    # every row after the prefetch reads its result instead of sending a request of its own
+    assert mock.requests == len(LOCATIONS) + 1
+    assert locator.geolocated == len(LOCATIONS)
+
+
+def test_prefetch_keeps_requests_in_flight(config):
+    with MockNominatim(latency=0.2) as slow:
+        locator = Locator(config(use_async=True, async_concurrency=10, geocode_domain=slow.domain))
+        start = time.perf_counter()
+        results = locator.locateMany(LOCATIONS)
+        elapsed = time.perf_counter() - start
+    assert (results["latitude"] != "?").all()
+    # ten requests one after another would take two seconds
+    assert elapsed < 1.5
+
+
+def test_prefetch_skips_what_the_memo_knows(config, mock):
+    locator = Locator(config(use_async=True))
+    locator.locateMany(LOCATIONS[:5])
+    requests = mock.requests
+    locator.locateMany(LOCATIONS)
+    assert mock.requests == requests + 5
@@ -0,0 +1,44 @@
+import asyncio
+
+import pandas as pd
+
+from utils.async_geocoder import AsyncGeocoder
+from utils.locator import Locator
+from utils.memo import Memo
+
+
+def test_results_keep_the_shape_and_index_of_the_batch(config):
+    locator = Locator(config())
+    listed = locator.locateMany(["Columbus, OH", "nowhere"])
+    assert listed.index.tolist() == [0, 1]
+    assert listed["location"].tolist() == ["columbus, oh", "nowhere"]
+    assert listed["latitude"].tolist()[1] == "?"
+
+    frame = pd.DataFrame({"hometown": ["Dayton, OH", "Akron, OH"], "age": [30, 40]}, index=["r1", "r2"])
+    results = locator.locateMany(frame, column="hometown")
+    assert results.index.tolist() == ["r1", "r2"]
+    assert results.columns[0] == "hometown"
+    assert (results["latitude"] != "?").all()
+
+    series = locator.locateMany(pd.Series(["Toledo, OH"], index=[7], name="city"))
+    assert series.index.tolist() == [7] and series.columns[0] == "city"
+    locator.close()
+
+
+def test_async_batches_can_be_run_from_a_coroutine(config, mock):
+    locator = Locator(config(use_async=True))
+    async def application():
+        return locator.locateMany(["columbus, oh", "dayton, oh"])
+    results = asyncio.run(application())
+    assert (results["latitude"] != "?").all()
+    assert mock.requests == 2
+    locator.close()
+
+
+def test_a_display_name_already_found_is_prefetched_without_a_request(config, mock):
+    Locator(config(use_async=True, async_concurrency=1))
+    # the mock names "columbus,ohio" Columbus, Ohio, so the second spelling is that result's display name
+    results = AsyncGeocoder("survey-geocoder-test", Memo).prefetch(["columbus,ohio", "columbus, ohio"])
+    assert mock.requests == 1
+    assert results["columbus, ohio"]["osm_id"] == results["columbus,ohio"]["osm_id"]
+    assert results["columbus, ohio"] is not results["columbus,ohio"]
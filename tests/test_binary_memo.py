@@ -0,0 +1,75 @@
+import os
+
+from utils.config import Config
+from utils.memo import BINARY_LOC, Memo
+
+LOCATION = {"lat": "39.96", "lon": "-83.00", "display_name": "Columbus, Ohio", "address": {"city": "Columbus", "state": "Ohio"}}
+
+
+def loadMemo(backend:str):
+    Config.load({"use_memo": True, "memo_backend": backend})
+    Memo.load()
+
+
+def test_binary_snapshot_is_read_from_memo_json_once_then_loaded_lazily():
+    loadMemo("json")
+    Memo.add("columbus oh", 18, dict(LOCATION), 0.9)
+    Memo.add("dayton oh", 7, {**LOCATION, "display_name": "Dayton, Ohio"}, 0.9)
+    Memo.addUnknown("agent-a", "nowhere")
+    Memo.save()
+
+    loadMemo("binary")
+    assert Memo.search("columbus oh")["city"] == "Columbus"
+    Memo.save()
+    assert os.path.exists(BINARY_LOC)
+    # memo.json is left as it was
+    os.remove("memo.json")
+
+    loadMemo("binary")
+    assert Memo.stored is not None and len(Memo.stored) == 2
+    assert Memo.locations == {}
+    assert Memo.search("dayton oh")["display_name"] == "Dayton, Ohio"
+    assert list(Memo.locations) == ["7"]
+    assert Memo.isUnknown("nowhere", "agent-a")
+
+    # records that were never decoded are carried over as they are
+    Memo.add("akron oh", 3, {**LOCATION, "display_name": "Akron, Ohio"}, 0.9)
+    Memo.removeLocation(18)
+    Memo.save()
+    loadMemo("binary")
+    assert list(Memo.stored.ids) == [3, 7]
+    assert Memo.search("akron oh")["display_name"] == "Akron, Ohio"
+    assert Memo.search("columbus oh", 18) is None
+
+
+def test_a_damaged_binary_snapshot_falls_back_to_memo_json():
+    loadMemo("json")
+    Memo.add("columbus oh", 18, dict(LOCATION), 0.9)
+    Memo.save()
+    with open(BINARY_LOC, 'wb') as memo_file:
+        memo_file.write(b"not a memo")
+    loadMemo("binary")
+    assert Memo.stored is None
+    assert Memo.search("columbus oh") is not None
+
+
+def test_each_load_keeps_the_last_two_snapshots_as_backups():
+    loadMemo("binary")
+    Memo.add("columbus oh", 18, dict(LOCATION), 0.9)
+    Memo.save()
+    with open(BINARY_LOC, 'rb') as memo_file:
+        first = memo_file.read()
+    loadMemo("binary")
+    Memo.add("dayton oh", 7, {**LOCATION, "display_name": "Dayton, Ohio"}, 0.9)
+    Memo.save()
+    loadMemo("binary")
+
+    with open(f"{BINARY_LOC}.bak", 'rb') as backup_file:
+        assert backup_file.read() != first
+    with open(f"{BINARY_LOC}.bak.bak", 'rb') as backup_file:
+        assert backup_file.read() == first
+    # the backup is a link to, or copy of, the snapshot it was taken from, not rewritten by the next save
+    Memo.add("akron oh", 3, {**LOCATION, "display_name": "Akron, Ohio"}, 0.9)
+    Memo.save()
+    with open(f"{BINARY_LOC}.bak", 'rb') as backup_file, open(BINARY_LOC, 'rb') as memo_file:
+        assert backup_file.read() != memo_file.read()
@@ -0,0 +1,33 @@
+from utils.canonical import canonicalize
+from utils.locator import Locator
+from utils.memo import Memo
+from tests.conftest import writeSurvey, readOutput
+
+
+def test_spellings_of_the_same_place_share_a_key():
+    assert canonicalize("Columbus, OH") == canonicalize("columbus ohio usa") == canonicalize("COLUMBUS,  Ohio, U.S.A.") == "columbus, ohio"
+    assert canonicalize("São Paulo") == canonicalize("sao paulo")
+    assert canonicalize("St. Louis, MO") == canonicalize("st louis missouri")
+    # word order within a part doesn't matter, the order of the parts does
+    assert canonicalize("Lake Salt City, UT") == canonicalize("Salt Lake City, Utah")
+    assert canonicalize("Kansas City, Missouri") != canonicalize("Missouri City, Kansas")
+
+
+def test_places_named_like_a_region_keep_their_name():
+    # the first word always stays with the place, and a part that is only an abbreviation is the place when it comes first
+    assert canonicalize("New York") == "new york"
+    assert canonicalize("La Crosse, WI") == "crosse la, wisconsin"
+    assert canonicalize("OR") == "or"
+    assert canonicalize("Georgia, US") == "georgia, states united"
+    assert canonicalize(" ,; ") == ""
+
+
+def test_a_known_spelling_answers_the_others(config, mock):
+    writeSurvey(["Columbus, OH", "columbus ohio usa", "Kansas City, Missouri", "Missouri City, Kansas"])
+    Locator(config(canonicalize=True)).run()
+    # "columbus ohio usa" is answered by the memo entry of "columbus, oh" instead of the server
+    assert mock.requests == 3
+    results = readOutput()
+    assert results["latitude"].iloc[0] == results["latitude"].iloc[1] != "?"
+    assert results["latitude"].iloc[2] != results["latitude"].iloc[3]
+    assert Memo.getMapID("columbus ohio usa") == Memo.getMapID("columbus, oh")
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from tests.conftest import readOutput, writeSurvey
+from utils.locator import Locator
+
+LOCATIONS = [f"town{number}, ohio" for number in range(10)]
+
+
+def test_chunks_are_numbered_like_the_input(config):
+    writeSurvey(LOCATIONS)
+    Locator(config(chunk_size=3)).run()
+    output = readOutput()
+    assert output.index.tolist() == [f"{row}" for row in range(10)]
+    assert output["location"].tolist() == LOCATIONS
+
+
+def test_resume_after_an_interrupted_chunk(config, monkeypatch):
+    writeSurvey(LOCATIONS)
+    save = Locator._saveCheckpoint
+    def interrupted(self, chunks, rows):
+        # the third chunk is written to the output but the run stops before it is checkpointed
+        if chunks == 3:
+            raise KeyboardInterrupt
+        save(self, chunks, rows)
+    monkeypatch.setattr(Locator, "_saveCheckpoint", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        Locator(config(chunk_size=3)).run()
+    with open("geocoded.csv.checkpoint") as checkpoint_file:
+        assert json.load(checkpoint_file)["rows"] == 6
+
+    monkeypatch.setattr(Locator, "_saveCheckpoint", save)
+    Locator(config(chunk_size=3)).run()
+    output = readOutput()
+    assert output.index.tolist() == [f"{row}" for row in range(10)]
+    assert output["location"].tolist() == LOCATIONS
+    assert (output["latitude"] != "?").all()
+
+
+def test_checkpoint_without_output_starts_over(config, isolated):
+    writeSurvey(LOCATIONS)
+    with open("geocoded.csv.checkpoint", 'w') as checkpoint_file:
+        json.dump({"file_loc": "survey.csv", "chunk_size": 3, "chunks": 2, "rows": 6, "output_size": 500}, checkpoint_file)
+    Locator(config(chunk_size=3)).run()
+    assert readOutput()["location"].tolist() == LOCATIONS
+    assert not (isolated / "geocoded.csv.checkpoint").exists()
@@ -0,0 +1,39 @@
+import json
+
+from utils.autocorrect import Correcter, LRUCache
+from utils.config import Config
+
+
+class NoSpeller:
+    def autocorrect_word(self, word:str) -> str:
+        raise AssertionError(f"{word} should have been answered from the cache")
+
+
+def test_lru_cache_evicts_the_least_recently_used_entry():
+    cache = LRUCache(2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"
+    # "b" is now the least recently used entry
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+    assert cache.stats() == {"size": 2, "hits": 3, "misses": 1, "hit_rate": 0.75}
+
+
+def test_persisted_corrections_are_reused_by_the_next_run():
+    Config.load({"persist_corrections": True, "correction_cache_loc": "corrections.json"})
+    Correcter.load()
+    corrected = Correcter.quick_correct("colombus, ohoi")
+    Correcter.save()
+    with open("corrections.json", 'r') as cache_file:
+        saved = json.load(cache_file)
+    assert saved["quick"]["strings"] == {"colombus, ohoi": corrected}
+    assert set(saved["quick"]["tokens"]) == {"colombus", "ohoi"}
+
+    Correcter.load()
+    Correcter._quick_spell = NoSpeller()
+    assert Correcter.quick_correct("colombus, ohoi") == corrected
+    # a new string made of cached words is corrected without the speller too
+    assert Correcter.quick_correct("ohoi colombus") == " ".join(reversed(corrected.split(", ")))
+    assert Correcter.stats()["tokens"]["quick"]["hits"] == 2
@@ -0,0 +1,27 @@
+import pandas as pd
+
+from tests.conftest import readOutput, writeSurvey
+from utils.locator import Locator
+
+
+def test_each_distinct_location_is_resolved_once(config, mock):
+    writeSurvey(["Columbus, OH", " columbus, oh ", "Dayton, OH", "COLUMBUS, OH", None, "nowhere", "Nowhere"])
+    locator = Locator(config(deduplicate=True))
+    locator.run()
+    output = readOutput()
+    assert mock.requests == 3
+    assert output["location"].tolist() == ["columbus, oh", "columbus, oh", "dayton, oh", "columbus, oh", "", "nowhere", "nowhere"]
+    assert len(output) == 7
+    # results are broadcast back onto every row, and the counts are per row as well as per location
+    latitudes = output["latitude"].tolist()
+    assert latitudes[0] == latitudes[1] == latitudes[3] != "?"
+    assert locator._getTotalCount() == 3
+    assert locator.not_located_rows == 2 and locator.not_located == 1
+
+
+def test_deduplicated_results_match_a_row_by_row_run(config):
+    locations = ["Columbus, OH", "columbus, oh", "Dayton, OH", "Akron, OH", "dayton, oh"]
+    deduplicated = Locator(config(deduplicate=True)).locateMany(locations)
+    row_by_row = Locator(config(deduplicate=False)).locateMany(locations)
+    assert deduplicated["latitude"].tolist() == row_by_row["latitude"].tolist()
+    assert isinstance(deduplicated, pd.DataFrame)
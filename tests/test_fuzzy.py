@@ -0,0 +1,65 @@
+from benchmarks.mock_nominatim import MockNominatim
+from utils.config import Config
+from utils.fuzzy import FuzzyMatcher
+from utils.locator import Locator
+from utils.memo import Memo
+
+LOCATION = {"lat": "39.96", "lon": "-83.00", "display_name": "Springfield, Clark County, Ohio", "address": {"city": "Springfield", "state": "Ohio"}}
+
+
+def loadMatcher(names:list[str]):
+    Config.load({})
+    FuzzyMatcher.load(names)
+
+
+def test_distance_counts_a_transposition_as_one_edit():
+    assert FuzzyMatcher.distance("colmubus", "columbus", 2) == 1
+    assert FuzzyMatcher.distance("kitten", "sitting", 3) == 3
+    # past the limit the exact distance doesn't matter
+    assert FuzzyMatcher.distance("kitten", "sitting", 1) == 2
+
+
+def test_only_the_place_is_matched_fuzzily():
+    loadMatcher(["columbus, ohio", "springfield, il", "columbus oh"])
+    assert FuzzyMatcher.match("colombus, ohio") == ("columbus, ohio", 1)
+    assert FuzzyMatcher.match("colombus oh") == ("columbus oh", 1)
+    assert FuzzyMatcher.match("columbus, ga") is None
+    assert FuzzyMatcher.match("springfeld, ma") is None
+
+
+def test_weak_matches_are_rejected():
+    loadMatcher(["columbus", "colorado springs"])
+    # two edits to an 8 letter place leave a confidence of 0.75, to a 16 letter one 0.875
+    assert FuzzyMatcher.match("columbia") is None
+    assert FuzzyMatcher.match("colorado sprangz") == ("colorado springs", 2)
+    # and names shorter than 4 letters must match exactly
+    loadMatcher(["rye"])
+    assert FuzzyMatcher.match("rie") is None
+
+
+def test_names_are_indexed_as_the_memo_learns_them():
+    Config.load({"use_memo": True, "use_fuzzy_match": True})
+    Memo.load()
+    FuzzyMatcher.load(Memo.knownNames())
+    Memo.add("springfield, ohio", 1, dict(LOCATION), 1.0)
+    assert FuzzyMatcher.match("springfeild, ohio") == ("springfield, ohio", 1)
+
+
+def test_a_correct_spelling_is_geocoded_before_it_is_matched(config, mock):
+    locator = Locator(config(use_fuzzy_match=True))
+    # one edit apart and both confident matches, but both real places the geocoder knows
+    boston = locator.locateMany(["boston"])
+    bolton = locator.locateMany(["bolton"])
+    assert mock.requests == 2
+    assert bolton["latitude"][0] != boston["latitude"][0]
+
+
+def test_a_typo_the_geocoder_misses_is_matched_without_recording_it(config):
+    with MockNominatim(miss_rate=1.0) as missing:
+        locator = Locator(config(use_fuzzy_match=True, geocode_domain=missing.domain))
+        Memo.add("springfield, ohio", 1, dict(LOCATION), 1.0)
+        results = locator.locateMany(["sprinfield, ohio"])
+        assert missing.requests == 1
+    assert results["latitude"].tolist() == ["39.96"]
+    assert not Memo.isUnknown("sprinfield, ohio")
+    assert Memo.getMapID("sprinfield, ohio") is None
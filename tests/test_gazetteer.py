@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+import pytest
+
+from utils import gazetteer
+from utils.gazetteer import Gazetteer
+from utils.locator import Locator
+
+ROWS = [
+    # id, name, ascii name, latitude, longitude, feature class, feature code, country, admin1, admin2, population
+    (1, "United States", "United States", "39.76", "-98.5", "A", "PCLI", "US", "00", "", 327000000),
+    (2, "Canada", "Canada", "60.1", "-113.6", "A", "PCLI", "CA", "00", "", 37000000),
+    (3, "Ohio", "Ohio", "40.25", "-83.0", "A", "ADM1", "US", "OH", "", 11600000),
+    (4, "Illinois", "Illinois", "40.0", "-89.25", "A", "ADM1", "US", "IL", "", 12800000),
+    (5, "Ontario", "Ontario", "49.25", "-84.5", "A", "ADM1", "CA", "08", "", 13400000),
+    (6, "Clark County", "Clark County", "39.9", "-83.8", "A", "ADM2", "US", "OH", "023", 134000),
+    (7, "Springfield", "Springfield", "39.92", "-83.81", "P", "PPL", "US", "OH", "023", 58000),
+    (8, "Springfield", "Springfield", "39.80", "-89.64", "P", "PPLA", "US", "IL", "", 114000),
+    (9, "Toronto", "Toronto", "43.70", "-79.42", "P", "PPLA", "CA", "08", "", 2700000),
+    (10, "Montréal", "Montreal", "45.51", "-73.59", "P", "PPL", "CA", "10", "", 1700000),
+]
+
+
+def writeDump(path):
+    with open(path, 'w', encoding='utf-8') as dump_file:
+        for id, name, ascii_name, latitude, longitude, feature_class, feature_code, country, admin1, admin2, population in ROWS:
+            row = [""] * 19
+            row[0], row[1], row[2], row[4], row[5], row[6], row[7], row[8], row[10], row[11], row[14] = f"{id}", name, ascii_name, latitude, longitude, feature_class, feature_code, country, admin1, admin2, f"{population}"
+            dump_file.write("\t".join(row) + "\n")
+
+
+@pytest.fixture
+def index(isolated, monkeypatch):
+    # small runs and writes so the build goes through its merge and batching paths
+    monkeypatch.setattr(gazetteer, "KEYS_PER_RUN", 7)
+    monkeypatch.setattr(gazetteer, "ROWS_PER_WRITE", 3)
+    writeDump(isolated / "dump.txt")
+    Gazetteer.build("dump.txt", "gazetteer")
+    Gazetteer.load("gazetteer")
+    return isolated / "gazetteer"
+
+
+def test_places_are_found_with_and_without_qualifiers(index):
+    assert Gazetteer.search("Springfield, OH")["county"] == "Clark County"
+    assert Gazetteer.search("springfield illinois") is None
+    assert Gazetteer.search("Springfield, Illinois")["latitude"] == "39.8"
+    assert Gazetteer.search("toronto, ca")["country"] == "Canada"
+    assert Gazetteer.search("Montréal")["city"] == "Montréal"
+    assert Gazetteer.search("montreal")["city"] == "Montréal"
+    assert Gazetteer.search("Ohio")["state"] == "Ohio"
+    assert Gazetteer.search("atlantis") is None
+
+
+def test_the_most_populous_place_answers_a_shared_name(index):
+    assert Gazetteer.search("springfield")["state"] == "Illinois"
+
+
+def test_bare_country_codes_are_not_places(index):
+    assert Gazetteer.search("ca") is None
+    assert Gazetteer.search("us") is None
+    assert Gazetteer.search("canada")["country"] == "Canada"
+
+
+def test_keys_are_sorted_hashes_over_one_byte_array(index):
+    hashes = np.load(index / "hashes.npy")
+    offsets = np.load(index / "keys_offsets.npy")
+    assert (np.diff(hashes.astype(np.float64)) >= 0).all()
+    assert len(offsets) == len(hashes) + 1 and offsets[-1] == len(np.load(index / "keys.npy"))
+    # every key the build wrote is found again by searching for it
+    for i in range(len(hashes)):
+        assert Gazetteer.search(Gazetteer.key(i).decode('utf-8')) is not None
+    with open(index / "source.json") as source_file:
+        assert json.load(source_file)["keys"] == len(hashes)
+
+
+def test_gazetteer_answers_before_the_geocoder(index, config, mock):
+    results = Locator(config(gazetteer_loc="gazetteer")).locateMany(["Toronto, ON, Canada", "toronto, ontario"])
+    # "on" isn't the admin1 code GeoNames uses for Ontario, so only the first goes to the geocoder
+    assert mock.requests == 1
+    assert results["latitude"].tolist()[1] == "43.7"
@@ -0,0 +1,33 @@
+from tests.conftest import readOutput, writeSurvey
+from utils.locator import Locator
+
+
+def test_only_new_and_changed_rows_are_resolved(config, mock):
+    writeSurvey(["columbus, ohio", "dayton, ohio", "akron, ohio"])
+    Locator(config(incremental=True)).run()
+    first = readOutput()
+    assert mock.requests == 3
+
+    writeSurvey(["columbus, ohio", "toledo, ohio", "akron, ohio", "canton, ohio", "parma, ohio"])
+    locator = Locator(config(incremental=True))
+    locator.run()
+    second = readOutput()
+    # reused rows never reach locate(), so only the changed second row and the two new ones are counted
+    assert locator._getTotalCount() == 3
+    assert mock.requests == 3 + 3
+    assert second["location"].tolist() == ["columbus, ohio", "toledo, ohio", "akron, ohio", "canton, ohio", "parma, ohio"]
+    assert second.loc[["0", "2"]].equals(first.loc[["0", "2"]])
+    assert (second["latitude"] != "?").all()
+
+
+def test_unresolved_rows_are_only_retried_when_asked(config):
+    writeSurvey(["columbus, ohio", "nowhere"])
+    Locator(config(incremental=True)).run()
+    assert (readOutput()["latitude"] == "?").tolist() == [False, True]
+
+    locator = Locator(config(incremental=True))
+    locator.run()
+    assert locator._getTotalCount() == 0
+    locator = Locator(config(incremental=True, retry_unresolved=True))
+    locator.run()
+    assert locator._getTotalCount() == 1
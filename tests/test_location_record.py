@@ -0,0 +1,42 @@
+import pickle
+
+import pytest
+
+from utils.config import Config
+from utils.memo import LocationRecord, Memo
+
+LOCATION = {"latitude": "39.96", "longitude": "-83.0000000", "display_name": "Columbus, Ohio", "city": "Columbus", "state": "Ohio", "county": "NA", "place_id": 1234}
+
+
+def test_records_give_back_exactly_what_was_stored():
+    record = LocationRecord(LOCATION)
+    assert record.toDict() == LOCATION
+    # a coordinate that prints back the same is kept as a float, any other is kept as its string
+    assert object.__getattribute__(record, "latitude") == 39.96
+    assert record["longitude"] == "-83.0000000"
+    assert record.coordinates() == (39.96, -83.0)
+    assert record["place_id"] == 1234
+    assert "country" not in record and record.get("country") is None
+    with pytest.raises(KeyError):
+        record["country"]
+    assert pickle.loads(pickle.dumps(record)) == record
+
+
+def test_records_are_read_only():
+    record = LocationRecord(LOCATION)
+    with pytest.raises(TypeError):
+        record.city = "Dayton"
+    copy = record.copy()
+    copy["city"] = "Dayton"
+    assert record["city"] == "Columbus"
+
+
+def test_memo_round_trips_records_through_memo_json():
+    Config.load({"use_memo": True})
+    Memo.load()
+    Memo.add("columbus oh", 18, {"lat": "39.96", "lon": "-83.0000000", "display_name": "Columbus, Ohio", "address": {"city": "Columbus"}}, 0.9)
+    Memo.save()
+    Memo.load()
+    record = Memo.search("columbus oh")
+    assert isinstance(record, LocationRecord)
+    assert record.toDict() == {"latitude": "39.96", "longitude": "-83.0000000", "display_name": "Columbus, Ohio", "city": "Columbus", "county": "NA", "state": "NA", "country": "NA", "street": "NA", "zip": "NA", "building": "NA", "house_number": "NA"}
@@ -0,0 +1,44 @@
+import json
+
+from utils.config import Config
+from utils.memo import Memo
+
+LOCATION = {"lat": "39.96", "lon": "-83.00", "display_name": "Columbus, Ohio", "address": {"city": "Columbus", "state": "Ohio"}}
+
+
+def loadMemo():
+    Config.load({"use_memo": True})
+    Memo.load()
+
+
+def test_names_ids_and_unknowns_are_looked_up_by_hash():
+    loadMemo()
+    Memo.add("columbus oh", 18, dict(LOCATION), 0.9)
+    Memo.addUnknown("agent-a", "nowhere")
+    assert Memo.search("columbus oh")["city"] == "Columbus"
+    assert Memo.search("columbus, ohio") is not None
+    assert 18 in Memo.known_osm_ids
+    assert Memo.isUnknown("nowhere") and Memo.isUnknown("nowhere", "agent-a")
+    assert not Memo.isUnknown("nowhere", "agent-b")
+    # a name that resolves is no longer unknown to anyone
+    Memo.addKnown("nowhere", 18)
+    assert not Memo.isUnknown("nowhere")
+
+
+def test_saves_are_byte_for_byte_repeatable():
+    loadMemo()
+    for number, name in enumerate(["dayton", "akron", "toledo", "canton", "parma"]):
+        Memo.add(name, 100 - number, {**LOCATION, "display_name": name.title()}, 1.0)
+        Memo.addUnknown("agent-a", f"nowhere {name}")
+    Memo.save()
+    with open('memo.json', 'rb') as memo_file:
+        first = memo_file.read()
+
+    Memo.load()
+    Memo.save()
+    with open('memo.json', 'rb') as memo_file:
+        assert memo_file.read() == first
+    saved = json.loads(first)
+    assert saved["known_names"] == sorted(saved["known_names"])
+    assert saved["known_osm_ids"] == [96, 97, 98, 99, 100]
+    assert saved["unknown"]["agent-a"] == sorted(saved["unknown"]["agent-a"])
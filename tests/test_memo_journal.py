@@ -0,0 +1,45 @@
+import json
+
+from utils.locator import Locator
+from utils.memo import COMPACTING_JOURNAL_LOC, JOURNAL_LOC, Memo
+
+
+def readJournal() -> list[list]:
+    with open(JOURNAL_LOC, encoding='utf-8') as journal_file:
+        return [json.loads(line) for line in journal_file]
+
+
+def readSnapshot() -> dict:
+    with open('memo.json', encoding='utf-8') as memo_file:
+        return json.load(memo_file)
+
+
+def test_changes_are_appended_and_replayed(config):
+    locator = Locator(config(use_memo_journal=True, memo_journal_sync_every=1))
+    locator.locateMany(["columbus, ohio", "nowhere"])
+    operations = [entry[0] for entry in readJournal()]
+    assert "add" in operations and "addKnown" in operations and "addUnknown" in operations
+    # memo.json isn't rewritten until the journal is compacted
+    assert readSnapshot()["known_names"] == []
+    locator.close()
+
+    Memo.known_names = set()
+    Memo.unknown = {}
+    Memo.load()
+    assert Memo.search("columbus, ohio") is not None
+    assert Memo.isUnknown("nowhere", "survey-geocoder-test")
+    Memo.close()
+
+
+def test_journal_is_compacted_into_the_snapshot(config, isolated, mock):
+    locator = Locator(config(use_memo_journal=True, memo_compact_every=2))
+    locator.locateMany(["columbus, ohio", "dayton, ohio"])
+    locator.close()
+    assert not (isolated / COMPACTING_JOURNAL_LOC).exists()
+    assert sorted(readSnapshot()["known_names"]) == ["columbus, ohio", "dayton, ohio"]
+    assert readJournal() == []
+
+    requests = mock.requests
+    results = Locator(config(use_memo_journal=True)).locateMany(["columbus, ohio", "dayton, ohio"])
+    assert (results["latitude"] != "?").all()
+    assert mock.requests == requests
@@ -0,0 +1,49 @@
+import json
+
+from utils.locator import Locator
+from utils.metrics import Histogram
+from tests.conftest import writeSurvey
+
+LOCATIONS = ["Columbus, OH", "Columbus, OH", "nowhere"]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram()
+    for seconds in (0.00005, 0.003, 0.003, 20.0):
+        histogram.observe(seconds)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 4
+    assert snapshot["buckets"]["0.0001"] == 1
+    assert snapshot["buckets"]["0.001"] == 1
+    assert snapshot["buckets"]["0.005"] == 3
+    assert snapshot["buckets"]["10.0"] == 3
+    assert snapshot["buckets"]["+Inf"] == 4
+
+
+def test_json_metrics_count_every_agent_and_stage(config):
+    writeSurvey(LOCATIONS)
+    Locator(config(user_agents=["agent-a"], metrics_loc="metrics.json")).run()
+    with open("metrics.json", 'r') as metrics_file:
+        metrics = json.load(metrics_file)
+    counters = metrics["counters"]
+    assert counters["locations"] == {"agent-a": 3}
+    assert counters["memo_hit"] == {"agent-a": 1}
+    assert counters["memo_miss"] == {"agent-a": 2}
+    assert counters["geocode_hit"] == {"agent-a": 1}
+    assert counters["geocode_miss"] == {"agent-a": 1}
+    assert metrics["memo_hit_rates"] == {"agent-a": 1 / 3}
+    assert metrics["stages"]["memo_probe"]["count"] == 3
+    assert metrics["stages"]["geocode_request"]["count"] == 2
+
+
+def test_prom_metrics_are_written_in_the_prometheus_text_format(config):
+    writeSurvey(LOCATIONS)
+    Locator(config(user_agents=["agent-a"], metrics_loc="metrics.prom")).run()
+    with open("metrics.prom", 'r') as metrics_file:
+        lines = metrics_file.read().splitlines()
+    assert "# TYPE survey_geocoder_events_total counter" in lines
+    assert 'survey_geocoder_events_total{event="memo_hit",agent="agent-a"} 1' in lines
+    assert 'survey_geocoder_memo_hit_rate{agent="agent-a"} 0.3333333333333333' in lines
+    assert "# TYPE survey_geocoder_stage_seconds histogram" in lines
+    assert 'survey_geocoder_stage_seconds_bucket{stage="memo_probe",le="+Inf"} 3' in lines
+    assert 'survey_geocoder_stage_seconds_count{stage="geocode_request"} 2' in lines
@@ -0,0 +1,43 @@
+import pandas as pd
+
+from utils import autocorrect
+from utils.autocorrect import Correcter
+from utils.config import Config
+from utils.locator import Locator
+
+
+def test_precorrect_fills_the_cache_with_what_the_speller_would_say():
+    Config.load({"use_autocorrect": True})
+    Correcter.load()
+    expected = Correcter._spell.autocorrect_sentence("colombus ohoi")
+    corrected = Correcter.precorrect(["colombus ohoi", "colombus ohoi", float("nan")], workers=2)
+    assert corrected == {"colombus ohoi": expected}
+    assert {"colombus", "ohoi"} <= set(Correcter._token_cache["slow"].entries)
+
+
+def test_workers_are_started_once_per_run():
+    Config.load({"use_autocorrect": True})
+    Correcter.load()
+    Correcter.precorrect(["daytn"], workers=1)
+    pool = Correcter._pool
+    Correcter.precorrect(["akrn"], workers=1)
+    assert Correcter._pool is pool
+    Correcter.close()
+    assert Correcter._pool is None
+
+
+def test_chunked_run_reuses_the_workers(config, monkeypatch):
+    pd.DataFrame({"location": [f"nowhere twn{number}" for number in range(6)]}).to_csv("survey.csv", index=False)
+    pools = []
+    class CountedPool(autocorrect.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs) -> None:
+            super().__init__(*args, **kwargs)
+            pools.append(self)
+    monkeypatch.setattr(autocorrect, "ProcessPoolExecutor", CountedPool)
+    calls = []
+    precorrect = Correcter.precorrect
+    monkeypatch.setattr(Correcter, "precorrect", staticmethod(lambda strings, workers: calls.append(strings) or precorrect(strings, workers)))
+    Locator(config(use_autocorrect=True, correction_workers=1, chunk_size=2)).run()
+    assert len(calls) == 3
+    assert len(pools) == 1
+    assert Correcter._pool is None
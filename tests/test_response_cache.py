@@ -0,0 +1,54 @@
+import os
+
+from utils.config import Config
+from utils.locator import Locator
+from utils.response_cache import GEOCODE_PARAMS, ResponseCache
+from tests.conftest import writeSurvey, readOutput
+
+
+def response(number:int) -> dict:
+    # distinct digits so every response compresses to about the same size
+    return {"osm_id": number, "display_name": " ".join(f"{number * 7919 + i:x}" for i in range(40))}
+
+
+def test_requests_are_keyed_by_endpoint_query_and_parameters():
+    Config.load({"response_cache_loc": "responses.db"})
+    ResponseCache.load()
+    ResponseCache.put("example.org", "columbus", GEOCODE_PARAMS, response(1))
+    ResponseCache.put("example.org", "nowhere", GEOCODE_PARAMS, None)
+    assert ResponseCache.get("example.org", "columbus", GEOCODE_PARAMS) == (True, response(1))
+    # a cached miss is an answer too
+    assert ResponseCache.get("example.org", "nowhere", GEOCODE_PARAMS) == (True, None)
+    assert ResponseCache.get("example.net", "columbus", GEOCODE_PARAMS) == (False, None)
+    assert ResponseCache.get("example.org", "columbus", {**GEOCODE_PARAMS, "addressdetails": False}) == (False, None)
+    assert (ResponseCache.hits, ResponseCache.misses) == (2, 2)
+
+
+def test_least_recently_used_responses_are_evicted():
+    Config.load({"response_cache_loc": "responses.db", "response_cache_size": 0.001})
+    ResponseCache.load()
+    for number in range(3):
+        ResponseCache.put("example.org", f"town{number}", GEOCODE_PARAMS, response(number))
+    ResponseCache.get("example.org", "town0", GEOCODE_PARAMS)
+    for number in range(3, 12):
+        ResponseCache.put("example.org", f"town{number}", GEOCODE_PARAMS, response(number))
+        ResponseCache.get("example.org", "town0", GEOCODE_PARAMS)
+    assert ResponseCache.size <= 0.001 * 2**20
+    assert ResponseCache.get("example.org", "town0", GEOCODE_PARAMS)[0]
+    assert not ResponseCache.get("example.org", "town1", GEOCODE_PARAMS)[0]
+    assert ResponseCache.get("example.org", "town11", GEOCODE_PARAMS)[0]
+
+
+def test_a_run_without_its_memo_is_answered_from_the_cache(config, mock):
+    writeSurvey(["Columbus, OH", "Dayton, OH", "nowhere"])
+    Locator(config(response_cache_loc="responses.db")).run()
+    assert mock.requests == 3
+    first = readOutput()
+
+    os.remove("memo.json")
+    Locator(config(response_cache_loc="responses.db")).run()
+    assert mock.requests == 3
+    assert readOutput().equals(first)
+    # the memo is rebuilt from the cached responses
+    with open("memo.json", 'r') as memo_file:
+        assert "columbus, oh" in memo_file.read()
@@ -0,0 +1,86 @@
+import socket
+
+import pytest
+from geopy.exc import GeocoderAuthenticationFailure, GeocoderQueryError, GeocoderRateLimited, GeocoderServiceError
+
+import utils.scheduler
+from utils.config import Config
+from utils.locator import Locator
+from utils.memo import Memo
+from utils.scheduler import GeocodeRejected, GeocodeUnavailable, Scheduler, TokenBucket
+
+
+class Flaky:
+    # raises each of errors in turn, then answers
+    def __init__(self, *errors:Exception) -> None:
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self, query:str) -> str:
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return query
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> list[float]:
+    # waits are recorded instead of slept, so the clock doesn't move while a test runs
+    slept = []
+    monkeypatch.setattr(utils.scheduler.time, "sleep", slept.append)
+    return slept
+
+
+def test_retry_after_pauses_the_endpoint_and_halves_its_rate(sleeps):
+    Config.load({"geocode_min_delay": 1, "geocode_max_retries": 2})
+    function = Flaky(GeocoderRateLimited("slow down", retry_after=30))
+    assert Scheduler.call("example.org", function, "columbus") == "columbus"
+    assert function.calls == 2
+    assert sleeps[-1] == pytest.approx(30, abs=0.5)
+    # halved to 0.5 by the 429, then a twentieth of the configured rate won back by the success
+    assert Scheduler.bucket("example.org").rate == pytest.approx(0.55)
+    # the next request to the endpoint waits out the pause and the halved rate's interval as well
+    assert Scheduler.bucket("example.org").reserve() == pytest.approx(32, abs=0.5)
+
+
+def test_service_errors_are_retried_then_reported_unavailable(sleeps):
+    Config.load({"geocode_max_retries": 2, "geocode_backoff": 4, "geocode_backoff_max": 5})
+    function = Flaky(*(GeocoderServiceError("down") for _ in range(3)))
+    with pytest.raises(GeocodeUnavailable) as raised:
+        Scheduler.call("example.org", function, "columbus")
+    assert function.calls == 3
+    assert isinstance(raised.value.error, GeocoderServiceError)
+    assert raised.value.endpoint == "example.org"
+
+
+def test_permanent_and_query_errors_are_not_retried(sleeps):
+    Config.load({"geocode_max_retries": 2})
+    function = Flaky(GeocoderAuthenticationFailure("bad key"))
+    with pytest.raises(GeocoderAuthenticationFailure):
+        Scheduler.call("example.org", function, "columbus")
+    assert function.calls == 1
+    function = Flaky(GeocoderQueryError("bad query"))
+    with pytest.raises(GeocodeRejected):
+        Scheduler.call("example.org", function, "columbus")
+    assert function.calls == 1
+
+
+def test_token_bucket_allows_a_burst_then_paces_requests():
+    bucket = TokenBucket(2, 3)
+    waits = [bucket.reserve() for _ in range(5)]
+    assert waits[:3] == pytest.approx([0, 0, 0], abs=0.05)
+    assert waits[3:] == pytest.approx([0.5, 1.0], abs=0.05)
+
+
+def test_an_unreachable_geocoder_leaves_the_row_unresolved(config):
+    # a port nothing is listening on
+    with socket.socket() as closed:
+        closed.bind(("127.0.0.1", 0))
+        domain = f"127.0.0.1:{closed.getsockname()[1]}"
+    locator = Locator(config(geocode_domain=domain, geocode_max_retries=1, geocode_backoff=0))
+    try:
+        results = locator.locateMany(["Columbus, OH"])
+    finally:
+        locator.close()
+    assert results["latitude"].tolist() == ["?"]
+    assert not Memo.isUnknown("columbus, oh")
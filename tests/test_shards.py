@@ -0,0 +1,54 @@
+from utils.config import Config
+from utils.locator import Locator
+from utils.memo import Memo
+from utils.shards import mergeDeltas
+
+LOCATION = {"latitude": "40", "longitude": "-83", "display_name": "Columbus, Ohio"}
+
+
+def test_deltas_merge_the_same_way_whichever_shard_finishes_first():
+    Config.load({"use_memo": True})
+    Memo.load()
+    first = [
+        ["add", 1, LOCATION],
+        ["addKnown", "columbus oh", 1, 0.5],
+        ["addUnknown", "agent-a", "nowhere", "not_found", 100],
+    ]
+    second = [
+        ["add", 2, {**LOCATION, "display_name": "Columbus, Georgia"}],
+        ["addKnown", "columbus oh", 2, 0.9],
+        ["addUnknown", "agent-b", "columbus oh", "not_found", 100],
+        ["addUnknown", "agent-b", "nowhere", "not_found", 100],
+    ]
+    merged = mergeDeltas(Memo, [first, second])
+
+    # the most confident shard wins a name new to both, and a name some shard found isn't unknown to the others
+    assert Memo.getMapID("columbus oh") == 2
+    assert not Memo.isUnknown("columbus oh")
+    assert Memo.isUnknown("nowhere", "agent-a") and Memo.isUnknown("nowhere", "agent-b")
+    assert Memo.getLocation(1) is not None and Memo.getLocation(2) is not None
+    assert ["addKnown", "columbus oh", 2, 0.9] in merged
+
+
+def test_a_name_the_memo_already_maps_keeps_its_location():
+    Config.load({"use_memo": True})
+    Memo.load()
+    Memo.add("columbus, ohio", 1, dict(LOCATION), 1.0)
+    merged = mergeDeltas(Memo, [[["addKnown", "columbus, ohio", 2, 1.0]]])
+    assert Memo.getMapID("columbus, ohio") == 1
+    assert merged == []
+
+
+def test_sharded_run_merges_every_agent_into_the_memo(config, mock):
+    locations = [f"town{number}, ohio" for number in range(12)] + ["nowhere"]
+    locator = Locator(config(user_agents=["agent-a", "agent-b"], use_sharding=True))
+    try:
+        results = locator.locateMany(locations)
+    finally:
+        locator.close()
+    assert (results["latitude"] != "?").sum() == 12
+    assert mock.requests == 12 + 2
+    # the miss is tried by both agents before it is recorded as unknown to each of them
+    assert Memo.isUnknown("nowhere", "agent-a") and Memo.isUnknown("nowhere", "agent-b")
+    for location in locations[:-1]:
+        assert Memo.search(location) is not None
@@ -0,0 +1,44 @@
+import sqlite3
+
+from utils.config import Config
+from utils.locator import Locator
+from utils.memo import Memo
+from utils.sqlite_memo import SQLiteMemo
+from tests.conftest import writeSurvey, readOutput
+
+LOCATION = {"lat": "39.96", "lon": "-83.00", "display_name": "Columbus, Ohio", "address": {"city": "Columbus", "state": "Ohio"}}
+
+
+def test_sqlite_backend_answers_a_second_run_from_the_database(config, mock):
+    writeSurvey(["Columbus, OH", "Dayton, OH", "nowhere"])
+    Locator(config(memo_backend="sqlite", memo_db_loc="memo.db")).run()
+    assert mock.requests == 3
+    first = readOutput()
+
+    connection = sqlite3.connect("memo.db")
+    assert connection.execute("SELECT COUNT(*) FROM locations").fetchone()[0] == 2
+    assert connection.execute("SELECT name FROM unknown").fetchall() == [("nowhere",)]
+    connection.close()
+
+    Locator(config(memo_backend="sqlite", memo_db_loc="memo.db")).run()
+    assert mock.requests == 3
+    assert readOutput().equals(first)
+
+
+def test_migrate_copies_a_json_memo_into_the_database():
+    Config.load({"use_memo": True})
+    Memo.load()
+    Memo.add("columbus oh", 18, dict(LOCATION), 0.9)
+    Memo.addUnknown("agent-a", "nowhere")
+    Memo.save()
+
+    SQLiteMemo.migrate("memo.json", "memo.db")
+    SQLiteMemo.load("memo.db")
+    assert SQLiteMemo.search("columbus oh")["city"] == "Columbus"
+    assert SQLiteMemo.search("columbus, ohio") is not None
+    assert SQLiteMemo.getMapID("columbus oh") == 18
+    assert SQLiteMemo.isUnknown("nowhere", "agent-a")
+    assert not SQLiteMemo.isUnknown("nowhere", "agent-b")
+    # a name that resolves is no longer unknown to anyone
+    SQLiteMemo.addKnown("nowhere", 18)
+    assert not SQLiteMemo.isUnknown("nowhere")
@@ -0,0 +1,60 @@
+from utils.locator import Locator
+from utils.memo import Memo
+from utils.response_cache import ResponseCache
+
+AGENT = "survey-geocoder-test"
+TWO_DAYS = 2 * 86400
+
+
+def age(name:str, seconds:int):
+    # moves the memo's unknown entry and the cached miss behind it into the past
+    Memo.unknown[name][AGENT][0] -= seconds
+    ResponseCache.connection.execute("UPDATE responses SET stored = stored - ?", (seconds * 10**9,))
+
+
+def test_unknowns_are_skipped_until_they_expire(config, mock):
+    locator = Locator(config(unknown_ttl_days=1, response_cache_loc="responses.db"))
+    locator.locateMany(["nowhere"])
+    assert mock.requests == 1
+    assert Memo.isUnknown("nowhere", AGENT)
+
+    locator.locateMany(["nowhere"])
+    assert mock.requests == 1
+    assert locator.skipped == 1
+
+    age("nowhere", TWO_DAYS)
+    assert Memo.expiredUnknowns() == ["nowhere"]
+    locator.locateMany(["nowhere"])
+    assert mock.requests == 2
+    assert Memo.expiredUnknowns() == []
+    locator.close()
+
+
+def test_retry_expired_unknowns_asks_the_server_again(config, mock):
+    locator = Locator(config(unknown_ttl_days=1, response_cache_loc="responses.db"))
+    locator.locateMany(["nowhere", "not sure", "columbus, ohio"])
+    assert mock.requests == 3
+    age("nowhere", TWO_DAYS)
+
+    results = locator.retryExpiredUnknowns()
+    assert results["location"].tolist() == ["nowhere"]
+    assert mock.requests == 4
+    # the failure is recorded again, so it is skipped until it expires once more
+    assert Memo.isUnknown("nowhere", AGENT)
+    assert locator.retryExpiredUnknowns().empty
+    assert mock.requests == 4
+    locator.close()
+
+
+def test_cached_misses_answer_unexpired_requests(config, mock):
+    locator = Locator(config(unknown_ttl_days=1, response_cache_loc="responses.db"))
+    locator.locateMany(["nowhere"])
+    # without the memo's entry the cached miss still answers, until it expires too
+    Memo.removeUnknown("nowhere")
+    locator.locateMany(["nowhere"])
+    assert mock.requests == 1
+    Memo.removeUnknown("nowhere")
+    ResponseCache.connection.execute("UPDATE responses SET stored = stored - ?", (TWO_DAYS * 10**9,))
+    locator.locateMany(["nowhere"])
+    assert mock.requests == 2
+    locator.close()
@@ -0,0 +1,141 @@
+import asyncio
+import copy
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+from geopy.adapters import AioHTTPAdapter
+from geopy.geocoders import Nominatim
+from tqdm import tqdm
+
+from utils.autocorrect import Correcter
+from utils.config import Config
+from utils.fuzzy import FuzzyMatcher
+from utils.gazetteer import Gazetteer
+from utils.response_cache import GEOCODE_PARAMS, ResponseCache
+from utils.scheduler import GeocodeRejected, GeocodeUnavailable, Scheduler
+
+
+class AsyncGeocoder:
+    def __init__(self, agent:str, memo) -> None:
+        self.agent = agent
+        self.memo = memo
+        self.results = {}
+        # locations the server refused to parse, for Locator._code to record why they are unknown
+        self.rejected = set()
+        # display name -> the location found under it so far, a spelling that is another result's display name doesn't need a request of its own
+        self.display_names = {}
+
+    def prefetch(self, locations:Iterable[str]) -> dict:
+        # geocode every location the memo can't answer with a bounded number of requests in flight. Locator._code then reads the results instead of waiting on the network row by row
+        self.results = {}
+        self.rejected = set()
+        self.display_names = {}
+        pending = [location for location in dict.fromkeys(locations) if isinstance(location, str) and self._memoState(location) is None]
+        if len(pending) == 0:
+            return self.results
+        logging.info("Prefetching %s locations with %s using up to %s concurrent requests", len(pending), self.agent, Config.getAsyncConcurrency())
+        if Config.getUseMemo():
+            self.memo.release()
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(self._prefetchAll(pending))
+        else:
+            # called from a coroutine, e.g. locateMany in an async application. Its loop can't be reentered, so the prefetch gets a loop on a thread of its own
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch") as executor:
+                executor.submit(asyncio.run, self._prefetchAll(pending)).result()
+        return self.results
+
+    def _memoState(self, location:str) -> bool | None:
+        # True if the memo or the offline gazetteer already knows the location, False if it is a recorded miss for this agent and None if it has to be geocoded.
+        # The same checks Locator._locate makes before it geocodes
+        if Config.getUseMemo():
+            if self.memo.isUnknown(location, self.agent):
+                return False
+            if self.memo.search(location) is not None:
+                return True
+            if Config.getCanonicalize() and self.memo.searchCanonical(location) is not None:
+                return True
+        if Gazetteer.search(location) is not None:
+            return True
+        return None
+
+    async def _prefetchAll(self, pending:list[str]):
+        async with Nominatim(
+            user_agent=self.agent,
+            domain=Config.getGeocodeDomain(),
+            scheme=Config.getGeocodeScheme(),
+            adapter_factory=AioHTTPAdapter,
+        ) as geolocator:
+            self.geolocator = geolocator
+            self.semaphore = asyncio.Semaphore(Config.getAsyncConcurrency())
+            with tqdm(total=len(pending), desc=f"Prefetching with {self.agent}", unit="location") as progress:
+                async def resolve(location:str):
+                    await self._resolve(location)
+                    progress.update()
+                await asyncio.gather(*(resolve(location) for location in pending))
+
+    async def _resolve(self, location:str):
+        if await self._code(location):
+            return
+        # Locator matches a miss against the memo's names before it tries any correction
+        if not Config.getUseAutocorrect() or self._fuzzyMatch(location):
+            return
+        # corrections run off the event loop so the other requests keep going while the speller works
+        quick_corrected_location = await asyncio.to_thread(Correcter.quick_correct, location)
+        if quick_corrected_location != location and await self._code(quick_corrected_location):
+            return
+        full_corrected_location = await asyncio.to_thread(Correcter.slow_correct, location)
+        if full_corrected_location != location and full_corrected_location != quick_corrected_location:
+            await self._code(full_corrected_location)
+
+    def _fuzzyMatch(self, location:str) -> bool:
+        if not Config.getUseMemo() or not Config.getUseFuzzyMatch():
+            return False
+        match = FuzzyMatcher.match(location)
+        return match is not None and self.memo.search(match[0]) is not None
+
+    async def _code(self, location:str) -> bool:
+        if location in self.results:
+            return self.results[location] is not None
+        state = self._memoState(location)
+        if state is not None:
+            return state
+        hit, loc = ResponseCache.get(Config.getGeocodeDomain(), location, GEOCODE_PARAMS)
+        if hit:
+            self.results[location] = loc
+            return loc is not None
+        async with self.semaphore:
+            # another request may have answered it while this one was queued
+            if location in self.display_names:
+                logging.debug("Not prefetching \"%s\", it is the display name of a location already found", location)
+                # a copy, Memo.memoFormat reshapes the location it is given
+                self.results[location] = copy.deepcopy(self.display_names[location])
+                return True
+            state = self._memoState(location)
+            if state is not None:
+                return state
+            logging.debug("Starting async geocode for \"%s\" using %s", location, self.agent)
+            try:
+                loc = await Scheduler.callAsync(
+                    Config.getGeocodeDomain(),
+                    self.geolocator.geocode,
+                    query=location,
+                    timeout=Config.getGeocodeTimeout(),
+                    **GEOCODE_PARAMS
+                )
+            except GeocodeUnavailable as error:
+                # left out of the results so Locator._code tries it again instead of reading a miss
+                logging.warning("Could not prefetch \"%s\" with %s: %s", location, self.agent, error)
+                return False
+            except GeocodeRejected as error:
+                # a miss like any other, asking again would be rejected again
+                logging.warning("[%s] %s", self.agent, error)
+                self.rejected.add(location)
+                loc = None
+        loc = None if loc is None else loc.raw
+        ResponseCache.put(Config.getGeocodeDomain(), location, GEOCODE_PARAMS, loc)
+        self.results[location] = loc
+        if loc is not None and "display_name" in loc:
+            self.display_names.setdefault(loc["display_name"].lower(), copy.deepcopy(loc))
+        return loc is not None
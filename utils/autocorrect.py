@@ -1,10 +1,70 @@
-
+import json
 import logging
+import multiprocessing
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
 from autocorrect import Speller
 
+from utils.config import Config
+
+# the same word pattern Speller uses to split a sentence for English
+WORD_REGEX = re.compile(r"[A-Za-z]+")
+
+_worker_spell = None
+
+def _initCorrectionWorker():
+    # each worker process loads the full speller once and keeps it for every batch it is sent
+    global _worker_spell
+    _worker_spell = Speller(lang='en', fast=False)
+
+def _correctWords(words:list[str]) -> list[str]:
+    return [_worker_spell.autocorrect_word(word) for word in words]
+
+class LRUCache:
+    def __init__(self, size:int) -> None:
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key:str) -> str | None:
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key:str, value:str):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def update(self, entries:dict):
+        for key, value in entries.items():
+            self.put(key, value)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups > 0 else 0.0}
+
+
 class Correcter:
     _spell = None
     _quick_spell = None
+    # corrected strings, and the corrected words they are built from, for each speller
+    _cache = {"quick": LRUCache(0), "slow": LRUCache(0)}
+    _token_cache = {"quick": LRUCache(0), "slow": LRUCache(0)}
+    # worker processes of precorrect, started on first use and kept until close() so each one loads the full speller once per run
+    _pool:ProcessPoolExecutor|None = None
 
     @staticmethod
     def load():
@@ -12,17 +72,112 @@ class Correcter:
             Correcter._spell = Speller(lang='en', fast=False)
         if not isinstance(Correcter._quick_spell, Speller):
             Correcter._quick_spell = Speller(lang='en', fast=True)
+        size = Config.getCorrectionCacheSize()
+        for mode in ("quick", "slow"):
+            Correcter._cache[mode] = LRUCache(size)
+            Correcter._token_cache[mode] = LRUCache(size)
+        if Config.getPersistCorrections():
+            Correcter.loadCache()
 
     @staticmethod
-    def slow_correct(string:str):
-        corrected = Correcter._spell(string)
+    def loadCache():
+        try:
+            with open(Config.getCorrectionCacheLoc(), 'r') as cache_file:
+                cache = json.load(cache_file)
+        except FileNotFoundError:
+            return
+        except json.JSONDecodeError:
+            logging.error("Could not read corrections from %s", Config.getCorrectionCacheLoc())
+            return
+        for mode in ("quick", "slow"):
+            Correcter._cache[mode].update(cache.get(mode, {}).get("strings", {}))
+            Correcter._token_cache[mode].update(cache.get(mode, {}).get("tokens", {}))
+        logging.info("Loaded cached corrections from %s", Config.getCorrectionCacheLoc())
+
+    @staticmethod
+    def save():
+        if not Config.getPersistCorrections():
+            return
+        cache = {}
+        for mode in ("quick", "slow"):
+            cache[mode] = {"strings": dict(Correcter._cache[mode].entries), "tokens": dict(Correcter._token_cache[mode].entries)}
+        try:
+            with open(Config.getCorrectionCacheLoc(), 'w') as cache_file:
+                json.dump(cache, cache_file)
+            logging.info("Saved cached corrections to %s", Config.getCorrectionCacheLoc())
+        except OSError:
+            logging.error("Could not write corrections to %s", Config.getCorrectionCacheLoc())
+
+    @staticmethod
+    def stats() -> dict:
+        return {
+            "strings": {mode: cache.stats() for mode, cache in Correcter._cache.items()},
+            "tokens": {mode: cache.stats() for mode, cache in Correcter._token_cache.items()},
+        }
+
+    @staticmethod
+    def _correctToken(token:str, mode:str) -> str:
+        cache = Correcter._token_cache[mode]
+        corrected = cache.get(token)
+        if corrected is None:
+            spell = Correcter._quick_spell if mode == "quick" else Correcter._spell
+            corrected = spell.autocorrect_word(token)
+            cache.put(token, corrected)
+        return corrected
+
+    @staticmethod
+    def _correct(string:str, mode:str) -> str:
+        cache = Correcter._cache[mode]
+        corrected = cache.get(string)
+        if corrected is None:
+            corrected = WORD_REGEX.sub(lambda match: Correcter._correctToken(match.group(0), mode), string)
+            cache.put(string, corrected)
         if string != corrected:
-            logging.debug(f"Spelling errors detected in: {string}, corrected to {corrected}")
+            logging.debug("Spelling errors detected in: %s, corrected to %s", string, corrected)
         return corrected
 
+    @staticmethod
+    def slow_correct(string:str):
+        return Correcter._correct(string, "slow")
+
     @staticmethod
     def quick_correct(string:str):
-        corrected = Correcter._quick_spell(string)
-        if string != corrected:
-            logging.debug(f"Spelling errors detected in: {string}, corrected to {corrected}")
-        return corrected
\ No newline at end of file
+        return Correcter._correct(string, "quick")
+
+    @staticmethod
+    def correctAll(strings:Iterable[str], fast:bool=False) -> dict[str, str]:
+        # correct each distinct word of a dataset once up front so every later lookup is a cache hit
+        mode = "quick" if fast else "slow"
+        strings = [string for string in dict.fromkeys(strings) if isinstance(string, str)]
+        tokens = {token for string in strings for token in WORD_REGEX.findall(string)}
+        logging.info("Correcting %s distinct words across %s distinct strings", len(tokens), len(strings))
+        for token in tokens:
+            Correcter._correctToken(token, mode)
+        return {string: Correcter._correct(string, mode) for string in strings}
+
+    @staticmethod
+    def precorrect(strings:Iterable[str], workers:int, batch_size:int=256) -> dict[str, str]:
+        # full correction is CPU bound, so spread the distinct words nobody has corrected yet over a pool of processes and cache what comes back
+        strings = [string for string in dict.fromkeys(strings) if isinstance(string, str)]
+        cache = Correcter._token_cache["slow"]
+        words = [word for word in {word for string in strings for word in WORD_REGEX.findall(string)} if word not in cache.entries]
+        if len(words) > 0:
+            logging.info("Correcting %s distinct words across %s distinct strings with %s processes", len(words), len(strings), workers)
+            batches = [words[i:i + batch_size] for i in range(0, len(words), batch_size)]
+            for batch, corrected in zip(batches, Correcter.pool(workers).map(_correctWords, batches)):
+                cache.update(dict(zip(batch, corrected)))
+        return {string: Correcter.slow_correct(string) for string in strings}
+
+    @staticmethod
+    def pool(workers:int) -> ProcessPoolExecutor:
+        if Correcter._pool is None:
+            # spawned rather than forked, a fork could copy a lock held by the log listener or journal compaction thread and deadlock
+            Correcter._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_initCorrectionWorker)
+        return Correcter._pool
+
+    @staticmethod
+    def close():
+        if Correcter._pool is None:
+            return
+        Correcter._pool.shutdown()
+        Correcter._pool = None
@@ -0,0 +1,68 @@
+import re
+import unicodedata
+
+# bump when the rules below change so saved canonical indexes are rebuilt
+CANONICAL_VERSION = 2
+PART_REGEX = re.compile(r"[,;/|]+")
+TOKEN_REGEX = re.compile(r"[^\W_]+")
+US_STATES = {
+    "al": "alabama", "ak": "alaska", "az": "arizona", "ar": "arkansas", "ca": "california", "co": "colorado", "ct": "connecticut",
+    "de": "delaware", "dc": "district of columbia", "fl": "florida", "ga": "georgia", "hi": "hawaii", "id": "idaho", "il": "illinois",
+    "in": "indiana", "ia": "iowa", "ks": "kansas", "ky": "kentucky", "la": "louisiana", "me": "maine", "md": "maryland",
+    "ma": "massachusetts", "mi": "michigan", "mn": "minnesota", "ms": "mississippi", "mo": "missouri", "mt": "montana", "ne": "nebraska",
+    "nv": "nevada", "nh": "new hampshire", "nj": "new jersey", "nm": "new mexico", "ny": "new york", "nc": "north carolina",
+    "nd": "north dakota", "oh": "ohio", "ok": "oklahoma", "or": "oregon", "pa": "pennsylvania", "ri": "rhode island",
+    "sc": "south carolina", "sd": "south dakota", "tn": "tennessee", "tx": "texas", "ut": "utah", "vt": "vermont", "va": "virginia",
+    "wa": "washington", "wv": "west virginia", "wi": "wisconsin", "wy": "wyoming", "pr": "puerto rico",
+}
+COUNTRIES = {
+    "us": "united states", "usa": "united states", "united states of america": "united states", "uk": "united kingdom",
+    "great britain": "united kingdom", "uae": "united arab emirates",
+}
+ABBREVIATIONS = {**US_STATES, **COUNTRIES}
+# every way of writing a state or country that is recognised at the end of a place name
+REGIONS = set(ABBREVIATIONS) | set(ABBREVIATIONS.values())
+REGION_WORDS = max(len(region.split()) for region in REGIONS)
+STATE_NAMES = set(US_STATES.values())
+
+
+def peelRegions(tokens:list[str]) -> tuple[list[str], list[str]]:
+    # splits the states and countries written at the end of a part off from the place, "columbus oh usa" is ["columbus"] and ["oh", "usa"].
+    # The first word always stays with the place, so "la crosse" and "new york" keep theirs
+    tokens, tail = list(tokens), []
+    while len(tokens) > 1:
+        for size in range(min(REGION_WORDS, len(tokens) - 1), 0, -1):
+            region = " ".join(tokens[-size:])
+            if region in REGIONS:
+                tail.insert(0, region)
+                del tokens[-size:]
+                break
+        else:
+            break
+    return tokens, tail
+
+
+def canonicalize(query:str) -> str:
+    # one key for every way of writing the same place: accents, case, punctuation, spacing, abbreviations and word order within a part are folded away.
+    # The order of the comma separated parts is kept, "kansas city, missouri" and "missouri city, kansas" are different places.
+    # Only used to find an existing memo entry, the geocoder always gets the string as it was typed
+    query = unicodedata.normalize("NFKD", query)
+    query = "".join(char for char in query if not unicodedata.combining(char)).casefold()
+    # "u.s.a." and "st. louis" keep their letters together
+    query = query.replace(".", "").replace("'", "")
+    parts = []
+    for part in PART_REGEX.split(query):
+        tokens = TOKEN_REGEX.findall(part)
+        if len(tokens) == 0:
+            continue
+        place, regions = peelRegions(tokens)
+        # "Columbus, OH" and "columbus ohio" both become the place followed by its state. A part that is only an abbreviation is
+        # expanded unless it comes first, where it is the place itself
+        parts.append(" ".join(place) if len(parts) == 0 else ABBREVIATIONS.get(" ".join(place), " ".join(place)))
+        parts.extend(ABBREVIATIONS[region] if region in ABBREVIATIONS else region for region in regions)
+    if len(parts) == 0:
+        return ""
+    if any(part in STATE_NAMES for part in parts[1:]):
+        # the state already says which country it is in
+        parts = [parts[0]] + [part for part in parts[1:] if part != "united states"]
+    return ", ".join(" ".join(sorted(part.split())) for part in parts)
@@ -1,6 +1,10 @@
 import json
 import logging
 
+CONFIG_KEYS = ["file_loc", "save_loc", "location_col_name", "geocode_col_name", "use_memo", "user_agents", "memo_save_counter", "geocode_timeout", "use_autocorrect", "deduplicate", "use_memo_journal", "memo_journal_sync_every", "memo_compact_every", "memo_backend", "memo_db_loc", "unknown_ttl_days", "unknown_max_entries", "retry_expired_unknowns", "geocode_domain", "geocode_scheme", "geocode_min_delay", "geocode_rate_limits", "geocode_burst", "geocode_max_retries", "geocode_backoff", "geocode_backoff_max", "use_async", "async_concurrency", "use_sharding", "chunk_size", "incremental", "incremental_key_col", "retry_unresolved", "correction_cache_size", "persist_corrections", "correction_cache_loc", "correction_workers", "canonicalize", "use_fuzzy_match", "fuzzy_max_distance", "fuzzy_min_confidence", "gazetteer_loc", "response_cache_loc", "response_cache_size", "metrics_loc", "metrics_interval", "profile_sample_rate", "profiler", "profile_loc", "log_level", "log_loc", "log_queue"]
+# keys config.json has always had to set, every other key is optional and keeps its default when left out
+REQUIRED_KEYS = ["file_loc", "save_loc", "location_col_name", "geocode_col_name", "use_memo", "user_agents", "memo_save_counter", "geocode_timeout", "use_autocorrect"]
+
 class Config:
     file_loc = None
     save_loc = None
@@ -8,37 +12,82 @@ class Config:
     geocode_col_name = None
     use_memo = True
     use_autocorrect = False
-    memo_save_counter = None
-    default_memo_save_counter = None
+    memo_save_counter = 100
+    default_memo_save_counter = 100
     initialized = False
     user_agents = None
     current_agent = 0
     geocode_timeout = 15
+    deduplicate = False
+    use_memo_journal = False
+    memo_journal_sync_every = 100
+    memo_compact_every = 50000
+    memo_backend = "json"
+    memo_db_loc = "memo.db"
+    unknown_ttl_days = None
+    unknown_max_entries = None
+    retry_expired_unknowns = False
+    geocode_domain = "nominatim.openstreetmap.org"
+    geocode_scheme = "https"
+    geocode_min_delay = 1
+    geocode_rate_limits = {}
+    geocode_burst = 1
+    geocode_max_retries = 3
+    geocode_backoff = 1
+    geocode_backoff_max = 60
+    use_async = False
+    async_concurrency = 10
+    use_sharding = False
+    chunk_size = None
+    incremental = False
+    incremental_key_col = None
+    retry_unresolved = False
+    correction_cache_size = 100000
+    persist_corrections = False
+    correction_cache_loc = "corrections.json"
+    correction_workers = 0
+    canonicalize = False
+    use_fuzzy_match = False
+    fuzzy_max_distance = 2
+    fuzzy_min_confidence = 0.8
+    gazetteer_loc = None
+    response_cache_loc = None
+    response_cache_size = 1024
+    metrics_loc = None
+    metrics_interval = 30
+    profile_sample_rate = 0
+    profiler = "cprofile"
+    profile_loc = "locate.prof"
+    log_level = "DEBUG"
+    log_loc = None
+    log_queue = False
 
     @staticmethod
-    def load():
-        config = None
-        if Config.initialized:
+    def load(config:dict|None=None):
+        # a config passed in directly replaces config.json, keys it leaves out keep their current values
+        from_file = config is None
+        if Config.initialized and from_file:
             return
 
         Config.initialized = True
-        try:
-            with open('config.json') as config_file:
-                config = json.load(config_file)
-                logging.info("config successfully loaded")
-        except:
-            message = "Could not find config.json in root of directory. Please make sure it is created and in the correct location. See README.md for more information."
-            logging.error(message)
-            FileNotFoundError(message)
-            return
+        if from_file:
+            try:
+                with open('config.json') as config_file:
+                    config = json.load(config_file)
+                    logging.info("config successfully loaded")
+            except:
+                message = "Could not find config.json in root of directory. Please make sure it is created and in the correct location. See README.md for more information."
+                logging.error(message)
+                FileNotFoundError(message)
+                return
         
         if config is None:
             return
 
         Config.current_agent = 0
-        config_keys = ["file_loc", "save_loc", "location_col_name", "geocode_col_name", "use_memo", "user_agents", "memo_save_counter", "geocode_timeout", "use_autocorrect"]
-        for key in config_keys:
-            Config.loadKey(config, key)
+        for key in CONFIG_KEYS:
+            if from_file or key in config:
+                Config.loadKey(config, key)
         Config.default_memo_save_counter = Config.memo_save_counter
     
     @staticmethod
@@ -46,10 +95,13 @@ class Config:
         try:
             getattr(Config, key)
         except:
-            logging.warn(f"Unknown key {key}")
+            logging.warning(f"Unknown key {key}")
             return
         
         if key not in config:
+            if key not in REQUIRED_KEYS:
+                logging.debug(f"{key} not set in config.json, using \"{getattr(Config, key)}\"")
+                return
             message = f"{key} key not found in config.json"
             logging.error(message)
             KeyError(message)
@@ -58,6 +110,16 @@ class Config:
             logging.debug(f"loaded {key} from config.json as \"{getattr(Config, key)}\"")
 
     @staticmethod
+    def toDict() -> dict:
+        # the loaded settings as a config dict, for handing to Config.load in another process
+        config = {key: getattr(Config, key) for key in CONFIG_KEYS}
+        config["memo_save_counter"] = Config.default_memo_save_counter
+        return config
+
+    @staticmethod
+    def getUserAgents() -> list[str]:
+        return Config.user_agents or []
+    @staticmethod
     def getNextUserAgent() -> str | None:
         agent = None
         
@@ -85,6 +147,33 @@ class Config:
     def getUseAutocorrect() -> bool:
         return Config.use_autocorrect
     @staticmethod
+    def getDeduplicate() -> bool:
+        return Config.deduplicate
+    @staticmethod
+    def getUseMemoJournal() -> bool:
+        return Config.use_memo_journal
+    @staticmethod
+    def getMemoJournalSyncEvery() -> int:
+        return Config.memo_journal_sync_every
+    @staticmethod
+    def getMemoCompactEvery() -> int:
+        return Config.memo_compact_every
+    @staticmethod
+    def getMemoBackend() -> str:
+        return Config.memo_backend
+    @staticmethod
+    def getMemoDBLoc() -> str:
+        return Config.memo_db_loc
+    @staticmethod
+    def getUnknownTTLDays() -> float | None:
+        return Config.unknown_ttl_days
+    @staticmethod
+    def getUnknownMaxEntries() -> int | None:
+        return Config.unknown_max_entries
+    @staticmethod
+    def getRetryExpiredUnknowns() -> bool:
+        return Config.retry_expired_unknowns
+    @staticmethod
     def getFileLoc() -> str | None:
         return Config.file_loc
     @staticmethod
@@ -99,6 +188,108 @@ class Config:
     @staticmethod
     def getGeocodeTimeout() -> int:
         return Config.geocode_timeout
+    @staticmethod
+    def getGeocodeDomain() -> str:
+        return Config.geocode_domain
+    @staticmethod
+    def getGeocodeScheme() -> str:
+        return Config.geocode_scheme
+    @staticmethod
+    def getGeocodeMinDelay() -> float:
+        return Config.geocode_min_delay
+    @staticmethod
+    def getGeocodeRateLimits() -> dict[str, float]:
+        return Config.geocode_rate_limits
+    @staticmethod
+    def getGeocodeBurst() -> int:
+        return Config.geocode_burst
+    @staticmethod
+    def getGeocodeMaxRetries() -> int:
+        return Config.geocode_max_retries
+    @staticmethod
+    def getGeocodeBackoff() -> float:
+        return Config.geocode_backoff
+    @staticmethod
+    def getGeocodeBackoffMax() -> float:
+        return Config.geocode_backoff_max
+    @staticmethod
+    def getUseAsync() -> bool:
+        return Config.use_async
+    @staticmethod
+    def getAsyncConcurrency() -> int:
+        return Config.async_concurrency
+    @staticmethod
+    def getUseSharding() -> bool:
+        return Config.use_sharding
+    @staticmethod
+    def getChunkSize() -> int | None:
+        return Config.chunk_size
+    @staticmethod
+    def getIncremental() -> bool:
+        return Config.incremental
+    @staticmethod
+    def getIncrementalKeyCol() -> str | None:
+        return Config.incremental_key_col
+    @staticmethod
+    def getRetryUnresolved() -> bool:
+        return Config.retry_unresolved
+    @staticmethod
+    def getCorrectionCacheSize() -> int:
+        return Config.correction_cache_size
+    @staticmethod
+    def getPersistCorrections() -> bool:
+        return Config.persist_corrections
+    @staticmethod
+    def getCorrectionCacheLoc() -> str:
+        return Config.correction_cache_loc
+    @staticmethod
+    def getCorrectionWorkers() -> int:
+        return Config.correction_workers
+    @staticmethod
+    def getCanonicalize() -> bool:
+        return Config.canonicalize
+    @staticmethod
+    def getUseFuzzyMatch() -> bool:
+        return Config.use_fuzzy_match
+    @staticmethod
+    def getFuzzyMaxDistance() -> int:
+        return Config.fuzzy_max_distance
+    @staticmethod
+    def getFuzzyMinConfidence() -> float:
+        return Config.fuzzy_min_confidence
+    @staticmethod
+    def getGazetteerLoc() -> str | None:
+        return Config.gazetteer_loc
+    @staticmethod
+    def getResponseCacheLoc() -> str | None:
+        return Config.response_cache_loc
+    @staticmethod
+    def getResponseCacheSize() -> float:
+        return Config.response_cache_size
+    @staticmethod
+    def getMetricsLoc() -> str | None:
+        return Config.metrics_loc
+    @staticmethod
+    def getMetricsInterval() -> float:
+        return Config.metrics_interval
+    @staticmethod
+    def getProfileSampleRate() -> float:
+        return Config.profile_sample_rate
+    @staticmethod
+    def getProfiler() -> str:
+        return Config.profiler
+    @staticmethod
+    def getProfileLoc() -> str:
+        return Config.profile_loc
+    @staticmethod
+    def getLogLevel() -> str:
+        return Config.log_level
+    @staticmethod
+    def getLogLoc() -> str | None:
+        return Config.log_loc
+    @staticmethod
+    def getLogQueue() -> bool:
+        return Config.log_queue
     
     @staticmethod
     def decrementMemoSaveCounter() -> None:
@@ -113,5 +304,5 @@ class Config:
             return False
         return True
     @staticmethod
-    def getDefaultMemoSaveCounter() -> int | None:
+    def getDefaultMemoSaveCounter() -> int:
         return Config.default_memo_save_counter
\ No newline at end of file
@@ -0,0 +1,114 @@
+import logging
+from typing import Iterable
+
+from utils.canonical import PART_REGEX, peelRegions
+from utils.config import Config
+
+# only the first characters of a name are used for deletes, the same trade-off SymSpell makes to keep the index small
+PREFIX_LENGTH = 7
+
+class FuzzyMatcher:
+    enabled = False
+    max_distance = 2
+    min_confidence = 0.8
+    # known name -> its place and the state/country parts after it, see split
+    names:dict[str, tuple[str, tuple[str, ...]]] = {}
+    deletes:dict[str, set[str]] = {}
+
+    @staticmethod
+    def load(names:Iterable[str]):
+        FuzzyMatcher.enabled = True
+        FuzzyMatcher.max_distance = Config.getFuzzyMaxDistance()
+        FuzzyMatcher.min_confidence = Config.getFuzzyMinConfidence()
+        FuzzyMatcher.names = {}
+        FuzzyMatcher.deletes = {}
+        for name in names:
+            FuzzyMatcher.add(name)
+        logging.info(f"Fuzzy matcher indexed {len(FuzzyMatcher.names)} known names into {len(FuzzyMatcher.deletes)} deletes")
+
+    @staticmethod
+    def add(name:str):
+        if name in FuzzyMatcher.names:
+            return
+        place, qualifiers = FuzzyMatcher.split(name)
+        FuzzyMatcher.names[name] = (place, qualifiers)
+        for delete in FuzzyMatcher._deletes(place[:PREFIX_LENGTH], FuzzyMatcher.max_distance):
+            FuzzyMatcher.deletes.setdefault(delete, set()).add(name)
+
+    @staticmethod
+    def split(name:str) -> tuple[str, tuple[str, ...]]:
+        # "springfield, il" is the place "springfield" and the qualifier "il". Only the place is matched fuzzily, two edits to a
+        # qualifier turn one real state into another. A state or country written without a comma ("columbus oh usa") is a qualifier too
+        parts = [" ".join(part.split()) for part in PART_REGEX.split(name)]
+        parts = [part for part in parts if part]
+        if len(parts) == 0:
+            return "", ()
+        place, regions = peelRegions(parts[0].split(" "))
+        return " ".join(place), (*regions, *parts[1:])
+
+    @staticmethod
+    def _deletes(word:str, distance:int) -> set[str]:
+        deletes = {word}
+        edge = {word}
+        for _ in range(distance):
+            edge = {candidate[:i] + candidate[i + 1:] for candidate in edge for i in range(len(candidate))}
+            deletes |= edge
+        return deletes
+
+    @staticmethod
+    def allowedDistance(query:str) -> int:
+        # short names are too easy to turn into other real places with a single edit
+        return min(FuzzyMatcher.max_distance, len(query) // 4)
+
+    @staticmethod
+    def match(query:str) -> tuple[str, int] | None:
+        # the known name whose place is within the allowed distance of the query's and whose state/country parts are the same,
+        # if the match is confident enough to be used
+        if not FuzzyMatcher.enabled:
+            return None
+        if query in FuzzyMatcher.names:
+            return query, 0
+        place, qualifiers = FuzzyMatcher.split(query)
+        allowed = FuzzyMatcher.allowedDistance(place)
+        if allowed == 0:
+            return None
+
+        candidates = set()
+        for delete in FuzzyMatcher._deletes(place[:PREFIX_LENGTH], allowed):
+            candidates |= FuzzyMatcher.deletes.get(delete, set())
+
+        best, best_distance, ambiguous = None, allowed + 1, False
+        for candidate in candidates:
+            candidate_place, candidate_qualifiers = FuzzyMatcher.names[candidate]
+            if candidate_qualifiers != qualifiers or abs(len(candidate_place) - len(place)) > allowed:
+                continue
+            distance = FuzzyMatcher.distance(place, candidate_place, best_distance)
+            if distance < best_distance:
+                best, best_distance, ambiguous = candidate, distance, False
+            elif distance == best_distance:
+                ambiguous = True
+        if best is None or ambiguous or FuzzyMatcher.confidence(query, best_distance) < FuzzyMatcher.min_confidence:
+            return None
+        return best, best_distance
+
+    @staticmethod
+    def confidence(query:str, distance:int) -> float:
+        place, _ = FuzzyMatcher.split(query)
+        return 1.0 - distance / max(len(place), 1)
+
+    @staticmethod
+    def distance(a:str, b:str, limit:int) -> int:
+        # optimal string alignment distance, giving up once every alignment is past limit
+        previous_previous = None
+        previous = list(range(len(b) + 1))
+        for i in range(1, len(a) + 1):
+            current = [i] + [0] * len(b)
+            for j in range(1, len(b) + 1):
+                cost = 0 if a[i - 1] == b[j - 1] else 1
+                current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+                if previous_previous is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                    current[j] = min(current[j], previous_previous[j - 2] + 1)
+            if min(current) > limit:
+                return limit + 1
+            previous_previous, previous = previous, current
+        return previous[len(b)]
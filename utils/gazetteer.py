@@ -0,0 +1,323 @@
+import argparse
+import csv
+import functools
+import hashlib
+import heapq
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+from array import array
+from typing import Iterator
+import numpy as np
+
+from utils.config import Config
+
+# GeoNames dump columns, see https://download.geonames.org/export/dump/readme.txt
+NAME, ASCII_NAME, ALTERNATE_NAMES, LATITUDE, LONGITUDE, FEATURE_CLASS, FEATURE_CODE, COUNTRY_CODE, ADMIN1_CODE, ADMIN2_CODE, POPULATION = 1, 2, 3, 4, 5, 6, 7, 8, 10, 11, 14
+COUNTRY_CODES = ("PCLI", "PCLD", "PCLF", "PCLS", "PCL")
+PUNCTUATION_REGEX = re.compile(r"[^\w\s,]")
+SPACE_REGEX = re.compile(r"\s+")
+
+
+def normalize(query:str) -> str:
+    query = PUNCTUATION_REGEX.sub("", query.lower())
+    parts = [SPACE_REGEX.sub(" ", part).strip() for part in query.split(",")]
+    return ", ".join(part for part in parts if part)
+
+
+# keys sorted in memory at a time while building, each sorted run is written to disk and the runs are merged into the index
+KEYS_PER_RUN = 1000000
+# values of each column held in memory at a time while writing the index
+ROWS_PER_WRITE = 100000
+
+
+@functools.lru_cache(maxsize=65536)
+def normalizeQualifier(part:str) -> str:
+    # the same few thousand states, countries and codes qualify every place in a dump
+    return normalize(part)
+
+
+def keyHash(key:bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+def writeBlob(path_prefix:str, values:list[bytes]):
+    # variable length values as one byte array and the offsets into it, so nothing is padded to the longest value
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in values], dtype=np.int64)
+    np.save(f"{path_prefix}_offsets.npy", offsets)
+    np.save(f"{path_prefix}.npy", np.frombuffer(b"".join(values), dtype=np.uint8))
+
+
+class Gazetteer:
+    enabled = False
+    # sorted hashes of every key, with the entry each one names and the key itself as offsets into one byte array to rule out collisions
+    hashes = None
+    entries = None
+    keys = None
+    key_offsets = None
+    latitudes = None
+    longitudes = None
+    populations = None
+    fields = None
+    strings = None
+    string_offsets = None
+
+    @staticmethod
+    def load(index_dir:str|None=None):
+        index_dir = index_dir or Config.getGazetteerLoc()
+        try:
+            # the arrays stay on disk and are paged in as lookups touch them
+            Gazetteer.hashes = np.load(os.path.join(index_dir, "hashes.npy"), mmap_mode='r')
+            Gazetteer.entries = np.load(os.path.join(index_dir, "entries.npy"), mmap_mode='r')
+            Gazetteer.keys = np.load(os.path.join(index_dir, "keys.npy"), mmap_mode='r')
+            Gazetteer.key_offsets = np.load(os.path.join(index_dir, "keys_offsets.npy"), mmap_mode='r')
+            Gazetteer.latitudes = np.load(os.path.join(index_dir, "latitudes.npy"), mmap_mode='r')
+            Gazetteer.longitudes = np.load(os.path.join(index_dir, "longitudes.npy"), mmap_mode='r')
+            Gazetteer.populations = np.load(os.path.join(index_dir, "populations.npy"), mmap_mode='r')
+            Gazetteer.fields = np.load(os.path.join(index_dir, "fields.npy"), mmap_mode='r')
+            Gazetteer.strings = np.load(os.path.join(index_dir, "strings.npy"), mmap_mode='r')
+            Gazetteer.string_offsets = np.load(os.path.join(index_dir, "strings_offsets.npy"), mmap_mode='r')
+        except FileNotFoundError:
+            logging.error(f"Could not find a gazetteer index in {index_dir}, or it was built by an older version. Build one with python -m utils.gazetteer")
+            return
+        Gazetteer.enabled = True
+        logging.info(f"Gazetteer loaded from {index_dir} with {len(Gazetteer.hashes)} keys for {len(Gazetteer.latitudes)} places")
+
+    @staticmethod
+    def search(query:str) -> dict | None:
+        if not Gazetteer.enabled:
+            return None
+        key = normalize(query).encode('utf-8')
+        if len(key) == 0:
+            return None
+        hash = np.uint64(keyHash(key))
+        start = int(np.searchsorted(Gazetteer.hashes, hash, side='left'))
+        end = int(np.searchsorted(Gazetteer.hashes, hash, side='right'))
+        candidates = [int(Gazetteer.entries[i]) for i in range(start, end) if Gazetteer.key(i) == key]
+        if len(candidates) == 0:
+            return None
+        # several places can share a key (every Springfield in the US), so take the most populous one
+        entry = max(candidates, key=lambda candidate: Gazetteer.populations[candidate])
+        return Gazetteer.format(entry)
+
+    @staticmethod
+    def key(index:int) -> bytes:
+        return Gazetteer.keys[Gazetteer.key_offsets[index]:Gazetteer.key_offsets[index + 1]].tobytes()
+
+    @staticmethod
+    def string(id:int) -> str:
+        return Gazetteer.strings[Gazetteer.string_offsets[id]:Gazetteer.string_offsets[id + 1]].tobytes().decode('utf-8')
+
+    @staticmethod
+    def format(entry:int) -> dict:
+        # the same shape Memo.memoFormat produces from a Nominatim result
+        city, county, state, country = (Gazetteer.string(id) for id in Gazetteer.fields[entry])
+        return {
+            "display_name": ", ".join(part for part in (city, county, state, country) if part != "NA"),
+            "city": city,
+            "county": county,
+            "state": state,
+            "country": country,
+            "street": "NA",
+            "zip": "NA",
+            "building": "NA",
+            "house_number": "NA",
+            "latitude": f"{Gazetteer.latitudes[entry]}",
+            "longitude": f"{Gazetteer.longitudes[entry]}",
+        }
+
+    @staticmethod
+    def readDump(dump_loc:str) -> Iterator[list[str]]:
+        with open(dump_loc, 'r', encoding='utf-8') as dump_file:
+            for row in csv.reader(dump_file, delimiter='\t', quoting=csv.QUOTE_NONE):
+                if row[FEATURE_CLASS] == 'P' or row[FEATURE_CODE] in ("ADM1", "ADM2") or row[FEATURE_CODE] in COUNTRY_CODES:
+                    yield row
+
+    @staticmethod
+    def placeKeys(row:list[str], country_code:str, admin1_code:str, state:str, country:str) -> set[bytes]:
+        names = {normalize(row[NAME]), normalize(row[ASCII_NAME])}
+        if row[FEATURE_CODE] in COUNTRY_CODES:
+            qualifiers = [[]]
+            # the ISO code is only used as a qualifier, on its own "ca" or "in" is far more often a US state than Canada or India
+            names.add(normalize(country))
+        elif row[FEATURE_CODE] == "ADM1":
+            qualifiers = [[], [country], [country_code]]
+        elif row[FEATURE_CODE] == "ADM2":
+            qualifiers = [[state], [state, country], [admin1_code], [admin1_code, country_code]]
+        else:
+            qualifiers = [[], [state], [admin1_code], [country], [country_code], [state, country], [admin1_code, country], [admin1_code, country_code], [state, country_code]]
+        normalized = {part: normalizeQualifier(part) for qualifier in qualifiers for part in qualifier if part and part != "NA"}
+        keys = set()
+        for qualifier in qualifiers:
+            parts = [normalized[part] for part in qualifier if part in normalized]
+            if len(parts) < len(qualifier):
+                continue
+            suffix = "".join(f", {part}" for part in parts)
+            for name in names:
+                if len(name) > 0:
+                    keys.add(f"{name}{suffix}".encode('utf-8'))
+        return keys
+
+    @staticmethod
+    def build(dump_loc:str, index_dir:str, admin1_loc:str|None=None, country_info_loc:str|None=None):
+        # the dump is read twice and never held in memory: once for the state, county and country names, then once to index every place.
+        # Keys are sorted in runs of KEYS_PER_RUN and the runs merged, so memory stays bounded however large the dump is
+        csv.field_size_limit(sys.maxsize)
+        admin1_names, admin2_names, country_names = {}, {}, {}
+        if admin1_loc is not None:
+            with open(admin1_loc, 'r', encoding='utf-8') as admin1_file:
+                for row in csv.reader(admin1_file, delimiter='\t', quoting=csv.QUOTE_NONE):
+                    if len(row) > 1:
+                        admin1_names[row[0]] = row[1]
+        if country_info_loc is not None:
+            with open(country_info_loc, 'r', encoding='utf-8') as country_file:
+                for row in csv.reader(country_file, delimiter='\t', quoting=csv.QUOTE_NONE):
+                    if len(row) > 4 and not row[0].startswith('#'):
+                        country_names[row[0]] = row[4]
+        for row in Gazetteer.readDump(dump_loc):
+            if row[FEATURE_CODE] == "ADM1":
+                admin1_names.setdefault(f"{row[COUNTRY_CODE]}.{row[ADMIN1_CODE]}", row[NAME])
+            elif row[FEATURE_CODE] == "ADM2":
+                admin2_names.setdefault(f"{row[COUNTRY_CODE]}.{row[ADMIN1_CODE]}.{row[ADMIN2_CODE]}", row[NAME])
+            elif row[FEATURE_CODE] in COUNTRY_CODES:
+                country_names.setdefault(row[COUNTRY_CODE], row[NAME])
+
+        os.makedirs(index_dir, exist_ok=True)
+        strings = {"NA": 0}
+        def intern(value:str) -> int:
+            return strings.setdefault(value or "NA", len(strings))
+
+        with tempfile.TemporaryDirectory(dir=index_dir) as work_dir:
+            columns = {name: open(os.path.join(work_dir, name), 'wb') for name in ("latitudes", "longitudes", "populations", "fields")}
+            latitudes, longitudes, populations, fields = array('d'), array('d'), array('q'), array('i')
+            def writeColumns():
+                for name, values in (("latitudes", latitudes), ("longitudes", longitudes), ("populations", populations), ("fields", fields)):
+                    values.tofile(columns[name])
+                    del values[:]
+
+            runs, run, places, key_count = [], [], 0, 0
+            for entry, row in enumerate(Gazetteer.readDump(dump_loc)):
+                country_code, admin1_code = row[COUNTRY_CODE], row[ADMIN1_CODE]
+                country = country_names.get(country_code, "NA")
+                state = admin1_names.get(f"{country_code}.{admin1_code}", "NA")
+                county = admin2_names.get(f"{country_code}.{admin1_code}.{row[ADMIN2_CODE]}", "NA")
+                if row[FEATURE_CODE] in COUNTRY_CODES:
+                    fields.extend((0, 0, 0, intern(country)))
+                elif row[FEATURE_CODE] == "ADM1":
+                    fields.extend((0, 0, intern(row[NAME]), intern(country)))
+                elif row[FEATURE_CODE] == "ADM2":
+                    fields.extend((0, intern(row[NAME]), intern(state), intern(country)))
+                else:
+                    fields.extend((intern(row[NAME]), intern(county), intern(state), intern(country)))
+                latitudes.append(float(row[LATITUDE]))
+                longitudes.append(float(row[LONGITUDE]))
+                populations.append(int(row[POPULATION] or 0))
+                places += 1
+                if len(latitudes) >= ROWS_PER_WRITE:
+                    writeColumns()
+
+                # a place's keys are deduplicated together and always land in the same run, so the merged runs hold no duplicates
+                run.extend((keyHash(key), key, entry) for key in Gazetteer.placeKeys(row, country_code, admin1_code, state, country))
+                if len(run) >= KEYS_PER_RUN:
+                    runs.append(Gazetteer.writeRun(run, os.path.join(work_dir, f"run{len(runs)}")))
+                    key_count += len(run)
+                    run = []
+            if len(run) > 0:
+                runs.append(Gazetteer.writeRun(run, os.path.join(work_dir, f"run{len(runs)}")))
+                key_count += len(run)
+            writeColumns()
+            for name, file in columns.items():
+                file.close()
+            Gazetteer.writeColumn(os.path.join(work_dir, "latitudes"), os.path.join(index_dir, "latitudes.npy"), np.float64, (places,))
+            Gazetteer.writeColumn(os.path.join(work_dir, "longitudes"), os.path.join(index_dir, "longitudes.npy"), np.float64, (places,))
+            Gazetteer.writeColumn(os.path.join(work_dir, "populations"), os.path.join(index_dir, "populations.npy"), np.int64, (places,))
+            Gazetteer.writeColumn(os.path.join(work_dir, "fields"), os.path.join(index_dir, "fields.npy"), np.int32, (places, 4))
+            Gazetteer.mergeRuns(runs, index_dir, key_count)
+
+        writeBlob(os.path.join(index_dir, "strings"), [string.encode('utf-8') for string in strings])
+        with open(os.path.join(index_dir, "source.json"), 'w') as source_file:
+            json.dump({"dump": dump_loc, "admin1": admin1_loc, "country_info": country_info_loc, "places": places, "keys": key_count}, source_file)
+        message = f"Built gazetteer index in {index_dir} with {key_count} keys for {places} places from {dump_loc}"
+        logging.info(message)
+        print(message)
+
+    @staticmethod
+    def writeRun(run:list[tuple[int, bytes, int]], path_prefix:str) -> str:
+        run.sort()
+        np.save(f"{path_prefix}_hashes.npy", np.array([hash for hash, _, _ in run], dtype=np.uint64))
+        np.save(f"{path_prefix}_entries.npy", np.array([entry for _, _, entry in run], dtype=np.int32))
+        writeBlob(f"{path_prefix}_keys", [key for _, key, _ in run])
+        return path_prefix
+
+    @staticmethod
+    def readRun(path_prefix:str) -> Iterator[tuple[int, bytes, int]]:
+        hashes = np.load(f"{path_prefix}_hashes.npy", mmap_mode='r')
+        entries = np.load(f"{path_prefix}_entries.npy", mmap_mode='r')
+        keys = np.load(f"{path_prefix}_keys.npy", mmap_mode='r')
+        offsets = np.load(f"{path_prefix}_keys_offsets.npy", mmap_mode='r')
+        # read a block at a time, so merging many runs only holds one block of each in memory
+        for start in range(0, len(hashes), ROWS_PER_WRITE):
+            end = min(start + ROWS_PER_WRITE, len(hashes))
+            block = keys[offsets[start]:offsets[end]].tobytes()
+            block_offsets = (offsets[start:end + 1] - offsets[start]).tolist()
+            for i, (hash, entry) in enumerate(zip(hashes[start:end].tolist(), entries[start:end].tolist())):
+                yield hash, block[block_offsets[i]:block_offsets[i + 1]], entry
+
+    @staticmethod
+    def mergeRuns(runs:list[str], index_dir:str, key_count:int):
+        # the sorted runs are merged straight into the index files, a batch at a time
+        blob_size = sum(int(np.load(f"{run}_keys_offsets.npy", mmap_mode='r')[-1]) for run in runs)
+        hashes = np.lib.format.open_memmap(os.path.join(index_dir, "hashes.npy"), mode='w+', dtype=np.uint64, shape=(key_count,))
+        entries = np.lib.format.open_memmap(os.path.join(index_dir, "entries.npy"), mode='w+', dtype=np.int32, shape=(key_count,))
+        offsets = np.lib.format.open_memmap(os.path.join(index_dir, "keys_offsets.npy"), mode='w+', dtype=np.int64, shape=(key_count + 1,))
+        keys = np.lib.format.open_memmap(os.path.join(index_dir, "keys.npy"), mode='w+', dtype=np.uint8, shape=(blob_size,))
+        offsets[0] = 0
+        index, position = 0, 0
+        batch_hashes, batch_entries, batch_keys = [], [], []
+        def writeBatch():
+            nonlocal index, position
+            count = len(batch_hashes)
+            hashes[index:index + count] = batch_hashes
+            entries[index:index + count] = batch_entries
+            lengths = np.cumsum([len(key) for key in batch_keys], dtype=np.int64)
+            offsets[index + 1:index + count + 1] = position + lengths
+            blob = b"".join(batch_keys)
+            keys[position:position + len(blob)] = np.frombuffer(blob, dtype=np.uint8)
+            index, position = index + count, position + len(blob)
+            batch_hashes.clear(), batch_entries.clear(), batch_keys.clear()
+        for hash, key, entry in heapq.merge(*(Gazetteer.readRun(run) for run in runs)):
+            batch_hashes.append(hash)
+            batch_entries.append(entry)
+            batch_keys.append(key)
+            if len(batch_hashes) >= ROWS_PER_WRITE:
+                writeBatch()
+        if len(batch_hashes) > 0:
+            writeBatch()
+        for array_file in (hashes, entries, offsets, keys):
+            array_file.flush()
+        del hashes, entries, offsets, keys
+
+    @staticmethod
+    def writeColumn(raw_loc:str, npy_loc:str, dtype, shape:tuple):
+        # copied from the raw file a slice at a time
+        column = np.lib.format.open_memmap(npy_loc, mode='w+', dtype=dtype, shape=shape)
+        flat = column.reshape(-1)
+        raw = np.memmap(raw_loc, dtype=dtype, mode='r', shape=flat.shape) if flat.size > 0 else flat
+        for start in range(0, flat.size, ROWS_PER_WRITE):
+            flat[start:start + ROWS_PER_WRITE] = raw[start:start + ROWS_PER_WRITE]
+        column.flush()
+        del column, flat, raw
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build an offline gazetteer index from a GeoNames dump")
+    parser.add_argument("dump", help="GeoNames dump such as allCountries.txt or cities15000.txt")
+    parser.add_argument("index_dir", nargs="?", default="gazetteer", help="directory to write the index to")
+    parser.add_argument("--admin1", help="admin1CodesASCII.txt, for state names when the dump has no ADM1 rows")
+    parser.add_argument("--country-info", help="countryInfo.txt, for country names when the dump has no country rows")
+    args = parser.parse_args()
+    Gazetteer.build(args.dump, args.index_dir, args.admin1, args.country_info)
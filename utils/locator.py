@@ -1,127 +1,630 @@
+import json
 import logging
-from typing import Any, Coroutine
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Coroutine, Iterable
 from geopy.geocoders import Nominatim
-from geopy.extra.rate_limiter import RateLimiter
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
+from utils.async_geocoder import AsyncGeocoder
 from utils.autocorrect import Correcter
 
 from utils.config import Config
+from utils.fuzzy import FuzzyMatcher
+from utils.gazetteer import Gazetteer
+from utils.logs import Logs
 from utils.memo import Memo
+from utils.metrics import Metrics
+from utils.response_cache import GEOCODE_PARAMS, ResponseCache
+from utils.scheduler import GeocodeRejected, GeocodeUnavailable, Scheduler
+from utils.shards import mergeDeltas, shardOf
+from utils.sqlite_memo import SQLiteMemo
+
+# memo fields copied into the output, in column order after the location column
+RESULT_FIELDS = ("latitude", "longitude", "state", "country", "city", "county", "zip", "street", "building", "house_number")
+# counted for each pass, and summed across shard workers
+COUNTERS = ("geolocated", "memolocated", "not_located", "failed", "cached", "canonicallocated", "skipped", "gazetteerlocated", "geolocated_rows", "memolocated_rows", "gazetteerlocated_rows", "not_located_rows", "failed_rows")
+
+_shard_locator = None
+
+def _initShardWorker(config:dict, agent:str, log_queue, log_level:int):
+    # each worker process geocodes with one agent for as long as the Locator runs, keeping its memo copy, session and caches between rounds
+    global _shard_locator
+    Logs.setupWorker(log_queue, log_level)
+    _shard_locator = Locator({**config, "user_agents": [agent], "profile_sample_rate": 0}, shard=True)
+
+def _locateShard(keys:list[tuple[str, int]], shared:list) -> tuple[list, dict, list, tuple]:
+    return _shard_locator._locateShard(keys, shared)
 
 
 class Locator:
-    def __init__(self) -> None:
-        self.config = Config.load()
+    def __init__(self, config:dict|None=None, shard:bool=False) -> None:
+        self.config = Config.load(config)
         self.user_agent = Config.getNextUserAgent()
+        # worker processes of a sharded run, one per agent, and the merged memo entries they haven't been sent yet
+        self.shards = None
+        self.shared = []
 
         self.memolocated = 0
         self.geolocated = 0
         self.not_located = 0
+        self._resetCounters()
+        self.prefetched = {}
+        self.prefetch_rejected = set()
+        self.request_seconds = 0.0
+        self.geocoders = {}
+        self.locations = None
+        self.source = None
+        Metrics.load(shard=shard)
         
         self._loadGeocode(self.user_agent)
-        self._loadLocations()
 
+        self.memo = SQLiteMemo if Config.getMemoBackend() == "sqlite" else Memo
         if Config.getUseMemo():
-            Memo.load()
+            self.memo.load(shard=shard)
+            if Config.getUseFuzzyMatch():
+                FuzzyMatcher.load(self.memo.knownNames())
         if Config.getUseAutocorrect():
             Correcter.load()
+        if Config.getGazetteerLoc() is not None:
+            Gazetteer.load()
+        ResponseCache.load(shared=shard)
     
-    def _loadLocations(self):
-        self.locations = pd.read_csv(filepath_or_buffer=Config.getFileLoc())
-        self.geocoded_locations = pd.DataFrame(data=[], columns=[Config.getLocationColName(), "latitude", "longitude", "state", "country", "city"])
+    def _setLocations(self, locations:pd.DataFrame, column:str|None=None):
+        self.locations = locations
+        self.location_column = column or Config.getLocationColName()
+        self.result_columns = [self.location_column, *RESULT_FIELDS]
+        # every row starts out unresolved and each agent pass fills in what it can
+        self.geocoded_locations = pd.DataFrame(data="?", index=self.locations.index, columns=self.result_columns)
 
     def _loadGeocode(self, agent:str):
-        geolocator = Nominatim(
-            user_agent=agent,
-        )
-        self.geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1)
+        # one geocoder per agent for the life of the Locator, so repeated batches keep their sessions. Request pacing is shared per endpoint by Scheduler
+        if agent not in self.geocoders:
+            self.geocoders[agent] = Nominatim(
+                user_agent=agent,
+                domain=Config.getGeocodeDomain(),
+                scheme=Config.getGeocodeScheme(),
+            )
+        self.geolocator = self.geocoders[agent]
+
+    def _request(self, *args, **kwargs):
+        # time spent on the wire, so the rest of a Scheduler call can be attributed to waiting
+        start = time.perf_counter()
+        try:
+            return self.geolocator.geocode(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            self.request_seconds += seconds
+            Metrics.observe("geocode_request", seconds)
 
     def _runNextAgent(self):
         self._resetCounters()
         self.user_agent = Config.getNextUserAgent()
         self._loadGeocode(self.user_agent)
         
-        message = f"Starting location searches on {Config.getFileLoc()} with {self.user_agent}"
+        pending = self._pendingRows()
+        locations = self.locations.loc[pending]
+        message = f"Starting location searches on {self.source} with {self.user_agent} for {len(pending)}/{len(self.locations)} unresolved rows"
         logging.info(message)
         print(message)
+
+        if Config.getUseAutocorrect() and Config.getCorrectionWorkers() > 0:
+            self._precorrect(locations)
+
+        if Config.getUseAsync():
+            self._prefetch(self._locationKeys(locations))
         
-        self.geocoded_locations[[Config.getLocationColName(), "latitude", "longitude", "state", "country", "city"]] = pd.DataFrame.progress_apply(self.locations, axis=1, func=self._locateRow)
+        if Config.getDeduplicate():
+            results = self._locateDistinct(locations)
+        else:
+            results = self._locateRows(locations)
+        self._storeResults(pending, results)
+        self._report(self.user_agent)
+        self.prefetched, self.prefetch_rejected = {}, set()
+        ResponseCache.save()
 
-        message = f"Finished location searches on {Config.getFileLoc()} with {self.user_agent}\n\tGeolocated {self.geolocated}/{self._getTotalCount()} locations\n\tFound {self.memolocated}/{self._getTotalCount()} locations from memory\n\tUnable to find {self.not_located}/{self._getTotalCount()} locations"
+    def _prefetch(self, keys:Iterable[str]):
+        prefetcher = AsyncGeocoder(self.user_agent, self.memo)
+        self.prefetched = prefetcher.prefetch(keys)
+        self.prefetch_rejected = prefetcher.rejected
+
+    def _storeResults(self, pending:pd.Index, results:dict):
+        if len(pending) == len(self.geocoded_locations):
+            # nothing was resolved before this pass, so the output frame is built once from the columns
+            self.geocoded_locations = pd.DataFrame(results, index=pending, columns=self.result_columns)
+        elif len(pending) > 0:
+            for column in self.result_columns:
+                self.geocoded_locations.loc[pending, column] = results[column]
+
+    def _report(self, agents:str):
+        message = f"Finished location searches on {self.source} with {agents}\n\tGeolocated {self.geolocated}/{self._getTotalCount()} locations\n\tFound {self.memolocated}/{self._getTotalCount()} locations from memory\n\tUnable to find {self.not_located}/{self._getTotalCount()} locations"
+        if Config.getDeduplicate():
+            message = f"Finished location searches on {self.source} with {agents}\n\tGeolocated {self.geolocated}/{self._getTotalCount()} distinct locations ({self.geolocated_rows}/{self._getTotalRowCount()} rows)\n\tFound {self.memolocated}/{self._getTotalCount()} distinct locations from memory ({self.memolocated_rows}/{self._getTotalRowCount()} rows)\n\tUnable to find {self.not_located}/{self._getTotalCount()} distinct locations ({self.not_located_rows}/{self._getTotalRowCount()} rows)"
+        if Gazetteer.enabled:
+            message += f"\n\tFound {self.gazetteerlocated}/{self._getTotalCount()} locations in the offline gazetteer"
+        if Config.getCanonicalize():
+            message += f"\n\tMatched {self.canonicallocated} locations to a known spelling instead of geocoding them"
+        if self.skipped > 0:
+            message += f"\n\tSkipped {self.skipped} geocodes of locations {agents} could not find before"
+        if ResponseCache.enabled:
+            message += f"\n\tServed {self.cached} geocodes from the response cache"
+        if self.failed > 0:
+            message += f"\n\tCould not reach the geocoder for {self.failed}/{self._getTotalCount()} locations, they were left unresolved"
         logging.info(message)
         print(message)
 
+    def _precorrect(self, locations:pd.DataFrame):
+        # only the locations _locate could go on to correct: the ones no memo lookup or the gazetteer can answer
+        keys = self._locationKeys(locations).dropna().unique()
+        if Config.getUseMemo():
+            keys = [key for key in keys if self.memo.search(key) is None]
+            if Config.getCanonicalize():
+                keys = [key for key in keys if self.memo.searchCanonical(key) is None]
+        if Gazetteer.enabled:
+            keys = [key for key in keys if Gazetteer.search(key) is None]
+        Correcter.precorrect(keys, Config.getCorrectionWorkers())
+
+    def _pendingRows(self) -> pd.Index:
+        return self.geocoded_locations.index[self.geocoded_locations["latitude"] == "?"]
+
+    def _locationKeys(self, locations:pd.DataFrame) -> pd.Series:
+        # the search strings locate() will see for each row
+        keys = locations[self.location_column].str.lower()
+        if Config.getDeduplicate():
+            keys = keys.str.strip()
+        return keys
+
+    def _emptyColumns(self, rows:int) -> dict[str, list]:
+        return {column: [None] * rows for column in self.result_columns}
+
+    def _store(self, columns:dict[str, list], row:int, result:tuple):
+        for column, value in zip(self.result_columns, result):
+            columns[column][row] = value
+
+    def _locateRows(self, locations:pd.DataFrame) -> dict[str, list]:
+        # results are written straight into one list per output column, the frame is built once by the caller
+        values = locations[self.location_column].to_numpy()
+        columns = self._emptyColumns(len(values))
+        for row, location in enumerate(tqdm(values, total=len(values), unit="row")):
+            self._store(columns, row, self.locate(location))
+        return columns
+
+    def _locateDistinct(self, locations:pd.DataFrame) -> dict[str, np.ndarray]:
+        # resolve each normalized location string once and broadcast the results back onto every row that contains it
+        keys = self._locationKeys(locations)
+        codes, uniques = pd.factorize(keys, use_na_sentinel=False)
+        counts = np.bincount(codes, minlength=len(uniques))
+        logging.info("Resolving %s distinct locations for %s rows", len(uniques), len(keys))
+
+        columns = self._emptyColumns(len(uniques))
+        for row, key in enumerate(tqdm(uniques, total=len(uniques), desc=f"{len(uniques)} distinct / {len(keys)} rows", unit="location")):
+            self._store(columns, row, self._locateCounted(key, int(counts[row])))
+
+        return {column: np.asarray(values, dtype=object)[codes] for column, values in columns.items()}
+
+    def _locateCounted(self, location:str, rows:int) -> tuple:
+        geolocated, memolocated, gazetteerlocated, not_located, failed = self.geolocated, self.memolocated, self.gazetteerlocated, self.not_located, self.failed
+        ret = self.locate(location)
+        self.geolocated_rows += (self.geolocated - geolocated) * rows
+        self.memolocated_rows += (self.memolocated - memolocated) * rows
+        self.gazetteerlocated_rows += (self.gazetteerlocated - gazetteerlocated) * rows
+        self.not_located_rows += (self.not_located - not_located) * rows
+        self.failed_rows += (self.failed - failed) * rows
+        return ret
+
+    def _runSharded(self):
+        # every agent resolves its own share of the distinct locations in its own process and at its own rate. Each round moves what a shard
+        # left unresolved on to the next agent, so like _runAllAgents every location is still tried by every agent until one finds it
+        agents = Config.getUserAgents()
+        if self.shards is None:
+            if Config.getUseMemo():
+                self.memo.share()
+            ResponseCache.save()
+            # spawned rather than forked so no worker inherits this process's open memo, cache or journal handles
+            context = multiprocessing.get_context("spawn")
+            config, log_queue, log_level = Config.toDict(), Logs.workerQueue(context), logging.getLogger().level
+            self.shards = [ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_initShardWorker, initargs=(config, agent, log_queue, log_level)) for agent in agents]
+
+        for round in range(len(agents)):
+            pending = self._pendingRows()
+            if len(pending) == 0:
+                logging.info("Every row has been resolved, skipping the remaining rounds")
+                break
+            self._resetCounters()
+            message = f"Starting location searches on {self.source} with {len(agents)} agents in parallel for {len(pending)}/{len(self.locations)} unresolved rows"
+            logging.info(message)
+            print(message)
+
+            keys = self._locationKeys(self.locations.loc[pending])
+            codes, uniques = pd.factorize(keys, use_na_sentinel=False)
+            counts = np.bincount(codes, minlength=len(uniques))
+            shards = [[] for _ in agents]
+            for index, key in enumerate(uniques):
+                shards[shardOf(key, round, len(agents))].append(index)
+            futures = [executor.submit(_locateShard, [(uniques[index], int(counts[index])) for index in shard], self.shared) for executor, shard in zip(self.shards, shards)]
+
+            columns = self._emptyColumns(len(uniques))
+            deltas = []
+            for shard, future in zip(shards, futures):
+                results, counters, delta, metrics = future.result()
+                Metrics.merge(*metrics)
+                for index, result in zip(shard, results):
+                    self._store(columns, index, result)
+                for counter, count in counters.items():
+                    setattr(self, counter, getattr(self, counter) + count)
+                deltas.append(delta)
+            if Config.getUseMemo():
+                self.shared = mergeDeltas(self.memo, deltas)
+                self._saveMemo()
+
+            self._storeResults(pending, {column: np.asarray(values, dtype=object)[codes] for column, values in columns.items()})
+            self._report(f"{len(agents)} agents")
+            Metrics.tick()
+
+    def _locateShard(self, keys:list[tuple[str, int]], shared:list) -> tuple[list, dict, list, tuple]:
+        # runs in a shard worker: catch up on what the other shards found, then resolve this worker's share of the distinct locations
+        if Config.getUseMemo():
+            self.memo.applyShared(shared)
+        self._resetCounters()
+        if Config.getUseAsync():
+            self._prefetch([key for key, _ in keys])
+        results = [self._locateCounted(key, rows) for key, rows in keys]
+        self.prefetched, self.prefetch_rejected = {}, set()
+        ResponseCache.save()
+        recorded = self.memo.takeRecorded() if Config.getUseMemo() else []
+        return results, {counter: getattr(self, counter) for counter in COUNTERS}, recorded, Metrics.take()
+
+    def _closeShards(self):
+        if self.shards is None:
+            return
+        for executor in self.shards:
+            executor.shutdown()
+        self.shards = None
+
     def _runAllAgents(self):
+        # each agent only gets the rows the agents before it could not resolve
         while Config.hasNextAgent():
+            if len(self._pendingRows()) == 0:
+                logging.info("Every row has been resolved, skipping the remaining user agents")
+                break
             self._runNextAgent()
             if Config.getUseMemo():
-                Memo.save()
-                Config.resetMemoSaveCounter()
+                self._saveMemo()
+            if Config.getUseAutocorrect():
+                Correcter.save()
 
     def run(self):
-        tqdm.pandas()
+        self.source = Config.getFileLoc()
+        if Config.getRetryExpiredUnknowns():
+            self.retryExpiredUnknowns()
+        elif Config.getIncremental():
+            self._runIncremental()
+        elif Config.getChunkSize() is not None:
+            self._runChunked()
+        else:
+            self._setLocations(pd.read_csv(filepath_or_buffer=Config.getFileLoc()))
+            self._resolveLocations()
+            self.geocoded_locations.to_csv(
+                path_or_buf=Config.getSaveLoc()
+            )
+
+        self._closeShards()
+        if Config.getUseMemo():
+            self.memo.close()
+        ResponseCache.close()
+        Metrics.close()
+        if Config.getUseAutocorrect():
+            Correcter.save()
+            Correcter.close()
+            logging.info("Autocorrect cache stats: %s", Correcter.stats())
+
+    def locateMany(self, locations:Iterable[str]|pd.Series|pd.DataFrame, column:str|None=None) -> pd.DataFrame:
+        # resolve a batch in memory, reusing the memo, geocoders and autocorrect caches loaded by this Locator.
+        # The result has one row per input row with the same index, the lowercased search string and RESULT_FIELDS
+        if isinstance(locations, pd.DataFrame):
+            column = column or Config.getLocationColName()
+            frame = locations[[column]]
+        else:
+            column = column or (locations.name if isinstance(locations, pd.Series) else None) or Config.getLocationColName() or "location"
+            frame = locations.to_frame(column) if isinstance(locations, pd.Series) else pd.DataFrame({column: list(locations)})
+        self.source = f"a batch of {len(frame)} rows"
+        self._setLocations(frame, column)
+        self._resolveLocations()
+        return self.geocoded_locations.copy()
+
+    def retryExpiredUnknowns(self) -> pd.DataFrame:
+        # re-query only the unknowns older than unknown_ttl_days, without reading file_loc, so refreshing the misses costs what the misses cost
+        names = self.memo.expiredUnknowns() if Config.getUseMemo() else []
+        self.source = f"{len(names)} expired unknown locations"
+        self._setLocations(pd.DataFrame({"location": names}), "location")
+        self._resolveLocations()
+        if Config.getUseMemo():
+            self._saveMemo()
+        return self.geocoded_locations.copy()
+
+    def close(self):
+        # flush what a long-lived Locator has cached, run() does this itself
+        self._closeShards()
+        if Config.getUseMemo():
+            self._saveMemo()
+            self.memo.close()
+        if Config.getUseAutocorrect():
+            Correcter.save()
+            Correcter.close()
+        ResponseCache.close()
+        Metrics.close()
+
+    def _resolveLocations(self):
         Config.resetCurrentAgent()
         
         self._resetCounters()
 
-        if Config.getUseMemo():
+        if Config.getUseSharding() and len(Config.getUserAgents()) > 1:
+            self._runSharded()
+        elif Config.getUseMemo():
             self._runAllAgents()
         else:
             self._runNextAgent()
-        
-        self.geocoded_locations.to_csv(
-            path_or_buf=Config.getSaveLoc()
-        )
+
+    def _runIncremental(self):
+        # rows whose key and search string match the previous save_loc keep its results, only new and changed rows (and, if asked, its "?" rows) are resolved
+        locations = pd.read_csv(filepath_or_buffer=Config.getFileLoc(), index_col=Config.getIncrementalKeyCol())
+        self.location_column = Config.getLocationColName()
+        previous = self._loadPreviousOutput(locations)
+        if previous is None:
+            reused = pd.Series(False, index=locations.index)
+        else:
+            # the output holds the search string each row was resolved with, so comparing it with the search string the row gives now fingerprints the row
+            keys = self._locationKeys(locations).fillna("")
+            previous = previous.reindex(locations.index.astype(str))
+            reused = pd.Series((previous[self.location_column] == keys.to_numpy()).to_numpy(), index=locations.index)
+            if Config.getRetryUnresolved():
+                reused &= (previous["latitude"] != "?").to_numpy()
+        message = f"Reusing {int(reused.sum())}/{len(locations)} rows from {Config.getSaveLoc()}, resolving {int((~reused).sum())} new or changed rows"
+        logging.info(message)
+        print(message)
+
+        self._setLocations(locations.loc[~reused.to_numpy()])
+        if len(self.locations) > 0:
+            self._resolveLocations()
+        output = pd.DataFrame(data="?", index=locations.index, columns=self.result_columns)
+        if previous is not None:
+            output.loc[reused.to_numpy()] = previous.loc[reused.to_numpy(), self.result_columns].to_numpy()
+        output.loc[self.geocoded_locations.index] = self.geocoded_locations
+        # written next to the previous output and swapped in, so an interrupted run never loses the results it was reusing
+        output.to_csv(path_or_buf=f"{Config.getSaveLoc()}.tmp")
+        os.replace(f"{Config.getSaveLoc()}.tmp", Config.getSaveLoc())
+
+    def _loadPreviousOutput(self, locations:pd.DataFrame) -> pd.DataFrame | None:
+        if not os.path.exists(Config.getSaveLoc()):
+            logging.info("No previous output at %s, every row will be resolved", Config.getSaveLoc())
+            return None
+        if not locations.index.is_unique:
+            logging.error("%s has repeated row keys, every row will be resolved", Config.getIncrementalKeyCol())
+            return None
+        # read as written, so "NA" fields and "?" rows come back unchanged
+        previous = pd.read_csv(filepath_or_buffer=Config.getSaveLoc(), index_col=0, dtype=str, keep_default_na=False)
+        missing = [column for column in (self.location_column, *RESULT_FIELDS) if column not in previous.columns]
+        if len(missing) > 0 or not previous.index.is_unique:
+            logging.warning("%s was not written by a run over this input, every row will be resolved", Config.getSaveLoc())
+            return None
+        previous.index = previous.index.astype(str)
+        return previous
+
+    def _runChunked(self):
+        checkpoint = self._loadCheckpoint()
+        if checkpoint["chunks"] > 0 and not os.path.exists(Config.getSaveLoc()):
+            logging.warning("Checkpoint %s has no output at %s and will be ignored", self._checkpointLoc(), Config.getSaveLoc())
+            checkpoint.update(chunks=0, rows=0, output_size=0)
+        rows = checkpoint["rows"]
+        if checkpoint["chunks"] > 0:
+            message = f"Resuming {Config.getFileLoc()} after chunk {checkpoint['chunks']} ({rows} rows already written to {Config.getSaveLoc()})"
+            logging.info(message)
+            print(message)
+            # drop anything appended after the last checkpoint so an interrupted chunk isn't written twice
+            with open(Config.getSaveLoc(), 'r+b') as save_file:
+                save_file.truncate(checkpoint["output_size"])
+
+        chunks = pd.read_csv(filepath_or_buffer=Config.getFileLoc(), chunksize=Config.getChunkSize(), skiprows=range(1, rows + 1))
+        for chunk_number, chunk in enumerate(chunks, start=checkpoint["chunks"] + 1):
+            # the reader already numbers rows across chunks, so each chunk is renumbered from the rows written rather than offset again
+            chunk.index = range(rows, rows + len(chunk))
+            logging.info("Starting chunk %s (rows %s-%s)", chunk_number, rows, rows + len(chunk) - 1)
+            self._setLocations(chunk)
+            self._resolveLocations()
+            self.geocoded_locations.to_csv(
+                path_or_buf=Config.getSaveLoc(),
+                mode='a' if rows > 0 else 'w',
+                header=rows == 0
+            )
+            if Config.getUseMemo():
+                self._saveMemo()
+            rows += len(chunk)
+            self._saveCheckpoint(chunk_number, rows)
+
+        if os.path.exists(self._checkpointLoc()):
+            os.remove(self._checkpointLoc())
+        logging.info("Finished streaming %s rows from %s to %s", rows, Config.getFileLoc(), Config.getSaveLoc())
+
+    def _checkpointLoc(self) -> str:
+        return f"{Config.getSaveLoc()}.checkpoint"
+
+    def _loadCheckpoint(self) -> dict:
+        checkpoint = {"file_loc": Config.getFileLoc(), "chunk_size": Config.getChunkSize(), "chunks": 0, "rows": 0, "output_size": 0}
+        try:
+            with open(self._checkpointLoc(), 'r') as checkpoint_file:
+                saved = json.load(checkpoint_file)
+        except FileNotFoundError:
+            return checkpoint
+        except json.JSONDecodeError:
+            logging.warning("Ignoring unreadable checkpoint %s", self._checkpointLoc())
+            return checkpoint
+        if saved.get("file_loc") != checkpoint["file_loc"] or saved.get("chunk_size") != checkpoint["chunk_size"]:
+            logging.warning("Checkpoint %s was written for a different input or chunk size and will be ignored", self._checkpointLoc())
+            return checkpoint
+        return saved
+
+    def _saveCheckpoint(self, chunks:int, rows:int):
+        checkpoint = {"file_loc": Config.getFileLoc(), "chunk_size": Config.getChunkSize(), "chunks": chunks, "rows": rows, "output_size": os.path.getsize(Config.getSaveLoc())}
+        with open(f"{self._checkpointLoc()}.tmp", 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+        os.replace(f"{self._checkpointLoc()}.tmp", self._checkpointLoc())
+        logging.debug("Saved checkpoint after chunk %s (%s rows)", chunks, rows)
 
     def _resetCounters(self):
-        self.geolocated = 0
-        self.memolocated = 0
+        for counter in COUNTERS:
+            setattr(self, counter, 0)
     def _getTotalCount(self):
-        return self.geolocated + self.memolocated + self.not_located
+        return self.geolocated + self.memolocated + self.gazetteerlocated + self.not_located + self.failed
+    def _getTotalRowCount(self):
+        return self.geolocated_rows + self.memolocated_rows + self.gazetteerlocated_rows + self.not_located_rows + self.failed_rows
+
+    def _saveMemo(self):
+        with Metrics.timer("memo_save"):
+            self.memo.save()
+        Config.resetMemoSaveCounter()
 
     def _code(self, location:str, confidence:float):
-        logging.debug(f"Starting geocode for \"{location}\" using {self.user_agent}")
-        loc = (self.geocode(
-                query=location,
-                timeout=Config.getGeocodeTimeout(),
-                exactly_one=True,
-                addressdetails=True
-            ))
+        if Config.getUseMemo() and self.memo.isUnknown(location, self.user_agent):
+            # this agent already failed to find it and the entry hasn't expired, asking again would get the same answer
+            logging.debug("Skipping geocode of \"%s\", %s could not find it before", location, self.user_agent)
+            self.skipped += 1
+            Metrics.increment("unknown_skip", self.user_agent)
+            return None
+        if location in self.prefetched:
+            logging.debug("Using prefetched geocode for \"%s\" from %s", location, self.user_agent)
+            loc = self.prefetched[location]
+            if location in self.prefetch_rejected:
+                self.rejected = True
+        else:
+            hit, loc = ResponseCache.get(Config.getGeocodeDomain(), location, GEOCODE_PARAMS)
+            if hit:
+                logging.debug("Using cached geocoder response for \"%s\"", location)
+                self.cached += 1
+            else:
+                try:
+                    loc = self._geocode(location)
+                except GeocodeUnavailable as error:
+                    logging.warning("[%s] Could not geocode \"%s\": %s", self.user_agent, location, error)
+                    self.unavailable = True
+                    return None
         if loc is None:
-            logging.info(f"[{self.user_agent}] No location was able to be geocoded from search string: \"{location}\"")
+            Metrics.increment("geocode_miss", self.user_agent)
+            logging.info("[%s] No location was able to be geocoded from search string: \"%s\"", self.user_agent, location)
             return None
         else:
+            Metrics.increment("geocode_hit", self.user_agent)
             self.geolocated += 1
-            loc = loc.raw
-            logging.info(f"[{self.user_agent}] Location geocoded from search string: \"{location}\"\n\tConfidence: {confidence}")
+            logging.info("[%s] Location geocoded from search string: \"%s\"\n\tConfidence: %s", self.user_agent, location, confidence)
             if Config.getUseMemo():
-                loc = Memo.add(location, loc["osm_id"], loc, confidence)
+                loc = self.memo.add(location, loc["osm_id"], loc, confidence)
                 Config.decrementMemoSaveCounter()
                 return loc
 
+    def _geocode(self, location:str) -> dict | None:
+        logging.debug("Starting geocode for \"%s\" using %s", location, self.user_agent)
+        self.request_seconds = 0.0
+        if Config.getUseMemo():
+            self.memo.release()
+        start = time.perf_counter()
+        try:
+            loc = Scheduler.call(
+                Config.getGeocodeDomain(),
+                self._request,
+                query=location,
+                timeout=Config.getGeocodeTimeout(),
+                **GEOCODE_PARAMS
+            )
+        except GeocodeRejected as error:
+            logging.warning("[%s] %s", self.user_agent, error)
+            self.rejected = True
+            loc = None
+        Metrics.observe("rate_limiter_wait", time.perf_counter() - start - self.request_seconds)
+        # the raw response is cached before memoFormat strips it down
+        loc = None if loc is None else loc.raw
+        ResponseCache.put(Config.getGeocodeDomain(), location, GEOCODE_PARAMS, loc)
+        return loc
+
     def _memoSearch(self, location:str) -> tuple[dict|None, bool]:
+        with Metrics.timer("memo_probe"):
+            loc, is_unknown = self._memoProbe(location)
+        Metrics.increment("memo_miss" if loc is None else "memo_hit", self.user_agent)
+        return loc, is_unknown
+
+    def _memoProbe(self, location:str) -> tuple[dict|None, bool]:
         loc = None
         if Config.getUseMemo():
-            if Memo.isUnknown(location):
-                if Memo.isUnknown(location, self.user_agent):
-                    logging.debug(f"Location {location} found as an unknown value for {self.user_agent}")
+            if self.memo.isUnknown(location):
+                if self.memo.isUnknown(location, self.user_agent):
+                    logging.debug("Location %s found as an unknown value for %s", location, self.user_agent)
                     return None, False
                 else:
-                    logging.debug(f"Location {location} not unknown for {self.user_agent}, but is unknown for another agent")
+                    logging.debug("Location %s not unknown for %s, but is unknown for another agent", location, self.user_agent)
                     return None, True
             else:
-                loc = Memo.search(location)
+                loc = self.memo.search(location)
         if loc is not None:
             self.memolocated += 1
         return loc, False
 
-    def _locateRow(self, location:pd.Series):
-        return self.locate(location[Config.getLocationColName()])
+    def _canonicalSearch(self, location:str, confidence:float) -> dict | None:
+        match = self.memo.searchCanonical(location)
+        if match is None:
+            return None
+        name, loc = match
+        logging.debug("Location matched to known name \"%s\" by canonical form from search string: \"%s\"", name, location)
+        # remember this spelling too so the next occurrence is an exact memo hit
+        self.memo.addKnown(location, self.memo.getMapID(name), confidence)
+        Config.decrementMemoSaveCounter()
+        self.memolocated += 1
+        self.canonicallocated += 1
+        Metrics.increment("canonical_hit", self.user_agent)
+        return loc
+
+    def _fuzzySearch(self, location:str, confidence:float) -> tuple[dict|None, float]:
+        match = FuzzyMatcher.match(location)
+        if match is None:
+            return None, confidence
+        name, distance = match
+        loc = self.memo.search(name)
+        if loc is None:
+            return None, confidence
+        confidence *= FuzzyMatcher.confidence(location, distance)
+        logging.debug("Location matched to known name \"%s\" from search string: \"%s\" (edit distance %s)\n\tConfidence: %s", name, location, distance, confidence)
+        # the match is never stored as a known name or as unknown, a wrong guess would otherwise be answered from the memo for good
+        self.memolocated += 1
+        Metrics.increment("fuzzy_hit", self.user_agent)
+        return loc, confidence
 
-    def locate(self, location:str) -> pd.Series:
+    def _gazetteerSearch(self, location:str) -> dict | None:
+        loc = Gazetteer.search(location)
+        if loc is not None:
+            self.gazetteerlocated += 1
+            Metrics.increment("gazetteer_hit", self.user_agent)
+            logging.debug("Location found in the offline gazetteer from search string: \"%s\"", location)
+        return loc
+
+    def locate(self, location:str) -> tuple:
+        Metrics.increment("locations", self.user_agent)
+        with Metrics.timer("locate"):
+            if Metrics.shouldProfile():
+                ret = Metrics.profile(self._locate, location)
+            else:
+                ret = self._locate(location)
+        Metrics.tick()
+        return ret
+
+    def _locate(self, location:str) -> tuple:
+        if not isinstance(location, str):
+            # blank answers are read as NaN and can't be searched for
+            return (location, *("?" for _ in RESULT_FIELDS))
         location = location.lower()
-        logging.debug(f"Starting locate attempt for {location}")
+        self.unavailable = False
+        self.rejected = False
+        logging.debug("Starting locate attempt for %s", location)
         quick_corrected_location, full_corrected_location = location, location
         is_unknown = [False, False, False]
         confidence = 1.0
@@ -131,90 +634,109 @@ class Locator:
         if is_unknown[0]:
             confidence *= 0.9
 
+        # Same Place Written Differently
+        if loc is None and not is_unknown[0] and Config.getUseMemo() and Config.getCanonicalize():
+            loc = self._canonicalSearch(location, confidence)
+
+        # Offline Gazetteer
+        if loc is None and Gazetteer.enabled:
+            loc = self._gazetteerSearch(location)
+
         if loc is None:
             loc = self._code(location, confidence)
 
+        # Fuzzy Match Against Known Names, only once the geocoder has said it doesn't know the string as written and before any autocorrect
+        fuzzy = False
+        if loc is None and not self.unavailable and Config.getUseMemo() and Config.getUseFuzzyMatch():
+            loc, confidence = self._fuzzySearch(location, confidence)
+            fuzzy = loc is not None
+
         # Quick Auto-Correction
         if loc is None and Config.getUseAutocorrect():
-            logging.debug(f"Location unable to be found from initial search string\n\tAttempting quick autocorrect on initial search string: \"{location}\"")
-            quick_corrected_location = Correcter.quick_correct(location)
+            logging.debug("Location unable to be found from initial search string\n\tAttempting quick autocorrect on initial search string: \"%s\"", location)
+            with Metrics.timer("quick_correct"):
+                quick_corrected_location = Correcter.quick_correct(location)
             if quick_corrected_location != location:
                 confidence *= 0.7
-                logging.debug(f"Attempting memo search on quick corrected search string: \"{quick_corrected_location}\"")
+                logging.debug("Attempting memo search on quick corrected search string: \"%s\"", quick_corrected_location)
                 loc, is_unknown[1] = self._memoSearch(quick_corrected_location)
                 if is_unknown[1]:
                     confidence *= 0.9
             else:
-                logging.debug(f"The autocorrected string is the same as the initial search string. Further lookups will not be performed using this string")
+                logging.debug("The autocorrected string is the same as the initial search string. Further lookups will not be performed using this string")
         
         if loc is None:
-            logging.debug(f"Location unable to be found in memo with quick corrected search string (\"{quick_corrected_location}\")")
+            logging.debug("Location unable to be found in memo with quick corrected search string (\"%s\")", quick_corrected_location)
             if quick_corrected_location != location:
-                logging.debug(f"Attempting geocode on quick corrected search string: \"{quick_corrected_location}\"")
+                logging.debug("Attempting geocode on quick corrected search string: \"%s\"", quick_corrected_location)
                 loc = self._code(quick_corrected_location, confidence)
             if loc is not None:
-                logging.info(f"Location found with autocorrected text\n\tOriginal search string: \"{location}\"\n\tCorrected search string: \"{quick_corrected_location}\"")
+                logging.info("Location found with autocorrected text\n\tOriginal search string: \"%s\"\n\tCorrected search string: \"%s\"", location, quick_corrected_location)
                 # add the pre-corrected search string as a known location name as well
-                Memo.addKnown(location, Memo.map_name[quick_corrected_location], confidence)
+                self.memo.addKnown(location, self.memo.getMapID(quick_corrected_location), confidence)
 
         # Full Auto-Correction
         if loc is None and Config.getUseAutocorrect():
-            logging.debug(f"No location found for {quick_corrected_location} using {self.user_agent}.\n\tAttempting to fully autocorrect initial search string: \"{location}\"")
-            full_corrected_location = Correcter.slow_correct(location)
+            logging.debug("No location found for %s using %s.\n\tAttempting to fully autocorrect initial search string: \"%s\"", quick_corrected_location, self.user_agent, location)
+            with Metrics.timer("slow_correct"):
+                full_corrected_location = Correcter.slow_correct(location)
             if full_corrected_location != location:
                 confidence *= 0.7
-                logging.debug(f"Attempting memo search on fully corrected search string: \"{full_corrected_location}\"")
+                logging.debug("Attempting memo search on fully corrected search string: \"%s\"", full_corrected_location)
                 loc, is_unknown[2] = self._memoSearch(full_corrected_location)
                 if is_unknown[2]:
                     confidence *= 0.9
             else:
-                logging.debug(f"The autocorrected string is the same as the initial search string. Further lookups will not be performed using this string")
+                logging.debug("The autocorrected string is the same as the initial search string. Further lookups will not be performed using this string")
         
         if loc is None and Config.getUseAutocorrect():
-            logging.debug(f"Location unable to be found in memo with fully autocorrected search string (\"{full_corrected_location}\")")
+            logging.debug("Location unable to be found in memo with fully autocorrected search string (\"%s\")", full_corrected_location)
             if full_corrected_location != location:
-                logging.debug(f"Attempting geocode on fully corrected search string: \"{full_corrected_location}\"")
+                logging.debug("Attempting geocode on fully corrected search string: \"%s\"", full_corrected_location)
                 loc = self._code(full_corrected_location, confidence)
             if loc is not None:
-                logging.info(f"Location found with autocorrected text.\n\tOriginal search string: \"{location}\"\n\tCorrected search string: \"{full_corrected_location}\"")
+                logging.info("Location found with autocorrected text.\n\tOriginal search string: \"%s\"\n\tCorrected search string: \"%s\"", location, full_corrected_location)
                 # add the pre-corrected search strings as known location names as well
-                id = Memo.map_name[full_corrected_location]
-                Memo.addKnown(location, id, confidence)
-                Memo.addKnown(quick_corrected_location, id, confidence)
+                id = self.memo.getMapID(full_corrected_location)
+                self.memo.addKnown(location, id, confidence)
+                self.memo.addKnown(quick_corrected_location, id, confidence)
 
         # Add / Remove Unknown
-        if loc is None:
+        if loc is None and self.unavailable:
+            # a failed request isn't a miss, so nothing is recorded and the row stays unresolved for the next agent or run
+            self.failed += 1
+            logging.warning("No location found for %s using %s because the geocoder was unavailable", location, self.user_agent)
+        elif loc is None:
             if Config.getUseAutocorrect():
-                logging.warn(f"No location found for {location} using {self.user_agent} after factoring in autocorrections")
+                logging.warning("No location found for %s using %s after factoring in autocorrections", location, self.user_agent)
             else:
-                logging.warn(f"No location found for {location} using {self.user_agent}")
+                logging.warning("No location found for %s using %s", location, self.user_agent)
             if Config.getUseMemo():
                     self.not_located += 1
-                    Memo.addUnknown(self.user_agent, location)
+                    reason = "rejected" if self.rejected else "not_found"
+                    self.memo.addUnknown(self.user_agent, location, reason)
                     if quick_corrected_location != location:
-                        Memo.addUnknown(self.user_agent, quick_corrected_location)
+                        self.memo.addUnknown(self.user_agent, quick_corrected_location, reason)
                     if full_corrected_location != location:
-                        Memo.addUnknown(self.user_agent, full_corrected_location)
+                        self.memo.addUnknown(self.user_agent, full_corrected_location, reason)
                     Config.decrementMemoSaveCounter()
-        elif Config.getUseMemo() and (is_unknown[0] is True or is_unknown[1] is True or is_unknown[2] is True):
-            # if the location/quick_corrected_location/full_corrected_location was previously unknown for any user agent but was found using this user agent, remove it from unknown since it is now known
+        elif Config.getUseMemo() and not fuzzy and (is_unknown[0] is True or is_unknown[1] is True or is_unknown[2] is True):
+            # if the location/quick_corrected_location/full_corrected_location was previously unknown for any user agent but was found using this user agent, remove it from unknown since it is now known.
+            # A fuzzy match leaves the memo as it was, see _fuzzySearch
             if is_unknown[0] is True:
-                Memo.removeUnknown(location)
+                self.memo.removeUnknown(location)
             if is_unknown[1] is True:
-                Memo.removeUnknown(quick_corrected_location)
+                self.memo.removeUnknown(quick_corrected_location)
             if is_unknown[2] is True:
-                Memo.removeUnknown(full_corrected_location)
+                self.memo.removeUnknown(full_corrected_location)
             Config.decrementMemoSaveCounter()
         
         # Save Memo if Needed
         if Config.needsMemoSave():
-            logging.debug(f"Memo has recorded {Config.getDefaultMemoSaveCounter()} new records and will save to avoid data loss as configured in \'config.json\'")
-            Memo.save()
-            Config.resetMemoSaveCounter()
+            logging.debug("Memo has recorded %s new records and will save to avoid data loss as configured in 'config.json'", Config.getDefaultMemoSaveCounter())
+            self._saveMemo()
 
         # Return Results
         if loc is None:
-            ret = pd.Series((location, "?", "?", "?", "?", "?"))
-        else:
-            ret = pd.Series((location, loc.pop("latitude", "NA"), loc.pop("longitude", "NA"), loc.pop("state", "NA"), loc.pop("country", "NA"), loc.pop("city", "NA")))
-        return ret
+            return (location, *("?" for _ in RESULT_FIELDS))
+        return (location, *(loc.get(field, "NA") for field in RESULT_FIELDS))
@@ -0,0 +1,78 @@
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+from datetime import datetime as dt
+
+from utils.config import Config
+
+LOG_FORMAT = '%(levelname)s:%(asctime)s:[%(module)s] %(message)s'
+# most records held between bootstrap() and setup(), loading the config logs one per key
+BOOTSTRAP_CAPACITY = 1000
+
+class Logs:
+    listener:logging.handlers.QueueListener|None = None
+    worker_listener:logging.handlers.QueueListener|None = None
+    pending:logging.handlers.BufferingHandler|None = None
+
+    @staticmethod
+    def bootstrap():
+        # the log level and location come from the config, so what Config.load logs is held until setup() knows where to write it
+        Logs.pending = logging.handlers.BufferingHandler(BOOTSTRAP_CAPACITY)
+        logging.basicConfig(level=logging.DEBUG, handlers=[Logs.pending], force=True)
+
+    @staticmethod
+    def setup():
+        level = logging.getLevelName(f"{Config.getLogLevel()}".upper())
+        if not isinstance(level, int):
+            level = logging.DEBUG
+
+        log_loc = Config.getLogLoc()
+        if log_loc is None:
+            log_loc = f"logs/{dt.now().strftime('%Y-%m-%d_%H-%M-%S')}.log"
+        if log_loc == "stderr":
+            handler = logging.StreamHandler()
+        else:
+            if os.path.dirname(log_loc):
+                os.makedirs(os.path.dirname(log_loc), exist_ok=True)
+            handler = logging.FileHandler(log_loc, mode='w', encoding='utf-8')
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        if Config.getLogQueue():
+            # records are handed to a background thread so rows never wait on log file I/O
+            log_queue = queue.SimpleQueue()
+            Logs.listener = logging.handlers.QueueListener(log_queue, handler)
+            Logs.listener.start()
+            handler = logging.handlers.QueueHandler(log_queue)
+            # the listener's handler applies LOG_FORMAT, the queue only merges the message with its arguments
+            handler.setFormatter(logging.Formatter('%(message)s'))
+        # replacing the handlers closes the bootstrap one, which empties its buffer
+        pending = [] if Logs.pending is None else Logs.pending.buffer[:]
+        Logs.pending = None
+        logging.basicConfig(level=level, handlers=[handler], force=True)
+        for record in pending:
+            if record.levelno >= level:
+                logging.getLogger().handle(record)
+
+    @staticmethod
+    def workerQueue(context=multiprocessing):
+        # worker processes log through this queue into the handlers of this one, so a run still writes a single log
+        if Logs.worker_listener is None:
+            Logs.worker_listener = logging.handlers.QueueListener(context.Queue(), *logging.getLogger().handlers, respect_handler_level=True)
+            Logs.worker_listener.start()
+        return Logs.worker_listener.queue
+
+    @staticmethod
+    def setupWorker(worker_queue, level:int):
+        logging.basicConfig(level=level, handlers=[logging.handlers.QueueHandler(worker_queue)], force=True)
+
+    @staticmethod
+    def close():
+        if Logs.worker_listener is not None:
+            Logs.worker_listener.stop()
+            Logs.worker_listener = None
+        if Logs.listener is not None:
+            Logs.listener.stop()
+            Logs.listener = None
+        logging.shutdown()
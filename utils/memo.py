@@ -1,59 +1,311 @@
 import json
 import logging
+import mmap
+import os
+import pickle
 import shutil
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from typing import Iterable
+
+from utils.canonical import CANONICAL_VERSION, canonicalize
+from utils.config import Config
+from utils.fuzzy import FuzzyMatcher
+from utils.metrics import Metrics
+
+JOURNAL_LOC = 'memo.journal'
+COMPACTING_JOURNAL_LOC = 'memo.journal.compacting'
+BINARY_LOC = 'memo.bin'
+# magic, format version, length of the pickled names/unknown state, length of the record blob, number of records
+BINARY_HEADER = struct.Struct("<8sIQQQ")
+BINARY_MAGIC = b"SGMEMO\r\n"
+BINARY_VERSION = 1
+
+# keys memoFormat stores for every location. Anything else a location carries is kept in LocationRecord.extra
+RECORD_FIELDS = ("latitude", "longitude", "display_name", "city", "county", "state", "country", "street", "zip", "building", "house_number")
+COORDINATE_FIELDS = ("latitude", "longitude")
+# values repeated across many locations, including the "NA" placeholder, share one string object
+INTERNED_FIELDS = frozenset(("city", "county", "state", "country", "street", "zip", "building", "house_number"))
+
+
+class LocationRecord(Mapping):
+    # a read-only memo location in fixed slots instead of a dict per OSM id. Coordinates are kept as floats whenever
+    # the float prints back to the exact string that was stored, so toDict() always returns what was put in
+    __slots__ = RECORD_FIELDS + ("extra", "converted")
+
+    def __init__(self, location:Mapping):
+        extra = None
+        converted = 0
+        for key, value in location.items():
+            if key in COORDINATE_FIELDS and isinstance(value, str):
+                try:
+                    number = float(value)
+                except ValueError:
+                    number = None
+                if number is not None and repr(number) == value:
+                    value = number
+                    converted |= 1 << COORDINATE_FIELDS.index(key)
+            elif key in INTERNED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+            if key in RECORD_FIELDS:
+                object.__setattr__(self, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        object.__setattr__(self, "extra", extra)
+        object.__setattr__(self, "converted", converted)
+
+    def __getitem__(self, key:str):
+        if key in RECORD_FIELDS:
+            try:
+                value = object.__getattribute__(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+            if key in COORDINATE_FIELDS and self.converted & 1 << COORDINATE_FIELDS.index(key):
+                return repr(value)
+            return value
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        for key in RECORD_FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __setattr__(self, name, value):
+        raise TypeError("LocationRecord is read-only, use toDict() for a mutable copy")
+
+    def __delattr__(self, name):
+        raise TypeError("LocationRecord is read-only, use toDict() for a mutable copy")
+
+    def __reduce__(self):
+        return (LocationRecord, (self.toDict(),))
+
+    def __repr__(self) -> str:
+        return f"LocationRecord({self.toDict()})"
+
+    def toDict(self) -> dict:
+        return dict(self.items())
+
+    def copy(self) -> dict:
+        return self.toDict()
+
+    def coordinates(self) -> tuple[float, float]:
+        return float(self["latitude"]), float(self["longitude"])
+
+
+class StoredLocations:
+    # the locations of a binary snapshot. Only the sorted ids and record offsets are read at load time, each record is
+    # unpickled from the memory-mapped file the first time it is looked up
+    def __init__(self, memo_file, buffer:mmap.mmap, start:int, ids:array, offsets:array) -> None:
+        self.memo_file = memo_file
+        self.buffer = buffer
+        self.start = start
+        self.ids = ids
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def raw(self, index:int) -> bytes:
+        return self.buffer[self.start + self.offsets[index]:self.start + self.offsets[index + 1]]
+
+    def read(self, index:int) -> LocationRecord:
+        return LocationRecord(pickle.loads(self.raw(index)))
+
+    def get(self, id:int) -> LocationRecord | None:
+        index = bisect_left(self.ids, id)
+        if index == len(self.ids) or self.ids[index] != id:
+            return None
+        return self.read(index)
+
+    def close(self):
+        self.buffer.close()
+        self.memo_file.close()
+
 
 class Memo:
-    known_names = None | list[str]
-    known_osm_ids = None | list[int]
-    map_name = None | dict
-    locations = None | dict
-    unknown = None | dict
+    known_names:set[str] = set()
+    known_osm_ids:set[int] = set()
+    map_name:dict = {}
+    # canonical form of a name -> a known name written that way, see utils.canonical
+    canonical_names:dict[str, str] = {}
+    # decoded and newly added locations. A removed location is kept as None so it hides the stored copy
+    locations:dict[str, LocationRecord|None] = {}
+    stored:StoredLocations|None = None
+    # name -> {agent: [time recorded, reason]}, ordered from the oldest failure to the newest so eviction pops from the front
+    unknown:dict[str, dict[str, list]] = {}
+    unknown_count = 0
+    journal_file = None
+    journal_buffer:list[str] = []
+    journal_entries = 0
+    compaction:threading.Thread|None = None
+    # mutations of a shard worker, kept as journal entries for the main process to merge
+    recorded:list|None = None
 
     @staticmethod
-    def load():
+    def load(shard:bool=False):
+        # a shard worker reads the memo as the main process last saved it and records its changes instead of writing them
         memo = None
-        Memo.backup()
-        try:
-            with open('memo.json', 'r') as memo_file:
-                memo = json.load(memo_file)
-                logging.info("memo successfully loaded")
-                logging.info(f'Memo : {memo["locations"]}')
-        except:
-            Memo.writeDefaultJSON()
+        if not shard:
+            Memo.backup()
+        if Memo.stored is not None:
+            Memo.stored.close()
+            Memo.stored = None
+        if Config.getMemoBackend() == "binary" and Memo.loadBinary():
+            logging.info("memo successfully loaded from %s", BINARY_LOC)
+        else:
             try:
                 with open('memo.json', 'r') as memo_file:
                     memo = json.load(memo_file)
                     logging.info("memo successfully loaded")
             except:
-                logging.error("Could not open newly created memo file")
-        
-        Memo.known_names = memo["known_names"]
-        Memo.known_osm_ids = memo["known_osm_ids"]
+                Memo.writeDefaultJSON()
+                try:
+                    with open('memo.json', 'r') as memo_file:
+                        memo = json.load(memo_file)
+                        logging.info("memo successfully loaded")
+                except:
+                    logging.error("Could not open newly created memo file")
+            Memo.index(memo)
+        if shard:
+            Memo.replay(COMPACTING_JOURNAL_LOC)
+            Memo.replay(JOURNAL_LOC)
+            Memo.recorded = []
+        elif Config.getUseMemoJournal():
+            Memo.openJournal()
+
+    @staticmethod
+    def loadBinary() -> bool:
+        if not os.path.exists(BINARY_LOC):
+            logging.info("No %s found, the memo will be read from memo.json and saved as %s", BINARY_LOC, BINARY_LOC)
+            return False
+        memo_file = open(BINARY_LOC, 'rb')
+        try:
+            buffer = mmap.mmap(memo_file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, state_length, blob_length, count = BINARY_HEADER.unpack_from(buffer)
+        except (ValueError, struct.error):
+            memo_file.close()
+            logging.error("%s is not a memo snapshot, falling back to memo.json", BINARY_LOC)
+            return False
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            buffer.close()
+            memo_file.close()
+            logging.error("%s has an unsupported header (version %s), falling back to memo.json", BINARY_LOC, version)
+            return False
+
+        start = BINARY_HEADER.size
+        state = pickle.loads(buffer[start:start + state_length])
+        blob_start = start + state_length
+        ids, offsets = array('q'), array('q')
+        ids.frombytes(buffer[blob_start + blob_length:blob_start + blob_length + 8 * count])
+        offsets.frombytes(buffer[blob_start + blob_length + 8 * count:blob_start + blob_length + 8 * (2 * count + 1)])
+        if sys.byteorder != "little":
+            ids.byteswap()
+            offsets.byteswap()
+
+        Memo.known_names = state["known_names"]
+        Memo.known_osm_ids = state["known_osm_ids"]
+        Memo.map_name = state["map_name"]
+        Memo.indexUnknown(state.get("unknown"), state.get("unknown_recorded"))
+        Memo.indexCanonical(state.get("canonical_names"), state.get("canonical_version"))
+        Memo.locations = {}
+        Memo.stored = StoredLocations(memo_file, buffer, blob_start, ids, offsets)
+        return True
+
+    @staticmethod
+    def index(memo:dict):
+        # memo.json stores lists, but every lookup on the hot path is a membership test, so keep them as hashed sets in memory
+        Memo.known_names = set(memo["known_names"])
+        Memo.known_osm_ids = set(memo["known_osm_ids"])
         Memo.map_name = memo["map_name"]
-        Memo.locations = memo["locations"]
-        Memo.unknown = memo["unknown"]
+        Memo.locations = {id: LocationRecord(location) for id, location in memo["locations"].items()}
+        Memo.stored = None
+        Memo.indexUnknown(memo.get("unknown"), memo.get("unknown_recorded"))
+        Memo.indexCanonical(memo.get("canonical_names"), memo.get("canonical_version"))
+
+    @staticmethod
+    def indexUnknown(unknown:dict|None, recorded:dict|None):
+        # "unknown" lists each agent's unknown names, the layout every version of the memo has, and decides which entries exist.
+        # "unknown_recorded" adds when and why each one failed, oldest first. Entries without it, from an older memo or added by an
+        # older build, count as recorded now
+        listed = {(name, agent) for agent, names in (unknown or {}).items() for name in names}
+        entries = {}
+        for name, agents in (recorded or {}).items():
+            kept = {agent: entry for agent, entry in agents.items() if (name, agent) in listed}
+            if len(kept) > 0:
+                entries[name] = kept
+        now = int(time.time())
+        for agent, names in (unknown or {}).items():
+            for name in names:
+                entries.setdefault(name, {}).setdefault(agent, [now, "not_found"])
+        Memo.unknown = entries
+        Memo.unknown_count = sum(len(agents) for agents in entries.values())
+        Memo.evictUnknown()
+
+    @staticmethod
+    def indexCanonical(saved:dict|None, version:int|None):
+        if not Config.getCanonicalize():
+            Memo.canonical_names = {}
+            return
+        if saved is not None and version == CANONICAL_VERSION:
+            Memo.canonical_names = saved
+            return
+        # older memos, or ones saved under different rules, get their index rebuilt once
+        Memo.canonical_names = {}
+        for name in Memo.known_names:
+            Memo.canonical_names.setdefault(canonicalize(name), name)
+        logging.info("Indexed %s known names under %s canonical forms", len(Memo.known_names), len(Memo.canonical_names))
+
+    @staticmethod
+    def unknownCutoff() -> float:
+        # negatives recorded before this have expired and are tried again
+        ttl = Config.getUnknownTTLDays()
+        if ttl is None:
+            return float("-inf")
+        return time.time() - ttl * 86400
 
     @staticmethod
     def isUnknown(name:str, agent:str=None):
-        if agent is not None:
-            if agent not in Memo.unknown:
-                return False
-            if name in Memo.unknown[agent]:
-                return True
+        agents = Memo.unknown.get(name)
+        if agents is None:
             return False
-        
-        for agent in Memo.unknown:
-            if name in Memo.unknown[agent]:
-                return True
-            
-        return False
+        if Config.getUnknownTTLDays() is None:
+            return agent is None or agent in agents
+        cutoff = Memo.unknownCutoff()
+        if agent is not None:
+            entry = agents.get(agent)
+            return entry is not None and entry[0] >= cutoff
+        return any(recorded >= cutoff for recorded, _ in agents.values())
+
+    @staticmethod
+    def expiredUnknowns() -> list[str]:
+        cutoff = Memo.unknownCutoff()
+        return [name for name, agents in Memo.unknown.items() if any(recorded < cutoff for recorded, _ in agents.values())]
     
     @staticmethod
     def removeUnknown(name:str):
-        for agent in Memo.unknown:
-            if name in Memo.unknown[agent]:
-                Memo.unknown[agent].remove(name)
+        agents = Memo.unknown.pop(name, None)
+        if agents:
+            Memo.unknown_count -= len(agents)
+            Memo.journal("removeUnknown", name)
     
+    @staticmethod
+    def knownNames() -> Iterable[str]:
+        return Memo.known_names
+
     @staticmethod
     def getMapID(name:str) -> int | None:
         if name in Memo.map_name:
@@ -62,37 +314,46 @@ class Memo:
         return None
 
     @staticmethod
-    def search(name:str, id:int|None=None) -> dict | None:
-        logging.debug(f"Starting Memo search for \"{name}\"")
+    def search(name:str, id:int|None=None) -> LocationRecord | None:
+        logging.debug("Starting Memo search for \"%s\"", name)
         
         if name in Memo.known_names:
-            logging.debug(f"\"{name}\" is a known name")
+            logging.debug("\"%s\" is a known name", name)
             
-            str_id = f"{Memo.getMapID(name)}"
-            location = Memo.locations[str_id].copy()
-            logging.debug(f"Location found for \"{name}\": {location}")
+            location = Memo.getLocation(Memo.getMapID(name))
+            logging.debug("Location found for \"%s\": %s", name, location)
             return location
         if id is None:
-            logging.debug(f"Could not find location from \"{name}\" in Memo")
+            logging.debug("Could not find location from \"%s\" in Memo", name)
             return None
         
         if id in Memo.known_osm_ids:
-            logging.debug(f"{id} is a known OSM ID")
-            str_id = f"{id}"
-            if str_id in Memo.locations:
-                location = Memo.locations[str_id].copy()
-                logging.debug(f"Location found for {id}: \"{location}\"")
+            logging.debug("%s is a known OSM ID", id)
+            location = Memo.getLocation(id)
+            if location is not None:
+                logging.debug("Location found for %s: \"%s\"", id, location)
                 return location
             else:
-                logging.debug(f"No valid location was found in Memo for {id}. Removing {id} from Memo's known locations")
+                logging.debug("No valid location was found in Memo for %s. Removing %s from Memo's known locations", id, id)
                 Memo.removeLocation(id)
                 return None
-        logging.debug(f"Could not find location by \"{name}\" or {id} in Memo")
+        logging.debug("Could not find location by \"%s\" or %s in Memo", name, id)
         return None
         
     
     @staticmethod
-    def add(name:str, id:int, loc:dict, confidence):
+    def searchCanonical(name:str) -> tuple[str, LocationRecord] | None:
+        # a known name that is written differently but canonicalizes the same, and its location
+        known = Memo.canonical_names.get(canonicalize(name))
+        if known is None or known == name:
+            return None
+        location = Memo.search(known)
+        if location is None:
+            return None
+        return known, location
+
+    @staticmethod
+    def add(name:str, id:int, loc:dict, confidence) -> LocationRecord | None:
         if name is None or id is None or loc is None:
             return None
         name = name.lower()
@@ -103,27 +364,56 @@ class Memo:
             if display_name not in Memo.known_names:
                 Memo.addKnown(display_name, id, confidence)
 
-        str_id = f"{id}"
+        existing = Memo.getLocation(id)
+        if existing is not None:
+            logging.debug("Location with OSM ID: %s already exists", id)
+            return existing
 
+        location = Memo.memoFormat(loc)
+        record = Memo.addLocation(id, location)
+        logging.debug("New Location (%s) added to Memo with OSM ID: %s - %s", name, id, location)
+        return record
+
+    @staticmethod
+    def getLocation(id:int) -> LocationRecord | None:
+        str_id = f"{id}"
         if str_id in Memo.locations:
-            logging.debug(f"Location with OSM ID: {id} already exists")
             return Memo.locations[str_id]
+        if Memo.stored is None:
+            return None
+        record = Memo.stored.get(int(id))
+        if record is not None:
+            Memo.locations[str_id] = record
+        return record
 
-        location = Memo.memoFormat(loc)
-        Memo.locations[str_id] = location.copy()
-        logging.debug(f"New Location ({name}) added to Memo with OSM ID: {id} - {location}")
-        return location
+    @staticmethod
+    def locationItems() -> Iterable[tuple[str, LocationRecord]]:
+        # every location, decoding stored records without keeping them in memory
+        if Memo.stored is not None:
+            for index, id in enumerate(Memo.stored.ids):
+                if f"{id}" not in Memo.locations:
+                    yield f"{id}", Memo.stored.read(index)
+        for id, record in Memo.locations.items():
+            if record is not None:
+                yield id, record
+
+    @staticmethod
+    def addLocation(id:int, location:dict) -> LocationRecord:
+        record = LocationRecord(location)
+        Memo.locations[f"{id}"] = record
+        Memo.journal("add", id, location)
+        return record
 
     @staticmethod
     def memoFormat(loc:dict):
-        logging.debug(f"Formatting location as Memo format: {loc}")
+        logging.debug("Formatting location as Memo format: %s", loc)
         removed = {}
         to_remove = ["place_id", "licence", "osm_type", "osm_id", "class", "type", "place_rank", "importance", "boundingbox"]
         for remove in to_remove:
             remove_val = loc.pop(remove, None)
             if remove_val is not None:
                 removed[remove] = remove_val
-        logging.debug(f"Removed keys from location for Memo format: {removed}")
+        logging.debug("Removed keys from location for Memo format: %s", removed)
         address = loc.pop("address", None)
         if address is not None:
             loc["city"] = address.pop("city", "NA")
@@ -134,7 +424,7 @@ class Memo:
             loc["zip"] = address.pop("postcode", "NA")
             loc["building"] = address.pop("building", "NA")
             loc["house_number"] = address.pop("house_number", "NA")
-            logging.debug(f"Remaining address values not included in Memo format: {address}")
+            logging.debug("Remaining address values not included in Memo format: %s", address)
         if "latitude" not in loc:
             loc["latitude"] = loc.pop("lat")
         if "longitude" not in loc:
@@ -147,43 +437,71 @@ class Memo:
     def addKnown(name:str, id:int, confidence:float=0.1):
         name = name.lower()
         if name not in Memo.known_names:
-            Memo.known_names.append(name)
-            logging.debug(f"\"{name}\" added as a known location name")
+            Memo.known_names.add(name)
+            logging.debug("\"%s\" added as a known location name", name)
+            # a name that resolves is no longer unknown to anyone
+            Memo.removeUnknown(name)
+            if Config.getCanonicalize():
+                Memo.canonical_names.setdefault(canonicalize(name), name)
+            if FuzzyMatcher.enabled:
+                FuzzyMatcher.add(name)
         if id not in Memo.known_osm_ids:
-            Memo.known_osm_ids.append(id)
-            logging.debug(f"{id} added as a known location id")
+            Memo.known_osm_ids.add(id)
+            logging.debug("%s added as a known location id", id)
         if name not in Memo.map_name:
             Memo.map_name[name] = {"id": id, "confidence": confidence}
-            logging.debug(f"Added map for \"{name}\" to {id} with confidence: {confidence}")
+            logging.debug("Added map for \"%s\" to %s with confidence: %s", name, id, confidence)
+            Memo.journal("addKnown", name, id, confidence)
     
     @staticmethod
-    def addUnknown(agent:str, location:str):
+    def addUnknown(agent:str, location:str, reason:str="not_found", recorded:int|None=None):
         location = location.lower()
-        if agent not in Memo.unknown:
-            Memo.unknown[agent] = []
-        if not Memo.isUnknown(location, agent):
-            Memo.unknown[agent].append(location)
-            logging.debug(f"\"{location}\" added as an unknown location name for {agent}")
+        if Memo.isUnknown(location, agent):
+            return
+        recorded = int(time.time()) if recorded is None else recorded
+        # moved to the end, the name's newest failure decides when it is evicted
+        agents = Memo.unknown.pop(location, {})
+        Memo.unknown_count += agent not in agents
+        agents[agent] = [recorded, reason]
+        Memo.unknown[location] = agents
+        logging.debug("\"%s\" added as an unknown location name for %s (%s)", location, agent, reason)
+        Memo.journal("addUnknown", agent, location, reason, recorded)
+        Memo.evictUnknown()
+
+    @staticmethod
+    def evictUnknown():
+        # the names that failed longest ago go first. Eviction isn't journaled, replaying the same entries evicts the same names
+        limit = Config.getUnknownMaxEntries()
+        if limit is None or Memo.unknown_count <= limit:
+            return
+        evicted = 0
+        while Memo.unknown_count > limit:
+            Memo.unknown_count -= len(Memo.unknown.pop(next(iter(Memo.unknown))))
+            evicted += 1
+        Metrics.increment("unknown_evicted", amount=evicted)
+        logging.debug("Evicted %s unknown location names", evicted)
 
     @staticmethod
     def removeLocation(id:int):
-        Memo.known_osm_ids.remove(id)
-        str_id = f"{id}"
-        del Memo.locations[str_id]
+        Memo.known_osm_ids.discard(id)
+        Memo.locations[f"{id}"] = None
+        Memo.journal("removeLocation", id)
 
     @staticmethod
     def memoPrint():
         print(Memo.known_names)
         print(Memo.known_osm_ids)
         print(Memo.map_name)
-        print(Memo.locations)
+        print(dict(Memo.locationItems()))
 
     @staticmethod
     def writeDefaultJSON():
         try:
             default_json = json.dumps(Memo.getDefaultMemo(), indent=4)
-            with open('memo.json', 'w') as memo_file:
+            # replaced rather than truncated, memo.bak may be a hard link to the old file
+            with open('memo.json.tmp', 'w') as memo_file:
                 memo_file.write(default_json)
+            os.replace('memo.json.tmp', 'memo.json')
         except:
             message = "There was an error while trying to create a new memo.json file"
             logging.error(message)
@@ -193,6 +511,7 @@ class Memo:
     def getDefaultMemo():
         return {
             "unknown": {},
+            "unknown_recorded": {},
             "known_names": [],
             "known_osm_ids": [],
             "map_name": {},
@@ -201,24 +520,267 @@ class Memo:
     
     @staticmethod
     def backup():
-        shutil.copyfile('memo.bak', 'memo.bak.bak')
-        logging.debug("Saved a backup of memo.bak in memo.bak.bak")
-        shutil.copyfile('memo.json', 'memo.bak')
-        logging.debug("Saved a backup of memo.json in memo.bak")
+        Memo.rotate('memo.json', 'memo.bak')
+        Memo.rotate(BINARY_LOC, f"{BINARY_LOC}.bak")
 
     @staticmethod
-    def save():
-        data = {
-            "unknown": Memo.unknown,
-            "known_names": Memo.known_names,
-            "known_osm_ids": Memo.known_osm_ids,
-            "map_name": Memo.map_name,
-            "locations": Memo.locations
+    def rotate(path:str, backup_path:str):
+        # snapshots are only ever replaced, never rewritten in place, so a hard link is as good as a copy and costs nothing
+        if os.path.exists(backup_path):
+            # rename does nothing when both names are links to the same unchanged file, so clear the old one first
+            if os.path.exists(f"{backup_path}.bak"):
+                os.remove(f"{backup_path}.bak")
+            os.replace(backup_path, f"{backup_path}.bak")
+            logging.debug("Moved %s to %s.bak", backup_path, backup_path)
+        if os.path.exists(path):
+            try:
+                os.link(path, backup_path)
+            except OSError:
+                shutil.copyfile(path, backup_path)
+            logging.debug("Saved a backup of %s in %s", path, backup_path)
+
+    @staticmethod
+    def snapshotLoc() -> str:
+        return BINARY_LOC if Config.getMemoBackend() == "binary" else 'memo.json'
+
+    @staticmethod
+    def snapshot() -> dict:
+        if Config.getMemoBackend() == "binary":
+            # records are encoded by writeBinary, stored records that were never decoded are copied over as they are
+            return {
+                **Memo.unknownSnapshot(set),
+                "known_names": set(Memo.known_names),
+                "known_osm_ids": set(Memo.known_osm_ids),
+                "map_name": dict(Memo.map_name),
+                "locations": dict(Memo.locations),
+                "stored": Memo.stored,
+                **Memo.canonicalSnapshot()
+            }
+        return {
+            # sorted so a save that changes nothing rewrites memo.json byte for byte
+            **Memo.unknownSnapshot(sorted),
+            "known_names": sorted(Memo.known_names),
+            "known_osm_ids": sorted(Memo.known_osm_ids),
+            "map_name": dict(Memo.map_name),
+            "locations": {id: record.toDict() for id, record in Memo.locationItems()},
+            **Memo.canonicalSnapshot()
+        }
+
+    @staticmethod
+    def unknownSnapshot(collection:type) -> dict:
+        # older builds read "unknown" and drop the keys they don't know, indexUnknown copes with either
+        unknown = {}
+        for name, agents in Memo.unknown.items():
+            for agent in agents:
+                unknown.setdefault(agent, []).append(name)
+        return {
+            "unknown": {agent: collection(names) for agent, names in unknown.items()},
+            "unknown_recorded": {name: dict(agents) for name, agents in Memo.unknown.items()},
         }
-        json_data = json.dumps(data, indent=4)
+
+    @staticmethod
+    def canonicalSnapshot() -> dict:
+        if not Config.getCanonicalize():
+            return {}
+        return {"canonical_names": dict(Memo.canonical_names), "canonical_version": CANONICAL_VERSION}
+
+    @staticmethod
+    def writeSnapshot(data:dict) -> bool:
         try:
-            with open('memo.json', 'w') as memo_file:
-                memo_file.write(json_data)
-                logging.info("Successfully saved Memo data to memo.json")
+            if "stored" in data:
+                Memo.writeBinary(data)
+            else:
+                json_data = json.dumps(data, indent=4)
+                with open('memo.json.tmp', 'w') as memo_file:
+                    memo_file.write(json_data)
+                    memo_file.flush()
+                    os.fsync(memo_file.fileno())
+                os.replace('memo.json.tmp', 'memo.json')
+            logging.info("Successfully saved Memo data to %s", Memo.snapshotLoc())
+            return True
         except:
-            logging.error("Could not write Memo data to memo.json")
\ No newline at end of file
+            logging.error("Could not write Memo data to %s", Memo.snapshotLoc())
+            return False
+
+    @staticmethod
+    def writeBinary(data:dict):
+        records, stored = data["locations"], data["stored"]
+        state = {key: data[key] for key in ("known_names", "known_osm_ids", "map_name", "unknown", "unknown_recorded", "canonical_names", "canonical_version") if key in data}
+        state_data = pickle.dumps(state, protocol=5)
+        new_ids = sorted(int(id) for id in records)
+        stored_count = len(stored) if stored is not None else 0
+        ids, offsets = array('q'), array('q', [0])
+        blob_length = 0
+        with open(f"{BINARY_LOC}.tmp", 'wb') as memo_file:
+            memo_file.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(state_data), 0, 0))
+            memo_file.write(state_data)
+            # merge the stored ids with the decoded and new ones, both sorted, so the ids stay ordered for bisect
+            i, j = 0, 0
+            while i < stored_count or j < len(new_ids):
+                if j == len(new_ids) or (i < stored_count and stored.ids[i] < new_ids[j]):
+                    id, raw = stored.ids[i], stored.raw(i)
+                    i += 1
+                else:
+                    id = new_ids[j]
+                    j += 1
+                    if i < stored_count and stored.ids[i] == id:
+                        i += 1
+                    record = records[f"{id}"]
+                    if record is None:
+                        continue
+                    raw = pickle.dumps(record.toDict(), protocol=5)
+                memo_file.write(raw)
+                blob_length += len(raw)
+                ids.append(id)
+                offsets.append(blob_length)
+            if sys.byteorder != "little":
+                ids.byteswap()
+                offsets.byteswap()
+            ids.tofile(memo_file)
+            offsets.tofile(memo_file)
+            memo_file.seek(0)
+            memo_file.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(state_data), blob_length, len(ids)))
+            memo_file.flush()
+            os.fsync(memo_file.fileno())
+        os.replace(f"{BINARY_LOC}.tmp", BINARY_LOC)
+
+    @staticmethod
+    def save():
+        if Memo.recorded is not None:
+            return
+        if Memo.journal_file is not None:
+            Memo.flushJournal()
+            if Memo.journal_entries >= Config.getMemoCompactEvery():
+                Memo.compact()
+            return
+        Memo.writeSnapshot(Memo.snapshot())
+
+    @staticmethod
+    def share():
+        # everything so far on disk, with no compaction half done, before shard workers load their copies
+        Memo.save()
+        if Memo.compaction is not None:
+            Memo.compaction.join()
+            Memo.compaction = None
+
+    @staticmethod
+    def release():
+        # nothing to do, memo.json is only locked by the process that owns it. See SQLiteMemo.release
+        pass
+
+    @staticmethod
+    def close():
+        if Memo.journal_file is None:
+            return
+        Memo.flushJournal()
+        if Memo.compaction is not None:
+            Memo.compaction.join()
+            Memo.compaction = None
+        Memo.journal_file.close()
+        Memo.journal_file = None
+
+    @staticmethod
+    def openJournal():
+        # replay whatever the last run journaled on top of memo.json before appending new mutations
+        Memo.journal_entries = Memo.replay(COMPACTING_JOURNAL_LOC) + Memo.replay(JOURNAL_LOC)
+        Memo.journal_buffer = []
+        Memo.journal_file = open(JOURNAL_LOC, 'a', encoding='utf-8')
+        logging.info("Memo journal opened with %s entries pending compaction", Memo.journal_entries)
+
+    @staticmethod
+    def journal(op:str, *args):
+        if Memo.recorded is not None:
+            Memo.recorded.append([op, *args])
+            return
+        if Memo.journal_file is None:
+            return
+        Memo.journal_buffer.append(json.dumps([op, *args]))
+        Memo.journal_entries += 1
+        if len(Memo.journal_buffer) >= Config.getMemoJournalSyncEvery():
+            Memo.flushJournal()
+
+    @staticmethod
+    def flushJournal():
+        if Memo.journal_file is None or len(Memo.journal_buffer) == 0:
+            return
+        Memo.journal_file.write("\n".join(Memo.journal_buffer) + "\n")
+        Memo.journal_file.flush()
+        os.fsync(Memo.journal_file.fileno())
+        logging.debug("Flushed %s entries to %s", len(Memo.journal_buffer), JOURNAL_LOC)
+        Memo.journal_buffer = []
+
+    @staticmethod
+    def replay(path:str) -> int:
+        if not os.path.exists(path):
+            return 0
+        count = 0
+        with open(path, 'r', encoding='utf-8') as journal_file:
+            for line in journal_file:
+                try:
+                    op, *args = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning("Stopped replaying %s at a truncated entry after %s entries", path, count)
+                    break
+                Memo.apply(op, args)
+                count += 1
+        logging.info("Replayed %s entries from %s", count, path)
+        return count
+
+    @staticmethod
+    def apply(op:str, args:list):
+        if op == "add":
+            id, location = args
+            if Memo.getLocation(id) is None:
+                Memo.addLocation(id, location)
+        elif op == "addKnown":
+            Memo.addKnown(*args)
+        elif op == "addUnknown":
+            Memo.addUnknown(*args)
+        elif op == "removeUnknown":
+            Memo.removeUnknown(*args)
+        elif op == "removeLocation":
+            Memo.removeLocation(*args)
+        else:
+            logging.warning("Unknown journal entry %s", op)
+
+    @staticmethod
+    def takeRecorded() -> list:
+        recorded = Memo.recorded
+        Memo.recorded = []
+        return recorded
+
+    @staticmethod
+    def applyShared(entries:list):
+        # entries merged from every shard, applied to a worker's copy without recording them again
+        recorded = Memo.recorded
+        Memo.recorded = None
+        try:
+            for op, *args in entries:
+                Memo.apply(op, args)
+        finally:
+            Memo.recorded = recorded
+
+    @staticmethod
+    def compact():
+        if Memo.compaction is not None and Memo.compaction.is_alive():
+            return
+        # new mutations go to a fresh journal while the snapshot is written in the background. The old journal is only removed once memo.json holds everything in it
+        Memo.journal_file.close()
+        if os.path.exists(COMPACTING_JOURNAL_LOC):
+            # an earlier compaction never finished, so keep its entries along with the current ones
+            with open(COMPACTING_JOURNAL_LOC, 'a', encoding='utf-8') as compacting_file, open(JOURNAL_LOC, 'r', encoding='utf-8') as journal_file:
+                shutil.copyfileobj(journal_file, compacting_file)
+            os.remove(JOURNAL_LOC)
+        else:
+            os.replace(JOURNAL_LOC, COMPACTING_JOURNAL_LOC)
+        Memo.journal_file = open(JOURNAL_LOC, 'a', encoding='utf-8')
+        Memo.journal_entries = 0
+        data = Memo.snapshot()
+        Memo.compaction = threading.Thread(target=Memo.writeCompaction, args=(data,), name="memo-compaction")
+        Memo.compaction.start()
+
+    @staticmethod
+    def writeCompaction(data:dict):
+        if Memo.writeSnapshot(data):
+            os.remove(COMPACTING_JOURNAL_LOC)
+            logging.info("Compacted memo journal into %s", Memo.snapshotLoc())
@@ -0,0 +1,213 @@
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import time
+
+from utils.config import Config
+
+# upper bounds in seconds, wide enough to separate memo probes from rate limited network calls
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds:float):
+        self.count += 1
+        self.sum += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+
+    def merge(self, other:"Histogram"):
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+
+    def snapshot(self) -> dict:
+        cumulative, buckets = 0, {}
+        for bound, count in zip(BUCKETS, self.counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else f"{bound}"] = cumulative
+        return {"count": self.count, "sum": self.sum, "mean": self.sum / self.count if self.count else 0.0, "buckets": buckets}
+
+
+class Metrics:
+    enabled = False
+    # a shard worker collects metrics for the main process to merge and export
+    exporting = True
+    counters:dict[tuple[str, str], int] = {}
+    stages:dict[str, Histogram] = {}
+    last_export = 0.0
+    profiler = None
+    profiled_rows = 0
+
+    @staticmethod
+    def load(shard:bool=False):
+        Metrics.enabled = Config.getMetricsLoc() is not None
+        Metrics.exporting = not shard
+        Metrics.counters = {}
+        Metrics.stages = {}
+        Metrics.last_export = time.monotonic()
+        Metrics.profiler = Metrics.loadProfiler() if Config.getProfileSampleRate() > 0 else None
+        Metrics.profiled_rows = 0
+
+    @staticmethod
+    def loadProfiler():
+        if Config.getProfiler() == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+                return Profiler()
+            except ImportError:
+                logging.error("pyinstrument is not installed, falling back to cProfile. Install it with pip install pyinstrument")
+        return cProfile.Profile()
+
+    @staticmethod
+    def increment(event:str, agent:str|None=None, amount:int=1):
+        if not Metrics.enabled:
+            return
+        key = (event, agent or "")
+        Metrics.counters[key] = Metrics.counters.get(key, 0) + amount
+
+    @staticmethod
+    def observe(stage:str, seconds:float):
+        if not Metrics.enabled:
+            return
+        if stage not in Metrics.stages:
+            Metrics.stages[stage] = Histogram()
+        Metrics.stages[stage].observe(seconds)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def timer(stage:str):
+        if not Metrics.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            Metrics.observe(stage, time.perf_counter() - start)
+
+    @staticmethod
+    def shouldProfile() -> bool:
+        return Metrics.profiler is not None and random.random() < Config.getProfileSampleRate()
+
+    @staticmethod
+    def profile(function, *args):
+        Metrics.profiled_rows += 1
+        if isinstance(Metrics.profiler, cProfile.Profile):
+            Metrics.profiler.enable()
+        else:
+            Metrics.profiler.start()
+        try:
+            return function(*args)
+        finally:
+            if isinstance(Metrics.profiler, cProfile.Profile):
+                Metrics.profiler.disable()
+            else:
+                Metrics.profiler.stop()
+
+    @staticmethod
+    def take() -> tuple[dict, dict]:
+        # what a shard worker has collected since it was last asked, see merge
+        taken = (Metrics.counters, Metrics.stages)
+        Metrics.counters = {}
+        Metrics.stages = {}
+        return taken
+
+    @staticmethod
+    def merge(counters:dict[tuple[str, str], int], stages:dict[str, Histogram]):
+        if not Metrics.enabled:
+            return
+        for key, count in counters.items():
+            Metrics.counters[key] = Metrics.counters.get(key, 0) + count
+        for stage, histogram in stages.items():
+            if stage not in Metrics.stages:
+                Metrics.stages[stage] = Histogram()
+            Metrics.stages[stage].merge(histogram)
+
+    @staticmethod
+    def hitRates() -> dict[str, float]:
+        rates = {}
+        agents = {agent for (event, agent) in Metrics.counters if event in ("memo_hit", "memo_miss")}
+        for agent in agents:
+            hits = Metrics.counters.get(("memo_hit", agent), 0)
+            misses = Metrics.counters.get(("memo_miss", agent), 0)
+            rates[agent] = hits / (hits + misses) if hits + misses else 0.0
+        return rates
+
+    @staticmethod
+    def snapshot() -> dict:
+        counters = {}
+        for (event, agent), count in Metrics.counters.items():
+            counters.setdefault(event, {})[agent or "all"] = count
+        return {
+            "timestamp": time.time(),
+            "counters": counters,
+            "memo_hit_rates": Metrics.hitRates(),
+            "stages": {stage: histogram.snapshot() for stage, histogram in Metrics.stages.items()},
+        }
+
+    @staticmethod
+    def prometheus() -> str:
+        lines = ["# TYPE survey_geocoder_events_total counter"]
+        for (event, agent), count in sorted(Metrics.counters.items()):
+            lines.append(f'survey_geocoder_events_total{{event="{event}",agent="{agent}"}} {count}')
+        lines.append("# TYPE survey_geocoder_memo_hit_rate gauge")
+        for agent, rate in sorted(Metrics.hitRates().items()):
+            lines.append(f'survey_geocoder_memo_hit_rate{{agent="{agent}"}} {rate}')
+        lines.append("# TYPE survey_geocoder_stage_seconds histogram")
+        for stage, histogram in sorted(Metrics.stages.items()):
+            for bound, count in histogram.snapshot()["buckets"].items():
+                lines.append(f'survey_geocoder_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'survey_geocoder_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'survey_geocoder_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def tick():
+        # called once per row, only writes when the export interval has passed
+        if Metrics.enabled and Metrics.exporting and time.monotonic() - Metrics.last_export >= Config.getMetricsInterval():
+            Metrics.export()
+
+    @staticmethod
+    def export():
+        if not Metrics.enabled or not Metrics.exporting:
+            return
+        Metrics.last_export = time.monotonic()
+        metrics_loc = Config.getMetricsLoc()
+        if metrics_loc.endswith(".prom"):
+            data = Metrics.prometheus()
+        else:
+            data = json.dumps(Metrics.snapshot(), indent=4)
+        try:
+            with open(f"{metrics_loc}.tmp", 'w') as metrics_file:
+                metrics_file.write(data)
+            os.replace(f"{metrics_loc}.tmp", metrics_loc)
+        except OSError:
+            logging.error(f"Could not write metrics to {metrics_loc}")
+
+    @staticmethod
+    def close():
+        Metrics.export()
+        if Metrics.profiler is None or Metrics.profiled_rows == 0:
+            return
+        if isinstance(Metrics.profiler, cProfile.Profile):
+            Metrics.profiler.dump_stats(Config.getProfileLoc())
+            pstats.Stats(Metrics.profiler).sort_stats("cumulative").print_stats(15)
+        else:
+            with open(Config.getProfileLoc(), 'w') as profile_file:
+                profile_file.write(Metrics.profiler.output_html())
+            print(Metrics.profiler.output_text())
+        message = f"Profiled {Metrics.profiled_rows} sampled rows into {Config.getProfileLoc()}"
+        logging.info(message)
+        print(message)
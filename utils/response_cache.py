@@ -0,0 +1,141 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+import zlib
+
+from utils.config import Config
+from utils.metrics import Metrics
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS responses (key BLOB PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, accessed INTEGER NOT NULL, stored INTEGER) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)",
+]
+# writes are committed in batches of this many, or when the cache is saved
+COMMIT_EVERY = 100
+# parameters of every geocode request, part of the cache key so a request made differently is never answered from the cache
+GEOCODE_PARAMS = {"exactly_one": True, "addressdetails": True}
+
+
+class ResponseCache:
+    # raw geocoder responses, compressed and keyed by a hash of the endpoint, query and request parameters.
+    # Sits underneath the memo so a rerun with a new memo format or a fixed bug is answered locally instead of re-geocoded
+    enabled = False
+    connection:sqlite3.Connection|None = None
+    size = 0
+    pending = 0
+    commit_every = COMMIT_EVERY
+    hits = 0
+    misses = 0
+
+    @staticmethod
+    def load(cache_loc:str|None=None, shared:bool=False):
+        # a process sharing the cache with others commits every write so it never holds the write lock while it waits on the network
+        cache_loc = cache_loc or Config.getResponseCacheLoc()
+        if ResponseCache.connection is not None or cache_loc is None:
+            return
+        connection = sqlite3.connect(cache_loc, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            connection.execute(statement)
+        if "stored" not in [column[1] for column in connection.execute("PRAGMA table_info(responses)")]:
+            # caches written before misses expired, their rows count as stored when they were last read
+            connection.execute("ALTER TABLE responses ADD COLUMN stored INTEGER")
+        connection.commit()
+        ResponseCache.connection = connection
+        ResponseCache.size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        ResponseCache.pending = 0
+        ResponseCache.commit_every = 1 if shared else COMMIT_EVERY
+        ResponseCache.hits = 0
+        ResponseCache.misses = 0
+        ResponseCache.enabled = True
+        logging.info("Response cache %s opened with %s bytes of responses", cache_loc, ResponseCache.size)
+
+    @staticmethod
+    def key(endpoint:str, query:str, params:dict) -> bytes:
+        return hashlib.sha256(json.dumps([endpoint, query, params], sort_keys=True).encode()).digest()
+
+    @staticmethod
+    def get(endpoint:str, query:str, params:dict) -> tuple[bool, dict|None]:
+        # (True, response) when the request has been answered before, a response of None is a cached miss.
+        # A miss expires after unknown_ttl_days like the memo's unknowns do, so an unknown that is due to be tried again reaches the server
+        if not ResponseCache.enabled:
+            return False, None
+        key = ResponseCache.key(endpoint, query, params)
+        row = ResponseCache.connection.execute("SELECT data, COALESCE(stored, accessed) FROM responses WHERE key = ?", (key,)).fetchone()
+        response = None if row is None else json.loads(zlib.decompress(row[0]))
+        if row is None or (response is None and row[1] < ResponseCache.missCutoff()):
+            ResponseCache.misses += 1
+            Metrics.increment("response_cache_miss")
+            return False, None
+        ResponseCache.hits += 1
+        Metrics.increment("response_cache_hit")
+        ResponseCache.write("UPDATE responses SET accessed = ? WHERE key = ?", (time.time_ns(), key))
+        return True, response
+
+    @staticmethod
+    def missCutoff() -> float:
+        # cached misses stored before this, in nanoseconds, have expired. See Memo.unknownCutoff
+        ttl = Config.getUnknownTTLDays()
+        if ttl is None:
+            return float("-inf")
+        return time.time_ns() - ttl * 86400 * 10**9
+
+    @staticmethod
+    def put(endpoint:str, query:str, params:dict, response:dict|None):
+        if not ResponseCache.enabled:
+            return
+        key = ResponseCache.key(endpoint, query, params)
+        data = zlib.compress(json.dumps(response).encode())
+        previous = ResponseCache.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time_ns()
+        ResponseCache.write("INSERT OR REPLACE INTO responses (key, data, size, accessed, stored) VALUES (?, ?, ?, ?, ?)", (key, data, len(data), now, now))
+        ResponseCache.size += len(data) - (previous[0] if previous is not None else 0)
+        if ResponseCache.size > Config.getResponseCacheSize() * 2**20:
+            ResponseCache.evict()
+
+    @staticmethod
+    def evict():
+        # drop the least recently used responses until the cache is back under 90% of its limit, so eviction doesn't run on every put
+        target = Config.getResponseCacheSize() * 2**20 * 0.9
+        evicted = 0
+        while ResponseCache.size > target:
+            rows = ResponseCache.connection.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 1000").fetchall()
+            if len(rows) == 0:
+                ResponseCache.size = 0
+                break
+            for key, size in rows:
+                ResponseCache.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                ResponseCache.size -= size
+                evicted += 1
+                if ResponseCache.size <= target:
+                    break
+        ResponseCache.save()
+        Metrics.increment("response_cache_evicted", amount=evicted)
+        logging.info("Evicted %s responses from the response cache", evicted)
+
+    @staticmethod
+    def write(sql:str, params:tuple):
+        ResponseCache.connection.execute(sql, params)
+        ResponseCache.pending += 1
+        if ResponseCache.pending >= ResponseCache.commit_every:
+            ResponseCache.save()
+
+    @staticmethod
+    def save():
+        if ResponseCache.connection is None:
+            return
+        ResponseCache.connection.commit()
+        ResponseCache.pending = 0
+
+    @staticmethod
+    def close():
+        if ResponseCache.connection is None:
+            return
+        ResponseCache.save()
+        ResponseCache.connection.close()
+        ResponseCache.connection = None
+        ResponseCache.enabled = False
+        logging.info("Response cache served %s/%s geocode requests", ResponseCache.hits, ResponseCache.hits + ResponseCache.misses)
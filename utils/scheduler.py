@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+
+from geopy.exc import GeocoderAuthenticationFailure, GeocoderInsufficientPrivileges, GeocoderQueryError, GeocoderRateLimited, GeocoderServiceError
+
+from utils.config import Config
+from utils.metrics import Metrics
+
+# configuration problems that no amount of retrying fixes
+PERMANENT_ERRORS = (GeocoderAuthenticationFailure, GeocoderInsufficientPrivileges)
+
+
+class GeocodeUnavailable(Exception):
+    # the geocoder could not be reached or kept refusing requests, which says nothing about whether the location exists
+    def __init__(self, endpoint:str, error:Exception) -> None:
+        super().__init__(f"{endpoint} failed after {Config.getGeocodeMaxRetries()} retries: {error!r}")
+        self.endpoint = endpoint
+        self.error = error
+
+
+class GeocodeRejected(Exception):
+    # the server can't parse the query, which is as good as not finding it
+    def __init__(self, endpoint:str, error:Exception) -> None:
+        super().__init__(f"{endpoint} rejected the query: {error!r}")
+        self.endpoint = endpoint
+        self.error = error
+
+
+class TokenBucket:
+    # requests are handed a start time instead of a token, so threads and coroutines can share one bucket and wait however suits them
+    def __init__(self, rate:float, burst:int) -> None:
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.next_start = 0.0
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        # seconds the caller has to wait before sending its request
+        with self.lock:
+            now = time.monotonic()
+            interval = 1 / self.rate if self.rate > 0 else 0.0
+            start = max(now, self.next_start - (self.burst - 1) * interval, self.paused_until)
+            self.next_start = max(self.next_start, start) + interval
+            return start - now
+
+    def pause(self, seconds:float):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.next_start = max(self.next_start, self.paused_until)
+
+    def throttled(self):
+        # the server pushed back, halve the rate until it stops complaining
+        with self.lock:
+            if self.rate > 0:
+                self.rate = max(self.max_rate / 64, self.rate / 2)
+
+    def succeeded(self):
+        # win back the configured rate a little at a time
+        with self.lock:
+            if 0 < self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class Scheduler:
+    buckets:dict[str, TokenBucket] = {}
+
+    @staticmethod
+    def bucket(endpoint:str) -> TokenBucket:
+        if endpoint not in Scheduler.buckets:
+            rate = Config.getGeocodeRateLimits().get(endpoint)
+            if rate is None:
+                rate = 1 / Config.getGeocodeMinDelay() if Config.getGeocodeMinDelay() > 0 else 0
+            Scheduler.buckets[endpoint] = TokenBucket(rate, Config.getGeocodeBurst())
+            logging.info("Geocoding %s at up to %s requests per second", endpoint, rate if rate > 0 else "unlimited")
+        return Scheduler.buckets[endpoint]
+
+    @staticmethod
+    def backoff(attempt:int, error:Exception) -> float:
+        if isinstance(error, GeocoderRateLimited) and error.retry_after is not None:
+            return error.retry_after
+        # exponential backoff with full jitter so clients that failed together don't retry together
+        return random.uniform(0, min(Config.getGeocodeBackoffMax(), Config.getGeocodeBackoff() * 2 ** attempt))
+
+    @staticmethod
+    def failed(endpoint:str, bucket:TokenBucket, attempt:int, error:Exception) -> float:
+        if isinstance(error, PERMANENT_ERRORS):
+            raise error
+        if attempt == Config.getGeocodeMaxRetries():
+            Metrics.increment("geocode_failure")
+            raise GeocodeUnavailable(endpoint, error) from error
+        if isinstance(error, GeocoderRateLimited):
+            Metrics.increment("geocode_throttled")
+            bucket.throttled()
+        Metrics.increment("geocode_retry")
+        wait = Scheduler.backoff(attempt, error)
+        # every request to the endpoint waits, not just this one
+        bucket.pause(wait)
+        logging.warning("Request to %s failed (%r), retrying in %.1fs", endpoint, error, wait)
+        return wait
+
+    @staticmethod
+    def call(endpoint:str, function, *args, **kwargs):
+        bucket = Scheduler.bucket(endpoint)
+        for attempt in range(Config.getGeocodeMaxRetries() + 1):
+            time.sleep(bucket.reserve())
+            try:
+                result = function(*args, **kwargs)
+            except GeocoderQueryError as error:
+                raise GeocodeRejected(endpoint, error) from error
+            except GeocoderServiceError as error:
+                Scheduler.failed(endpoint, bucket, attempt, error)
+                continue
+            bucket.succeeded()
+            return result
+
+    @staticmethod
+    async def callAsync(endpoint:str, function, *args, **kwargs):
+        bucket = Scheduler.bucket(endpoint)
+        for attempt in range(Config.getGeocodeMaxRetries() + 1):
+            await asyncio.sleep(bucket.reserve())
+            try:
+                result = await function(*args, **kwargs)
+            except GeocoderQueryError as error:
+                raise GeocodeRejected(endpoint, error) from error
+            except GeocoderServiceError as error:
+                Scheduler.failed(endpoint, bucket, attempt, error)
+                continue
+            bucket.succeeded()
+            return result
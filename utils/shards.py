@@ -0,0 +1,42 @@
+import logging
+import zlib
+
+
+def shardOf(key, round:int, shards:int) -> int:
+    # a stable hash so a location lands on the same agent in every run, moving on to the next agent each round
+    if not isinstance(key, str):
+        return round % shards
+    return (zlib.crc32(key.encode()) + round) % shards
+
+
+def mergeDeltas(memo, deltas:list[list]) -> list:
+    # folds the entries each shard recorded into the main memo, in shard order so the result doesn't depend on which worker finished first.
+    # Names the memo already maps keep their location, a name new to several shards goes to the highest confidence (the earliest shard on a tie),
+    # and a name some shard found is never recorded as unknown for the others. Returns the entries applied, for the workers to catch up on
+    locations, known, unknown, recovered, removed = {}, {}, {}, {}, {}
+    for delta in deltas:
+        for op, *args in delta:
+            if op == "add":
+                locations.setdefault(f"{args[0]}", args)
+            elif op == "addKnown":
+                name, id, confidence = args
+                if name not in known or confidence > known[name][2]:
+                    known[name] = args
+            elif op == "addUnknown":
+                unknown.setdefault((args[0], args[1]), args)
+            elif op == "removeUnknown":
+                recovered.setdefault(args[0], args)
+            elif op == "removeLocation":
+                removed.setdefault(f"{args[0]}", args)
+            else:
+                logging.warning("Unknown shard entry %s", op)
+
+    merged = [["removeLocation", *args] for args in removed.values()]
+    merged += [["add", *args] for args in locations.values()]
+    merged += [["addKnown", *args] for name, args in known.items() if memo.getMapID(name) is None]
+    merged += [["removeUnknown", *args] for args in recovered.values()]
+    merged += [["addUnknown", *args] for (agent, name), args in unknown.items() if name not in known and memo.getMapID(name) is None]
+    for op, *args in merged:
+        memo.apply(op, args)
+    logging.info("Merged %s memo entries recorded by %s shards", len(merged), len(deltas))
+    return merged
@@ -0,0 +1,350 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from typing import Iterable
+
+from utils.canonical import CANONICAL_VERSION, canonicalize
+from utils.config import Config
+from utils.fuzzy import FuzzyMatcher
+from utils.memo import Memo, JOURNAL_LOC, COMPACTING_JOURNAL_LOC
+from utils.metrics import Metrics
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS names (name TEXT PRIMARY KEY) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS known_osm_ids (osm_id INTEGER PRIMARY KEY)",
+    "CREATE TABLE IF NOT EXISTS name_map (name TEXT PRIMARY KEY, osm_id INTEGER NOT NULL, confidence REAL NOT NULL) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS locations (osm_id INTEGER PRIMARY KEY, data TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS unknown (name TEXT NOT NULL, agent TEXT NOT NULL, recorded INTEGER NOT NULL DEFAULT 0, reason TEXT NOT NULL DEFAULT 'not_found', PRIMARY KEY (name, agent)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS canonical_names (canonical TEXT PRIMARY KEY, name TEXT NOT NULL) WITHOUT ROWID",
+]
+# created once the tables have been brought up to date
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS unknown_recorded ON unknown (recorded)",
+]
+# writes are committed in batches of this many, or once the oldest uncommitted write is this many seconds old, so other jobs sharing the database
+# are never locked out for long
+COMMIT_EVERY = 100
+COMMIT_SECONDS = 1.0
+
+
+class SQLiteMemo:
+    connection:sqlite3.Connection|None = None
+    pending = 0
+    uncommitted = 0
+    first_uncommitted = 0.0
+    unknown_count = 0
+    # mutations of a shard worker, in the same entries Memo journals, for the main process to merge
+    recorded:list|None = None
+
+    @staticmethod
+    def load(db_loc:str|None=None, shard:bool=False):
+        if SQLiteMemo.connection is not None:
+            return
+        db_loc = db_loc or Config.getMemoDBLoc()
+        if shard:
+            # a shard worker changes a private in-memory copy, so no worker ever holds the database's write lock while it waits on the network
+            source = sqlite3.connect(f"file:{db_loc}?mode=ro", uri=True, timeout=30)
+            SQLiteMemo.connection = sqlite3.connect(":memory:")
+            source.backup(SQLiteMemo.connection)
+            source.close()
+            SQLiteMemo.recorded = []
+            logging.info("memo database %s copied for a shard worker", db_loc)
+        else:
+            SQLiteMemo.connection = SQLiteMemo.connect(db_loc)
+            logging.info("memo database %s successfully opened", db_loc)
+            if Config.getCanonicalize():
+                SQLiteMemo.indexCanonical()
+        SQLiteMemo.unknown_count = SQLiteMemo.connection.execute("SELECT COUNT(*) FROM unknown").fetchone()[0]
+        SQLiteMemo.evictUnknown()
+
+    @staticmethod
+    def indexCanonical():
+        # the database's user_version records which canonical rules its index was built with
+        if SQLiteMemo.connection.execute("PRAGMA user_version").fetchone()[0] == CANONICAL_VERSION:
+            return
+        with SQLiteMemo.connection:
+            SQLiteMemo.connection.execute("DELETE FROM canonical_names")
+            SQLiteMemo.connection.executemany("INSERT OR IGNORE INTO canonical_names (canonical, name) VALUES (?, ?)", ((canonicalize(name), name) for name in SQLiteMemo.knownNames()))
+            SQLiteMemo.connection.execute(f"PRAGMA user_version = {CANONICAL_VERSION}")
+        logging.info("Rebuilt the canonical name index of the memo database")
+
+    @staticmethod
+    def connect(db_loc:str) -> sqlite3.Connection:
+        connection = sqlite3.connect(db_loc, timeout=30)
+        # WAL lets any number of processes read the cache while one of them is writing to it
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            connection.execute(statement)
+        if "recorded" not in {row[1] for row in connection.execute("PRAGMA table_info(unknown)")}:
+            # databases from before unknowns were timestamped, their entries count as recorded now
+            connection.execute("ALTER TABLE unknown ADD COLUMN recorded INTEGER NOT NULL DEFAULT 0")
+            connection.execute("ALTER TABLE unknown ADD COLUMN reason TEXT NOT NULL DEFAULT 'not_found'")
+            connection.execute("UPDATE unknown SET recorded = ?", (int(time.time()),))
+        for statement in INDEXES:
+            connection.execute(statement)
+        connection.commit()
+        return connection
+
+    @staticmethod
+    def write(sql:str, params:tuple) -> int:
+        # an open transaction holds the database's write lock, so it is kept small and short
+        cursor = SQLiteMemo.connection.execute(sql, params)
+        SQLiteMemo.pending += 1
+        if SQLiteMemo.uncommitted == 0:
+            SQLiteMemo.first_uncommitted = time.monotonic()
+        SQLiteMemo.uncommitted += 1
+        if SQLiteMemo.uncommitted >= COMMIT_EVERY or time.monotonic() - SQLiteMemo.first_uncommitted >= COMMIT_SECONDS:
+            SQLiteMemo.commit()
+        return cursor.rowcount
+
+    @staticmethod
+    def commit():
+        if SQLiteMemo.connection is None or SQLiteMemo.uncommitted == 0:
+            return
+        SQLiteMemo.connection.commit()
+        SQLiteMemo.uncommitted = 0
+
+    @staticmethod
+    def release():
+        # called before every geocode request, so the write lock is never held while waiting on the network
+        SQLiteMemo.commit()
+
+    @staticmethod
+    def journal(op:str, *args):
+        if SQLiteMemo.recorded is not None:
+            SQLiteMemo.recorded.append([op, *args])
+
+    @staticmethod
+    def takeRecorded() -> list:
+        recorded = SQLiteMemo.recorded
+        SQLiteMemo.recorded = []
+        return recorded
+
+    @staticmethod
+    def apply(op:str, args:list):
+        if op == "add":
+            id, location = args
+            if SQLiteMemo.getLocation(id) is None:
+                SQLiteMemo.addLocation(id, location)
+        elif op == "addKnown":
+            SQLiteMemo.addKnown(*args)
+        elif op == "addUnknown":
+            SQLiteMemo.addUnknown(*args)
+        elif op == "removeUnknown":
+            SQLiteMemo.removeUnknown(*args)
+        elif op == "removeLocation":
+            SQLiteMemo.removeLocation(*args)
+        else:
+            logging.warning("Unknown memo entry %s", op)
+
+    @staticmethod
+    def applyShared(entries:list):
+        recorded = SQLiteMemo.recorded
+        SQLiteMemo.recorded = None
+        try:
+            for op, *args in entries:
+                SQLiteMemo.apply(op, args)
+        finally:
+            SQLiteMemo.recorded = recorded
+
+    @staticmethod
+    def isUnknown(name:str, agent:str=None):
+        cutoff = Memo.unknownCutoff()
+        if agent is not None:
+            row = SQLiteMemo.connection.execute("SELECT 1 FROM unknown WHERE name = ? AND agent = ? AND recorded >= ?", (name, agent, cutoff)).fetchone()
+        else:
+            row = SQLiteMemo.connection.execute("SELECT 1 FROM unknown WHERE name = ? AND recorded >= ? LIMIT 1", (name, cutoff)).fetchone()
+        return row is not None
+
+    @staticmethod
+    def expiredUnknowns() -> list[str]:
+        return [row[0] for row in SQLiteMemo.connection.execute("SELECT DISTINCT name FROM unknown WHERE recorded < ?", (Memo.unknownCutoff(),))]
+
+    @staticmethod
+    def removeUnknown(name:str):
+        removed = SQLiteMemo.write("DELETE FROM unknown WHERE name = ?", (name,))
+        if removed:
+            SQLiteMemo.unknown_count -= removed
+            SQLiteMemo.journal("removeUnknown", name)
+
+    @staticmethod
+    def knownNames() -> Iterable[str]:
+        return (row[0] for row in SQLiteMemo.connection.execute("SELECT name FROM names"))
+
+    @staticmethod
+    def getMapID(name:str) -> int | None:
+        row = SQLiteMemo.connection.execute("SELECT osm_id FROM name_map WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    @staticmethod
+    def getLocation(id:int) -> dict | None:
+        row = SQLiteMemo.connection.execute("SELECT data FROM locations WHERE osm_id = ?", (id,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    @staticmethod
+    def search(name:str, id:int|None=None) -> dict | None:
+        logging.debug("Starting Memo search for \"%s\"", name)
+
+        row = SQLiteMemo.connection.execute("SELECT l.data FROM name_map m JOIN locations l ON l.osm_id = m.osm_id WHERE m.name = ?", (name,)).fetchone()
+        if row is not None:
+            location = json.loads(row[0])
+            logging.debug("Location found for \"%s\": %s", name, location)
+            return location
+        if id is None:
+            logging.debug("Could not find location from \"%s\" in Memo", name)
+            return None
+
+        if SQLiteMemo.connection.execute("SELECT 1 FROM known_osm_ids WHERE osm_id = ?", (id,)).fetchone() is not None:
+            logging.debug("%s is a known OSM ID", id)
+            location = SQLiteMemo.getLocation(id)
+            if location is not None:
+                logging.debug("Location found for %s: \"%s\"", id, location)
+                return location
+            else:
+                logging.debug("No valid location was found in Memo for %s. Removing %s from Memo's known locations", id, id)
+                SQLiteMemo.removeLocation(id)
+                return None
+        logging.debug("Could not find location by \"%s\" or %s in Memo", name, id)
+        return None
+
+    @staticmethod
+    def searchCanonical(name:str) -> tuple[str, dict] | None:
+        row = SQLiteMemo.connection.execute("SELECT name FROM canonical_names WHERE canonical = ?", (canonicalize(name),)).fetchone()
+        if row is None or row[0] == name:
+            return None
+        location = SQLiteMemo.search(row[0])
+        if location is None:
+            return None
+        return row[0], location
+
+    @staticmethod
+    def add(name:str, id:int, loc:dict, confidence):
+        if name is None or id is None or loc is None:
+            return None
+        name = name.lower()
+        SQLiteMemo.addKnown(name, id, confidence)
+
+        if "display_name" in loc:
+            SQLiteMemo.addKnown(loc["display_name"].lower(), id, confidence)
+
+        location = SQLiteMemo.getLocation(id)
+        if location is not None:
+            logging.debug("Location with OSM ID: %s already exists", id)
+            return location
+
+        location = Memo.memoFormat(loc)
+        SQLiteMemo.addLocation(id, location)
+        logging.debug("New Location (%s) added to Memo with OSM ID: %s - %s", name, id, location)
+        return location
+
+    @staticmethod
+    def addLocation(id:int, location:dict):
+        if SQLiteMemo.write("INSERT OR IGNORE INTO locations (osm_id, data) VALUES (?, ?)", (id, json.dumps(location))):
+            SQLiteMemo.journal("add", id, location)
+
+    @staticmethod
+    def addKnown(name:str, id:int, confidence:float=0.1):
+        name = name.lower()
+        if SQLiteMemo.write("INSERT OR IGNORE INTO names (name) VALUES (?)", (name,)):
+            logging.debug("\"%s\" added as a known location name", name)
+            # a name that resolves is no longer unknown to anyone
+            SQLiteMemo.removeUnknown(name)
+            if FuzzyMatcher.enabled:
+                FuzzyMatcher.add(name)
+            if Config.getCanonicalize():
+                SQLiteMemo.write("INSERT OR IGNORE INTO canonical_names (canonical, name) VALUES (?, ?)", (canonicalize(name), name))
+        if SQLiteMemo.write("INSERT OR IGNORE INTO known_osm_ids (osm_id) VALUES (?)", (id,)):
+            logging.debug("%s added as a known location id", id)
+        if SQLiteMemo.write("INSERT OR IGNORE INTO name_map (name, osm_id, confidence) VALUES (?, ?, ?)", (name, id, confidence)):
+            logging.debug("Added map for \"%s\" to %s with confidence: %s", name, id, confidence)
+            SQLiteMemo.journal("addKnown", name, id, confidence)
+
+    @staticmethod
+    def addUnknown(agent:str, location:str, reason:str="not_found", recorded:int|None=None):
+        location = location.lower()
+        row = SQLiteMemo.connection.execute("SELECT recorded FROM unknown WHERE name = ? AND agent = ?", (location, agent)).fetchone()
+        if row is not None and row[0] >= Memo.unknownCutoff():
+            return
+        recorded = int(time.time()) if recorded is None else recorded
+        SQLiteMemo.write("INSERT OR REPLACE INTO unknown (name, agent, recorded, reason) VALUES (?, ?, ?, ?)", (location, agent, recorded, reason))
+        SQLiteMemo.unknown_count += row is None
+        logging.debug("\"%s\" added as an unknown location name for %s (%s)", location, agent, reason)
+        SQLiteMemo.journal("addUnknown", agent, location, reason, recorded)
+        SQLiteMemo.evictUnknown()
+
+    @staticmethod
+    def evictUnknown():
+        limit = Config.getUnknownMaxEntries()
+        if limit is None or SQLiteMemo.unknown_count <= limit:
+            return
+        evicted = SQLiteMemo.write("DELETE FROM unknown WHERE (name, agent) IN (SELECT name, agent FROM unknown ORDER BY recorded LIMIT ?)", (SQLiteMemo.unknown_count - limit,))
+        SQLiteMemo.unknown_count -= evicted
+        Metrics.increment("unknown_evicted", amount=evicted)
+        logging.debug("Evicted %s unknown location names", evicted)
+
+    @staticmethod
+    def removeLocation(id:int):
+        SQLiteMemo.write("DELETE FROM known_osm_ids WHERE osm_id = ?", (id,))
+        SQLiteMemo.write("DELETE FROM locations WHERE osm_id = ?", (id,))
+        SQLiteMemo.journal("removeLocation", id)
+
+    @staticmethod
+    def save():
+        if SQLiteMemo.connection is None:
+            return
+        SQLiteMemo.connection.commit()
+        SQLiteMemo.uncommitted = 0
+        logging.info("Committed %s Memo writes to the memo database", SQLiteMemo.pending)
+        SQLiteMemo.pending = 0
+
+    @staticmethod
+    def share():
+        SQLiteMemo.save()
+
+    @staticmethod
+    def close():
+        if SQLiteMemo.connection is None:
+            return
+        SQLiteMemo.save()
+        SQLiteMemo.connection.close()
+        SQLiteMemo.connection = None
+
+    @staticmethod
+    def migrate(json_loc:str='memo.json', db_loc:str='memo.db'):
+        with open(json_loc, 'r') as memo_file:
+            Memo.index(json.load(memo_file))
+        # fold in anything a journaled run had not yet compacted into memo.json
+        Memo.replay(COMPACTING_JOURNAL_LOC)
+        Memo.replay(JOURNAL_LOC)
+
+        connection = SQLiteMemo.connect(db_loc)
+        with connection:
+            connection.executemany("INSERT OR IGNORE INTO names (name) VALUES (?)", ((name,) for name in Memo.known_names))
+            connection.executemany("INSERT OR IGNORE INTO known_osm_ids (osm_id) VALUES (?)", ((id,) for id in Memo.known_osm_ids))
+            connection.executemany("INSERT OR IGNORE INTO name_map (name, osm_id, confidence) VALUES (?, ?, ?)", ((name, map["id"], map["confidence"]) for name, map in Memo.map_name.items()))
+            # locationItems skips the locations a replayed journal removed
+            locations = [(int(id), json.dumps(location.toDict())) for id, location in Memo.locationItems()]
+            connection.executemany("INSERT OR IGNORE INTO locations (osm_id, data) VALUES (?, ?)", locations)
+            connection.executemany("INSERT OR IGNORE INTO unknown (name, agent, recorded, reason) VALUES (?, ?, ?, ?)", ((name, agent, recorded, reason) for name, agents in Memo.unknown.items() for agent, (recorded, reason) in agents.items()))
+        connection.close()
+        message = f"Migrated {len(Memo.known_names)} names and {len(locations)} locations from {json_loc} to {db_loc}"
+        logging.info(message)
+        print(message)
+
+
+if __name__ == "__main__":
+    # python -m utils.sqlite_memo [memo.json] [memo.db]
+    args = sys.argv[1:]
+    json_loc = args[0] if len(args) > 0 else 'memo.json'
+    db_loc = args[1] if len(args) > 1 else 'memo.db'
+    if not os.path.exists(json_loc):
+        sys.exit(f"Could not find {json_loc}")
+    SQLiteMemo.migrate(json_loc, db_loc)